@@ -0,0 +1,71 @@
+import os
+
+import cv2
+import numpy as np
+
+# Skip frames that show no change from the last recorded one (variable frame
+# rate). Opt-in: the recording's MP4 index is then rewritten after capture
+REC_VFR = os.getenv("REC_VFR", "0").lower() in ("1", "true", "yes")
+# A grid cell has changed when its mean level moved by more than this (0-255);
+# lower catches smaller changes (cursor blink), higher ignores noise
+REC_ACTIVITY_THRESHOLD = float(os.getenv("REC_ACTIVITY_THRESHOLD", "6"))
+# Each grid cell averages this many pixels in both directions
+REC_ACTIVITY_CELL = int(os.getenv("REC_ACTIVITY_CELL", "8"))
+# After this long without a change the screen counts as idle ...
+REC_IDLE_SECONDS = float(os.getenv("REC_IDLE_SECONDS", "1.0"))
+# ... and is only sampled at this rate until something changes again
+REC_IDLE_FPS = float(os.getenv("REC_IDLE_FPS", "5"))
+
+
+class ActivityDetector:
+    """
+    Decides whether a captured frame differs from the last one that was kept.
+
+    Frames are reduced to a small grid of cell means (INTER_AREA averaging, so
+    a change anywhere inside a cell still moves its mean) and compared with
+    the grid of the last kept frame in one vectorized pass. Only changed
+    frames need encoding; the rest are skipped and the previous frame simply
+    stays on screen longer. Once nothing has changed for idle_seconds the
+    detector reports idle, and the caller samples less often.
+    """
+
+    def __init__(self, width, height, fps, threshold=REC_ACTIVITY_THRESHOLD, cell=REC_ACTIVITY_CELL,
+                 idle_seconds=REC_IDLE_SECONDS, idle_fps=REC_IDLE_FPS):
+        self.grid_size = (max(1, width // cell), max(1, height // cell))
+        self.threshold = threshold
+        self.reference = np.zeros((self.grid_size[1], self.grid_size[0], 3), dtype=np.int16)
+        self.grid = np.empty((self.grid_size[1], self.grid_size[0], 3), dtype=np.uint8)
+        self.have_reference = False
+        self.idle_after = max(1, round(idle_seconds * fps))
+        # While idle, only every idle_stride-th tick is captured
+        self.idle_stride = max(1, round(fps / idle_fps)) if idle_fps > 0 else 1
+        self.unchanged_run = 0
+        self.skipped_frames = 0
+
+    @property
+    def idle(self):
+        return self.unchanged_run >= self.idle_after
+
+    def should_sample(self, tick):
+        """Whether the frame at this pacer tick is worth grabbing at all."""
+        return not self.idle or tick % self.idle_stride == 0
+
+    def changed(self, frame):
+        """True if `frame` (BGR) differs from the last kept frame; it then becomes the reference."""
+        cv2.resize(frame, self.grid_size, dst=self.grid, interpolation=cv2.INTER_AREA)
+        if self.have_reference:
+            difference = np.abs(self.grid.astype(np.int16) - self.reference)
+            if not (difference > self.threshold).any():
+                self.unchanged_run += 1
+                self.skipped_frames += 1
+                return False
+        self.reference[...] = self.grid
+        self.have_reference = True
+        self.unchanged_run = 0
+        return True
+
+    def stats(self):
+        return {
+            'skipped_frames': self.skipped_frames,
+            'idle': self.idle,
+        }
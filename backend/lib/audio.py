@@ -1,17 +1,115 @@
+import json
+import os
 from PyQt5.QtCore import QThread, QDateTime, pyqtSignal
 import sounddevice as sd
 import soundfile as sf
 import numpy as np
 
+from lib.replay import AudioHistory
+from lib.silence import AUDIO_SILENCE_TRIM, SilenceTrimmer
+
+# Seconds of audio the callback may run ahead of the writer before blocks are dropped
+AUDIO_BUFFER_SECONDS = float(os.getenv("AUDIO_BUFFER_SECONDS", "2"))
+# How often the writer drains the ring and flushes the file; bounds what a crash can lose
+AUDIO_FLUSH_MS = int(os.getenv("AUDIO_FLUSH_MS", "100"))
+# Container written while recording: 'wav', 'flac' (lossless) or 'opus' (Ogg Opus)
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "wav").lower()
+# Target Opus bitrate in bits/s for the whole stream
+AUDIO_OPUS_BITRATE = int(os.getenv("AUDIO_OPUS_BITRATE", "96000"))
+
+# codec -> (soundfile format, subtype, file extension)
+AUDIO_CODECS = {
+    'wav': ('WAV', 'PCM_16', 'wav'),
+    'flac': ('FLAC', 'PCM_16', 'flac'),
+    'opus': ('OGG', 'OPUS', 'ogg'),
+}
+# libopus (through libsndfile) only accepts 8/12/16/24/48 kHz
+OPUS_SAMPLERATE = 48000
+# libsndfile maps compression_level 0..1 linearly onto this per-channel bitrate range
+OPUS_MAX_BITRATE_PER_CHANNEL = 256000
+OPUS_MIN_BITRATE_PER_CHANNEL = 6000
+
+# libsndfile command that rewrites the header after every write (not exported by soundfile)
+SFC_SET_UPDATE_HEADER_AUTO = 0x1061
+
+
+def opus_compression_level(bitrate, channels):
+    """Translate a target bitrate into the compression_level libsndfile expects for Opus."""
+    high = OPUS_MAX_BITRATE_PER_CHANNEL * channels
+    low = OPUS_MIN_BITRATE_PER_CHANNEL * channels
+    bitrate = min(max(bitrate, low), high)
+    return (high - bitrate) / (high - low)
+
+
+class AudioRing:
+    """
+    Single-producer/single-consumer ring of audio frames.
+
+    The PortAudio callback is the only writer and the recorder thread the only
+    reader. Each side advances just its own counter, and a counter is only
+    moved after the samples it covers have been copied, so no lock is needed
+    and the callback never blocks. Storage is allocated once; if the reader
+    falls a whole buffer behind, incoming blocks are dropped and counted.
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float32):
+        self.buffer = np.zeros((capacity, channels), dtype=dtype)
+        self.capacity = capacity
+        self.write_index = 0  # total frames ever written (producer-owned)
+        self.read_index = 0   # total frames ever read (consumer-owned)
+        self.dropped_frames = 0
+
+    def write(self, block):
+        """Copy a (frames, channels) block in; returns False if it had to be dropped."""
+        frames = len(block)
+        if frames > self.capacity - (self.write_index - self.read_index):
+            self.dropped_frames += frames
+            return False
+        start = self.write_index % self.capacity
+        first = min(frames, self.capacity - start)
+        self.buffer[start:start + first] = block[:first]
+        self.buffer[:frames - first] = block[first:]
+        self.write_index += frames
+        return True
+
+    def drain(self, sink):
+        """Pass every available frame to sink() as at most two views; returns frames drained."""
+        available = self.write_index - self.read_index
+        if not available:
+            return 0
+        start = self.read_index % self.capacity
+        first = min(available, self.capacity - start)
+        sink(self.buffer[start:start + first])
+        if available > first:
+            sink(self.buffer[:available - first])
+        self.read_index += available
+        return available
+
+
 class AudioRecorderThread(QThread):
     started = pyqtSignal()  # Signal for when recording starts
     stopped = pyqtSignal()  # Signal for when recording stops
 
-    def __init__(self):
+    def __init__(self, output_dir='audio', codec=None, bitrate=None, replay_seconds=0, silence_trim=None):
+        """
+        Args:
+            output_dir: directory recordings are written to
+            codec: 'wav', 'flac' or 'opus' (defaults to AUDIO_CODEC); encoded as audio arrives
+            bitrate: Opus target bitrate in bits/s (defaults to AUDIO_OPUS_BITRATE)
+            replay_seconds: when > 0, run in replay mode: keep only the last N seconds
+                            in a fixed-size AudioHistory instead of writing a file
+            silence_trim: compress long silences before they reach the file (defaults to
+                          AUDIO_SILENCE_TRIM); the voiced regions are saved next to it
+                          as <file>.voiced.json. Never applied in replay mode.
+        """
         super().__init__()
+        self.codec = (codec or AUDIO_CODEC).lower()
+        if self.codec not in AUDIO_CODECS:
+            raise ValueError(f"Unsupported audio codec: {self.codec}")
+        self.bitrate = bitrate or AUDIO_OPUS_BITRATE
         self.recording = False
-        self.frames = []
-        self.samplerate = 44100
+        self.stop_requested = False
+        self.samplerate = OPUS_SAMPLERATE if self.codec == 'opus' else 44100
         # Detect the default input device
         default_device = sd.query_devices(kind='input')
 
@@ -20,33 +118,119 @@ class AudioRecorderThread(QThread):
         if self.channels < 1:
             raise ValueError("No valid input channels found on the default recording device.")
 
+        self.output_dir = output_dir
+        self.replay_seconds = replay_seconds
+        self.silence_trim = AUDIO_SILENCE_TRIM if silence_trim is None else silence_trim
+        self.trimmer = None
+        self.voiced_regions = None
+        self.history = None
         self.audio_path = None
+        self.ring = None
+        self.frames_written = 0
+
+    def stats(self):
+        """Frames captured, seconds kept after silence trimming and frames lost to overruns
+        for the current (or last) recording."""
+        return {
+            'frames_written': self.frames_written,
+            'seconds_written': round(self.frames_written / self.samplerate, 2),
+            'seconds_stored': round(self.trimmer.frames_out / self.samplerate, 2) if self.trimmer else None,
+            'dropped_frames': self.ring.dropped_frames if self.ring else 0,
+            'codec': self.codec,
+        }
+
+    def _open_output(self):
+        """Open the output file for incremental writing in the configured codec."""
+        file_format, subtype, _ = AUDIO_CODECS[self.codec]
+        options = {}
+        if self.codec == 'opus':
+            options['compression_level'] = opus_compression_level(self.bitrate, self.channels)
+        sound_file = sf.SoundFile(self.audio_path, 'w', samplerate=self.samplerate, channels=self.channels,
+                                  format=file_format, subtype=subtype, **options)
+        if self.codec == 'wav':
+            # WAV sizes live in the header; keep it current so a crash leaves a playable file.
+            # FLAC frames and Ogg pages are self-delimiting and need no such help.
+            # soundfile has no public call for this, so it goes through its libsndfile
+            # handle when that is there; otherwise the periodic flush() in run() is all
+            # a crash gets, and the header is written when recording stops
+            snd, ffi = getattr(sf, '_snd', None), getattr(sf, '_ffi', None)
+            try:
+                snd.sf_command(sound_file._file, SFC_SET_UPDATE_HEADER_AUTO, ffi.NULL, 1)
+            except Exception as e:
+                print(f"Could not turn on WAV header updates ({e}); relying on periodic flushes")
+        return sound_file
 
     def run(self):
         def callback(indata, frames, time, status):
             if status:
                 print(status)
-            self.frames.append(indata.copy())
+            if not self.ring.write(indata):
+                print(f"Audio buffer full, dropped {frames} frames")
+
+        self.ring = AudioRing(int(self.samplerate * AUDIO_BUFFER_SECONDS), self.channels)
+        self.frames_written = 0
+
+        if self.replay_seconds:
+            # Replay mode: blocks roll through a fixed-size history, nothing is written
+            sound_file = None
+            self.history = AudioHistory(self.replay_seconds, self.samplerate, self.channels)
+            sink = self.history.append
+        else:
+            now = QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')
+            extension = AUDIO_CODECS[self.codec][2]
+            self.audio_path = os.path.join(self.output_dir, f"audio_recording_{now}.{extension}")
+            # The file is open for the whole recording and written as audio arrives,
+            # so memory stays flat and a crash only loses the last flush interval
+            sound_file = self._open_output()
+            sink = sound_file.write
+            if self.silence_trim:
+                self.trimmer = SilenceTrimmer(self.samplerate, self.channels)
+                sink = lambda block: self.trimmer.feed(block, sound_file.write)
+
+        def write_block(block):
+            sink(block)
+            self.frames_written += len(block)
 
         # Emit started signal when audio recording begins
         self.started.emit()
 
         self.recording = True
+        if self.stop_requested:
+            self.recording = False  # stop() ran before the loop started
         try:
-            with sd.InputStream(samplerate=self.samplerate, channels=self.channels, callback=callback):
+            with sd.InputStream(samplerate=self.samplerate, channels=self.channels,
+                                dtype='float32', callback=callback):
                 while self.recording:
-                    sd.sleep(100)  # Sleep to allow audio recording to happen
+                    sd.sleep(AUDIO_FLUSH_MS)
+                    if self.ring.drain(write_block) and sound_file is not None:
+                        sound_file.flush()
         except Exception as e:
             print(f"Error during audio recording: {e}")
         finally:
-            now = QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')
-            self.audio_path = f"audio/audio_recording_{now}.wav"
-            # Save the audio data to a file
-            sf.write(self.audio_path, np.concatenate(self.frames), self.samplerate)
+            # The stream is closed by now, so whatever is left in the ring is final
+            self.ring.drain(write_block)
+            if self.trimmer is not None:
+                self.trimmer.close(sound_file.write)
+                self.voiced_regions = self.trimmer.timeline()
+                self._write_timeline()
+            if sound_file is not None:
+                sound_file.close()
+                print(f"Audio recording finalized at {self.audio_path}")
+            else:
+                print("Audio replay buffer stopped")
 
             # Emit stopped signal when audio recording ends
-            print(f"Audio recording finalized at {self.audio_path}")
             self.stopped.emit()  # Emit stop signal when recording ends
 
+    def _write_timeline(self):
+        try:
+            with open(f"{self.audio_path}.voiced.json", 'w') as f:
+                json.dump(self.voiced_regions, f)
+        except OSError as e:
+            print(f"Could not save voiced regions: {e}")
+
     def stop(self):
-        self.recording = False
\ No newline at end of file
+        """Stop recording and wait until the file has been finalized."""
+        self.stop_requested = True
+        self.recording = False
+        self.wait()
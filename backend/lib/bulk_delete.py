@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# S3 accepts at most this many keys per DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+# DeleteObjects requests sent at once
+BULK_DELETE_WORKERS = int(os.getenv("BULK_DELETE_WORKERS", "4"))
+# Largest number of captures one bulk delete may name
+BULK_DELETE_MAX_KEYS = int(os.getenv("BULK_DELETE_MAX_KEYS", "10000"))
+# From this many captures on, one listing of a user's whole rendition root is
+# cheaper than listing each capture's rendition prefix on its own
+RENDITION_ROOT_SCAN_MIN = int(os.getenv("RENDITION_ROOT_SCAN_MIN", "200"))
+
+
+def delete_objects(client, bucket, keys, workers=BULK_DELETE_WORKERS):
+    """
+    Delete keys with DeleteObjects, DELETE_BATCH_SIZE keys per request and
+    up to `workers` requests in flight.
+
+    Quiet mode makes S3 list only the keys it could not delete, so the
+    responses stay small however many keys succeed. A batch whose request
+    fails as a whole marks each of its keys with that error.
+
+    Returns:
+        {key: None if deleted, else the error message}
+    """
+    keys = list(dict.fromkeys(keys))
+    batches = [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+
+    def delete_batch(batch):
+        results = dict.fromkeys(batch)
+        try:
+            response = client.delete_objects(
+                Bucket=bucket,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True}
+            )
+        except Exception as e:
+            return dict.fromkeys(batch, str(e))
+        for error in response.get('Errors', []):
+            results[error['Key']] = error.get('Message') or error.get('Code') or 'Delete failed'
+        return results
+
+    results = {}
+    if not batches:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(batches))), thread_name_prefix='bulk-delete') as executor:
+        for batch_results in executor.map(delete_batch, batches):
+            results.update(batch_results)
+    return results
+
+
+def list_prefixes(client, bucket, prefixes, workers=BULK_DELETE_WORKERS):
+    """
+    List every key under each of `prefixes`, one paginated listing per prefix
+    with up to `workers` listings in flight.
+
+    Returns:
+        [key, ...]
+    """
+    prefixes = list(dict.fromkeys(prefixes))
+
+    def list_prefix(prefix):
+        paginator = client.get_paginator('list_objects_v2')
+        return [item['Key'] for page in paginator.paginate(Bucket=bucket, Prefix=prefix)
+                for item in page.get('Contents', [])]
+
+    keys = []
+    if not prefixes:
+        return keys
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(prefixes))), thread_name_prefix='bulk-list') as executor:
+        for prefix_keys in executor.map(list_prefix, prefixes):
+            keys.extend(prefix_keys)
+    return keys
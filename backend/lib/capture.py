@@ -0,0 +1,291 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+
+class FrameSource:
+    """
+    Interface for anything RecorderThread can capture frames from.
+
+    Implementations write straight into a caller-owned (height, width, 3)
+    uint8 BGR buffer, so the capture loop can reuse the same memory for
+    every frame instead of allocating new full-screen arrays.
+    """
+
+    @property
+    def size(self):
+        """(width, height) of the frames this source produces."""
+        raise NotImplementedError
+
+    def grab_into(self, out):
+        """Capture one frame into `out` (BGR, shape (height, width, 3))."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def copy_fitted(out, frame):
+    """
+    Copy `frame` into `out`, cropping or zero-padding when the two differ in
+    size (the display was rescaled or changed mid-recording) instead of failing.
+    """
+    if frame.shape == out.shape:
+        np.copyto(out, frame)
+        return
+    height = min(out.shape[0], frame.shape[0])
+    width = min(out.shape[1], frame.shape[1])
+    out[:height, :width] = frame[:height, :width]
+    out[height:] = 0
+    out[:height, width:] = 0
+
+
+class MssFrameSource(FrameSource):
+    """Native screen grabber (GDI/Quartz/XShm via mss). Much faster than pyautogui."""
+
+    def __init__(self, monitor=1):
+        if mss is None:
+            raise RuntimeError("mss is not installed")
+        self.sct = mss.mss()
+        self.monitor = self.sct.monitors[monitor]
+        # On HiDPI or scaled displays the grab is not the monitor's logical
+        # size, so the frame size comes from an actual grab
+        shot = self.sct.grab(self.monitor)
+        self._size = (shot.width, shot.height)
+
+    @property
+    def size(self):
+        return self._size
+
+    def grab_into(self, out):
+        shot = self.sct.grab(self.monitor)
+        # mss hands back BGRA bytes; view them without copying and drop alpha into `out`
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        copy_fitted(out, bgra[:, :, :3])
+
+    def close(self):
+        self.sct.close()
+
+
+class PyAutoGuiFrameSource(FrameSource):
+    """Fallback grabber for systems without mss."""
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+        # Screenshots come back in physical pixels, which on HiDPI displays
+        # is not pyautogui.size(); take the size from one
+        screenshot = pyautogui.screenshot()
+        self._size = (screenshot.width, screenshot.height)
+
+    @property
+    def size(self):
+        return self._size
+
+    def grab_into(self, out):
+        rgb = np.asarray(self.pyautogui.screenshot())
+        # Reverse channel order while copying into the reusable buffer (RGB -> BGR)
+        copy_fitted(out, rgb[:, :, 2::-1])
+
+
+class SyntheticFrameSource(FrameSource):
+    """
+    Deterministic moving test pattern for headless benchmarking.
+    Each frame only rewrites two 16-pixel columns of a reused buffer, so it
+    measures the pipeline, not the grabber.
+    """
+
+    def __init__(self, width=1920, height=1080):
+        self._size = (width, height)
+        self.frame_index = 0
+        # Bar position last drawn into each buffer, keyed by buffer address
+        self.previous_bars = {}
+
+    @property
+    def size(self):
+        return self._size
+
+    def grab_into(self, out):
+        width = self._size[0]
+        address = out.ctypes.data
+        previous = self.previous_bars.get(address)
+        if previous is None:
+            out[:, :, :] = 32
+        else:
+            # Only the old bar needs erasing; the rest of the buffer is unchanged
+            out[:, previous:previous + 16, :] = 32
+        bar = (self.frame_index * 16) % width
+        out[:, bar:bar + 16, :] = 255
+        self.previous_bars[address] = bar
+        self.frame_index += 1
+
+
+def create_frame_source(kind='auto'):
+    """
+    Build a frame source by name: 'mss', 'pyautogui', 'synthetic', or 'auto'
+    (mss when available, pyautogui otherwise).
+    """
+    if kind == 'synthetic':
+        return SyntheticFrameSource()
+    if kind == 'pyautogui':
+        return PyAutoGuiFrameSource()
+    if kind == 'mss' or (kind == 'auto' and mss is not None):
+        return MssFrameSource()
+    return PyAutoGuiFrameSource()
+
+
+class FramePacer:
+    """
+    Paces a loop to a target rate on the monotonic clock.
+
+    Deadlines are computed from the start time (start + n / fps) rather than
+    by sleeping a fixed interval, so time spent grabbing and encoding is not
+    added on top of the frame period. When the loop falls more than a frame
+    behind, the missed deadlines are skipped and counted as late frames.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.period = 1.0 / fps
+        self.start = None
+        self.frame = 0
+        self.late_frames = 0
+
+    def wait(self):
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+            return
+        self.frame += 1
+        deadline = self.start + self.frame * self.period
+        if now < deadline:
+            time.sleep(deadline - now)
+        elif now - deadline > self.period:
+            missed = int((now - deadline) / self.period)
+            self.late_frames += missed
+            self.frame += missed
+
+    def elapsed(self):
+        return 0.0 if self.start is None else time.monotonic() - self.start
+
+
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class FrameRing:
+    """
+    Bounded ring of preallocated frames shared by a capture and an encode thread.
+
+    The producer borrows a free slot, fills it in place and publishes it; the
+    consumer takes published slots in order and hands them back once encoded.
+    No frame memory is allocated after construction. When every slot is in
+    use the drop policy decides which frame is lost:
+
+      drop_oldest: recycle the oldest frame still waiting to be encoded
+      drop_newest: skip capturing the new frame entirely
+    """
+
+    def __init__(self, capacity, width, height, policy=DROP_OLDEST):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.frames = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self.capacity = capacity
+        self.policy = policy
+        self.free = deque(range(capacity))
+        self.ready = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.captured = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+    def acquire_write(self):
+        """Return a slot index to capture into, or None if the frame must be dropped."""
+        with self.condition:
+            if self.free:
+                return self.free.popleft()
+            self.dropped += 1
+            if self.policy == DROP_OLDEST and self.ready:
+                return self.ready.popleft()
+            return None
+
+    def publish(self, slot):
+        with self.condition:
+            self.ready.append(slot)
+            self.captured += 1
+            self.max_depth = max(self.max_depth, len(self.ready))
+            self.condition.notify()
+
+    def acquire_read(self):
+        """Block until a frame is ready; returns its slot, or None once closed and drained."""
+        with self.condition:
+            while not self.ready and not self.closed:
+                self.condition.wait()
+            if self.ready:
+                return self.ready.popleft()
+            return None
+
+    def discard(self, slot):
+        """Return a slot that was written but is not worth encoding (e.g. unchanged frame)."""
+        with self.condition:
+            self.free.appendleft(slot)
+
+    def release(self, slot):
+        with self.condition:
+            self.free.append(slot)
+            self.encoded += 1
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'captured_frames': self.captured,
+                'encoded_frames': self.encoded,
+                'dropped_frames': self.dropped,
+                'queue_depth': len(self.ready),
+                'max_queue_depth': self.max_depth,
+                'buffer_frames': self.capacity,
+                'drop_policy': self.policy,
+            }
+
+
+def measure_capture_rate(source, fps, seconds):
+    """
+    Run a grab-only loop for `seconds` and report what rate was actually met.
+    Useful with SyntheticFrameSource to benchmark without a display.
+    """
+    width, height = source.size
+    buffer = np.empty((height, width, 3), dtype=np.uint8)
+    pacer = FramePacer(fps)
+    frames = 0
+    while pacer.elapsed() < seconds:
+        pacer.wait()
+        source.grab_into(buffer)
+        frames += 1
+    elapsed = pacer.elapsed()
+    return {
+        'target_fps': fps,
+        'measured_fps': round(frames / elapsed, 2) if elapsed else 0.0,
+        'frames': frames,
+        'late_frames': pacer.late_frames,
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    kind = sys.argv[1] if len(sys.argv) > 1 else 'synthetic'
+    for target in (30, 60):
+        print(measure_capture_rate(create_frame_source(kind), target, 3))
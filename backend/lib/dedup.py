@@ -0,0 +1,295 @@
+import base64
+import hashlib
+import json
+import tempfile
+import threading
+from urllib.parse import urlencode
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Captures smaller than this stay in memory while being hashed, larger ones spill to disk
+SPOOL_MAX_MEMORY = 16 * 1024 * 1024
+
+# Tag written on pointer objects; its value is the key holding the actual bytes
+CONTENT_REF_TAG = 'content_ref'
+
+
+def hash_into_spool(stream, chunk_size=HASH_CHUNK_SIZE):
+    """
+    Read a stream exactly once, hashing it while copying it into a spooled buffer.
+
+    The returned spool is rewound and can be handed straight to the upload, so
+    deciding whether the content is a duplicate never costs a second read of
+    the source.
+
+    Returns:
+        (sha256 hex digest, SpooledTemporaryFile, size in bytes)
+    """
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return digest.hexdigest(), spool, size
+
+
+def hash_stream(stream, chunk_size=HASH_CHUNK_SIZE):
+    """Hash a file-like object in fixed-size chunks without holding it in memory."""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_file(path, chunk_size=HASH_CHUNK_SIZE):
+    """Hash a local file in fixed-size chunks without loading it into memory."""
+    with open(path, 'rb') as f:
+        return hash_stream(f, chunk_size)
+
+
+def checksum_for(digest):
+    """The base64 form S3 uses for x-amz-checksum-sha256, from a hex digest."""
+    return base64.b64encode(bytes.fromhex(digest)).decode('ascii')
+
+
+def stored_sha256(client, bucket, key):
+    """
+    SHA-256 hex digest of an object's bytes, as computed on the server side.
+
+    Uses the checksum S3 verified when the object was written when there is
+    one; otherwise streams the object once through the hash. Composite
+    checksums of multipart uploads ("<base64>-N") are not a hash of the
+    whole object, so those are hashed too.
+    """
+    head = client.head_object(Bucket=bucket, Key=key, ChecksumMode='ENABLED')
+    checksum = head.get('ChecksumSHA256')
+    if checksum and '-' not in checksum:
+        return base64.b64decode(checksum).hex()
+    return hash_stream(client.get_object(Bucket=bucket, Key=key)['Body'])
+
+
+def put_reference(client, bucket, key, original_key, tags):
+    """Write a zero-byte pointer object at `key` that refers to `original_key`.
+    The pointer carries the capture's own tags so its metadata stays independent."""
+    tagging = {**tags, CONTENT_REF_TAG: original_key}
+    client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body=b'',
+        Tagging=urlencode(tagging),
+    )
+
+
+class ContentIndex:
+    """
+    Per-user map of content hash -> S3 key holding those bytes.
+
+    Stored as {username}/HASHES_{username}.json next to the session file and
+    cached in memory after the first load. Each entry keeps the original key
+    plus the pointer keys that reference it, so deleting the original can
+    promote a pointer instead of orphaning it.
+    """
+
+    def __init__(self, client, bucket, username):
+        self.client = client
+        self.bucket = bucket
+        self.username = username
+        self.index_key = f"{username}/HASHES_{username}.json"
+        self.entries = None
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.index_key)
+            data = json.loads(response["Body"].read().decode("utf-8"))
+            self.entries = data if isinstance(data, dict) else {}
+        except self.client.exceptions.NoSuchKey:
+            self.entries = {}
+
+    def _save(self):
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.index_key,
+            Body=json.dumps(self.entries),
+            ContentType="application/json",
+        )
+
+    def lookup(self, digest):
+        """Return the key already holding this content, or None."""
+        with self.lock:
+            self._load()
+            entry = self.entries.get(digest)
+            return entry['key'] if entry else None
+
+    def digests(self):
+        """{key: content hash} for every key that holds bytes (pointers are left out)."""
+        with self.lock:
+            self._load()
+            return {entry['key']: digest for digest, entry in self.entries.items()}
+
+    def add_original(self, digest, key):
+        with self.lock:
+            self._load()
+            self.entries[digest] = {'key': key, 'refs': []}
+            self._save()
+
+    def add_reference(self, digest, key):
+        with self.lock:
+            self._load()
+            entry = self.entries.get(digest)
+            if entry is None:
+                return
+            if key not in entry['refs']:
+                entry['refs'].append(key)
+                self._save()
+
+    def remove(self, key):
+        """
+        Drop `key` from the index.
+
+        Returns:
+            (promoted, remaining_refs): when `key` was an original that is still
+            referenced, `promoted` is the pointer key that must now hold the bytes
+            and `remaining_refs` are the pointers that must be re-aimed at it.
+            Otherwise (None, []).
+        """
+        with self.lock:
+            self._load()
+            for digest, entry in list(self.entries.items()):
+                if key in entry['refs']:
+                    entry['refs'].remove(key)
+                    self._save()
+                    return None, []
+                if entry['key'] == key:
+                    if entry['refs']:
+                        promoted = entry['refs'].pop(0)
+                        entry['key'] = promoted
+                        self._save()
+                        return promoted, list(entry['refs'])
+                    del self.entries[digest]
+                    self._save()
+                    return None, []
+            return None, []
+
+    def originals(self, keys):
+        """The keys among `keys` that hold the bytes of an index entry."""
+        keys = set(keys)
+        with self.lock:
+            self._load()
+            return {entry['key'] for entry in self.entries.values() if entry['key'] in keys}
+
+    def _promotions(self, doomed):
+        """(original, promoted, remaining_refs) for each doomed original with a surviving pointer."""
+        promotions = []
+        for entry in self.entries.values():
+            if entry['key'] not in doomed:
+                continue
+            refs = [ref for ref in entry['refs'] if ref not in doomed]
+            if refs:
+                promotions.append((entry['key'], refs[0], refs[1:]))
+        return promotions
+
+    def plan_removal(self, keys):
+        """What remove_many(keys) would promote, without changing the index."""
+        with self.lock:
+            self._load()
+            return self._promotions(set(keys))
+
+    def remove_many(self, keys):
+        """
+        Drop every key in `keys` from the index with a single save. Pointers
+        that are being deleted too are never promoted.
+
+        Returns:
+            [(original, promoted, remaining_refs)] for each original whose
+            bytes must first move into a surviving pointer (see remove())
+        """
+        doomed = set(keys)
+        with self.lock:
+            self._load()
+            promotions = self._promotions(doomed)
+            promoted = {original: key for original, key, _ in promotions}
+            changed = False
+            for digest, entry in list(self.entries.items()):
+                refs = [ref for ref in entry['refs'] if ref not in doomed]
+                if len(refs) != len(entry['refs']):
+                    entry['refs'] = refs
+                    changed = True
+                if entry['key'] not in doomed:
+                    continue
+                changed = True
+                if entry['key'] in promoted:
+                    entry['key'] = promoted[entry['key']]
+                    entry['refs'] = [ref for ref in refs if ref != entry['key']]
+                else:
+                    del self.entries[digest]
+            if changed:
+                self._save()
+        return promotions
+
+
+def promote_reference(client, bucket, original_key, promoted_key, remaining_refs):
+    """
+    Move the bytes of `original_key` into the pointer at `promoted_key` with a
+    server-side copy, then re-aim the other pointers at it. Must run before the
+    original is deleted.
+    """
+    response = client.get_object_tagging(Bucket=bucket, Key=promoted_key)
+    tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+    tags.pop(CONTENT_REF_TAG, None)
+    client.copy_object(
+        Bucket=bucket,
+        Key=promoted_key,
+        CopySource={'Bucket': bucket, 'Key': original_key},
+        TaggingDirective='REPLACE',
+        Tagging=urlencode(tags),
+    )
+    for ref_key in remaining_refs:
+        response = client.get_object_tagging(Bucket=bucket, Key=ref_key)
+        ref_tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+        ref_tags[CONTENT_REF_TAG] = promoted_key
+        client.put_object_tagging(
+            Bucket=bucket,
+            Key=ref_key,
+            Tagging={'TagSet': [{'Key': k, 'Value': v} for k, v in ref_tags.items()]}
+        )
+
+
+def demote_reference(client, bucket, original_key, promoted_key, remaining_refs):
+    """
+    Undo promote_reference() when the original could not be deleted after all:
+    turn `promoted_key` back into a pointer and re-aim the others at the original.
+    """
+    response = client.get_object_tagging(Bucket=bucket, Key=promoted_key)
+    tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+    put_reference(client, bucket, promoted_key, original_key, tags)
+    for ref_key in remaining_refs:
+        response = client.get_object_tagging(Bucket=bucket, Key=ref_key)
+        ref_tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+        ref_tags[CONTENT_REF_TAG] = original_key
+        client.put_object_tagging(
+            Bucket=bucket,
+            Key=ref_key,
+            Tagging={'TagSet': [{'Key': k, 'Value': v} for k, v in ref_tags.items()]}
+        )
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_content_index(client, bucket, username):
+    """Return the shared ContentIndex for a user, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get((bucket, username))
+        if index is None:
+            index = ContentIndex(client, bucket, username)
+            _indexes[(bucket, username)] = index
+        return index
@@ -0,0 +1,124 @@
+import io
+import os
+import threading
+from concurrent.futures import Future
+
+from PIL import Image
+
+from lib.transcode import SCREENSHOT_FORMATS, avif_supported
+
+# Requested widths are rounded up to one of these, so a handful of sizes cover every view
+DERIVATIVE_WIDTHS = (64, 128, 256, 480, 640, 960, 1280, 1920, 2560)
+DERIVATIVE_FORMATS = ('webp', 'jpeg', 'avif')
+DERIVATIVE_QUALITY = int(os.getenv("DERIVATIVE_QUALITY", "75"))
+# Rendered copies kept on local disk; the least recently viewed are evicted past this
+DERIVATIVE_CACHE_DIR = os.getenv("DERIVATIVE_CACHE_DIR")
+DERIVATIVE_CACHE_MAX_BYTES = int(os.getenv("DERIVATIVE_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
+# Also store renders in S3, so other machines (and this one after eviction) reuse them
+DERIVATIVES_S3 = os.getenv("DERIVATIVES_S3", "0").lower() in ("1", "true", "yes")
+DERIVATIVE_PREFIX = 'derivatives'
+DERIVATIVE_SOURCE_EXTENSIONS = ('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif')
+
+
+def normalize_width(width):
+    """Smallest configured width at least as large as the one asked for."""
+    for candidate in DERIVATIVE_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def normalize_format(fmt):
+    fmt = (fmt or 'webp').lower()
+    if fmt == 'jpg':
+        fmt = 'jpeg'
+    if fmt not in DERIVATIVE_FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    if fmt == 'avif' and not avif_supported():
+        fmt = 'webp'
+    return fmt
+
+
+def derivative_prefix_for(key):
+    """
+    Prefix holding every rendered size of an image.
+
+    e.g. "alice/screenshot_1.webp" -> "alice/derivatives/screenshot_1/"
+    """
+    username, _, rest = key.partition('/')
+    return f"{username}/{DERIVATIVE_PREFIX}/{os.path.splitext(rest)[0]}/"
+
+
+def derivative_key_for(key, width, fmt, version=None):
+    """
+    Key of one rendered size of an image. Sources that are overwritten in place
+    (profile pictures) pass their ETag as version, so a key never changes content.
+
+    e.g. ("alice/screenshot_1.webp", 480, "webp") -> "alice/derivatives/screenshot_1/w480.webp"
+    """
+    suffix = f"-{version}" if version else ''
+    return f"{derivative_prefix_for(key)}w{width}{suffix}.{SCREENSHOT_FORMATS[fmt][1]}"
+
+
+def is_derivative_key(key):
+    parts = key.split('/')
+    return len(parts) > 2 and parts[1] == DERIVATIVE_PREFIX
+
+
+def render_derivative(data, width, fmt, quality):
+    """
+    Scale an image to `width` (never up) and encode it. Runs inside an encoder worker process.
+
+    Returns:
+        the encoded bytes
+    """
+    pil_format, _, options = SCREENSHOT_FORMATS[fmt]
+    with Image.open(io.BytesIO(data)) as image:
+        # Large JPEGs can be decoded straight at a fraction of their size
+        image.draft('RGB', (width, width))
+        image.load()
+        if image.width > width:
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        output = io.BytesIO()
+        image.save(output, format=pil_format, quality=quality, **options)
+        return output.getvalue()
+
+
+class RenderCoalescer:
+    """
+    Runs at most one render per derivative key at a time. Callers that ask for
+    a key while it is being rendered wait for that render instead of starting
+    their own, and get its result (or its exception).
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.coalesced = 0
+
+    def run(self, key, render):
+        with self.lock:
+            future = self.pending.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.pending[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            result = render()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.pending.pop(key, None)
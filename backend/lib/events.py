@@ -0,0 +1,113 @@
+import json
+import os
+import queue
+import threading
+from collections import deque
+
+# Recent events kept so a reconnecting client can catch up from its Last-Event-ID
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "512"))
+# Comment lines sent on idle streams, so proxies and dead clients are noticed
+EVENT_HEARTBEAT_SECONDS = float(os.getenv("EVENT_HEARTBEAT_SECONDS", "15"))
+# Events buffered per client before it is told to resync instead
+EVENT_CLIENT_QUEUE = 256
+EVENT_RETRY_MS = 3000
+# Sent when a client missed events it can't be given; it should refetch its state
+RESYNC_EVENT = 'resync'
+
+
+def format_event(event_id, event, data):
+    """One server-sent event in wire format (data is already JSON)."""
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+class EventBroker:
+    """
+    Fans change events (media added/removed/retagged, session changes, upload
+    progress) out to server-sent event streams.
+
+    publish() never blocks the route that calls it: every stream has its own
+    bounded queue, and a client too slow to drain it has its backlog replaced
+    by a single resync event. Events are numbered, and the last EVENT_HISTORY
+    of them are kept so a client reconnecting with Last-Event-ID gets exactly
+    what it missed (or a resync if that has already been dropped).
+    """
+
+    def __init__(self, history=EVENT_HISTORY, heartbeat=EVENT_HEARTBEAT_SECONDS):
+        self.history = deque(maxlen=history)
+        self.heartbeat = heartbeat
+        self.subscribers = set()
+        self.last_id = 0
+        self.published = 0
+        self.resyncs = 0
+        self.lock = threading.Lock()
+
+    def publish(self, event, data):
+        """Send an event to every connected client."""
+        with self.lock:
+            self.last_id += 1
+            self.published += 1
+            record = (self.last_id, event, json.dumps(data, default=str))
+            self.history.append(record)
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(record)
+            except queue.Full:
+                self._resync(subscriber, record[0])
+
+    def _resync(self, subscriber, event_id):
+        with self.lock:
+            self.resyncs += 1
+        # A concurrent publish can refill the queue between the drain and the
+        # put; drain again then, so publish() never sees queue.Full
+        while True:
+            try:
+                while True:
+                    subscriber.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                subscriber.put_nowait((event_id, RESYNC_EVENT, '{}'))
+                return
+            except queue.Full:
+                continue
+
+    def stream(self, last_event_id=None):
+        """
+        Generator of wire-format events for one client, starting after
+        last_event_id when it reconnects. Runs until the client goes away.
+        """
+        subscriber = queue.Queue(maxsize=EVENT_CLIENT_QUEUE)
+        with self.lock:
+            backlog = []
+            if last_event_id is not None and last_event_id != self.last_id:
+                oldest = self.history[0][0] if self.history else self.last_id + 1
+                if last_event_id > self.last_id or last_event_id + 1 < oldest:
+                    # Numbered by an earlier run of the server, or already dropped
+                    backlog = [(self.last_id, RESYNC_EVENT, '{}')]
+                else:
+                    backlog = [record for record in self.history if record[0] > last_event_id]
+            self.subscribers.add(subscriber)
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            for record in backlog:
+                yield format_event(*record)
+            while True:
+                try:
+                    record = subscriber.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_event(*record)
+        finally:
+            with self.lock:
+                self.subscribers.discard(subscriber)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'clients': len(self.subscribers),
+                'published': self.published,
+                'last_id': self.last_id,
+                'resyncs': self.resyncs,
+            }
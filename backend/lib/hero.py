@@ -0,0 +1,25 @@
+import os
+
+from lib.transcode import output_extension
+
+# The home page hero is drawn at most this wide, so larger screenshots are scaled down once
+HERO_MAX_DIMENSION = int(os.getenv("HERO_MAX_DIMENSION", "1920"))
+HERO_FORMAT = os.getenv("HERO_FORMAT", "webp").lower()
+HERO_QUALITY = int(os.getenv("HERO_QUALITY", "75"))
+HERO_PREFIX = 'heroes'
+
+
+def hero_key_for(key):
+    """
+    Map a screenshot key to the key of its hero rendition under the parallel prefix.
+
+    e.g. "alice/screenshot_1.png" -> "alice/heroes/screenshot_1.webp"
+    """
+    username, _, rest = key.partition('/')
+    base = os.path.splitext(rest)[0]
+    return f"{username}/{HERO_PREFIX}/{base}.{output_extension(HERO_FORMAT)}"
+
+
+def is_hero_key(key):
+    parts = key.split('/')
+    return len(parts) > 2 and parts[1] == HERO_PREFIX
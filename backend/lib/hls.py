@@ -0,0 +1,140 @@
+import os
+import re
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+
+# Package finished recordings as HLS in addition to the fast-start MP4
+RECORDING_HLS = os.getenv("RECORDING_HLS", "0").lower() in ("1", "true", "yes")
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+# Top-level prefix, so hundreds of segments never show up in a user's media listing
+HLS_PREFIX = 'hls'
+HLS_PLAYLIST = 'index.m3u8'
+HLS_INIT_SEGMENT = 'init.mp4'
+# Tag set on a recording once its HLS rendition is complete
+HLS_TAG = 'hls'
+
+HLS_CONTENT_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.m4s': 'video/iso.segment',
+    '.mp4': 'video/mp4',
+}
+
+MAP_URI = re.compile(r'URI="([^"]+)"')
+
+
+def hls_prefix_for(key):
+    """
+    Prefix holding the HLS rendition of a media key.
+
+    e.g. "alice/recordings/recording_1.mp4" -> "hls/alice/recordings/recording_1/"
+    """
+    return f"{HLS_PREFIX}/{os.path.splitext(key)[0]}/"
+
+
+def package_hls(ffmpeg_path, input_path, output_dir, segment_seconds=HLS_SEGMENT_SECONDS):
+    """
+    Split a recording into a VOD playlist and fMP4 segments with stream copy.
+
+    Segments can only start on keyframes, so their length is segment_seconds
+    or the next keyframe after it.
+
+    Returns:
+        file names written to output_dir with the playlist last, or None on failure
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    result = subprocess.run(
+        [ffmpeg_path,
+         '-hide_banner', '-loglevel', 'error', '-y',
+         '-i', input_path,
+         '-map', '0',
+         '-c', 'copy',
+         '-f', 'hls',
+         '-hls_time', str(segment_seconds),
+         '-hls_playlist_type', 'vod',
+         '-hls_segment_type', 'fmp4',
+         '-hls_fmp4_init_filename', HLS_INIT_SEGMENT,
+         '-hls_segment_filename', os.path.join(output_dir, 'seg_%05d.m4s'),
+         os.path.join(output_dir, HLS_PLAYLIST)],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=600
+    )
+    if result.returncode != 0 or not os.path.exists(os.path.join(output_dir, HLS_PLAYLIST)):
+        print(f"Failed to package {input_path} as HLS: {result.stderr.decode(errors='ignore').strip()}")
+        return None
+    # Upload order matters: the playlist goes last so it never references a missing segment
+    files = sorted(name for name in os.listdir(output_dir) if name != HLS_PLAYLIST)
+    return files + [HLS_PLAYLIST]
+
+
+def delete_hls(client, bucket, key):
+    """Delete every object of a media key's HLS rendition."""
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=hls_prefix_for(key)):
+        objects = [{'Key': item['Key']} for item in page.get('Contents', [])]
+        if objects:
+            client.delete_objects(Bucket=bucket, Delete={'Objects': objects, 'Quiet': True})
+
+
+class SignedPlaylistCache:
+    """
+    Serves HLS playlists with every segment URI presigned.
+
+    A presigned playlist alone is not enough: its relative segment URIs would
+    resolve to unsigned S3 URLs. So the playlist is rewritten with a presigned
+    URL per segment. VOD playlists never change, so the raw text is fetched
+    once; the signed version is reused until half its validity has passed,
+    which keeps signing (about 0.3 ms per URL) off the path of repeat views.
+    """
+
+    def __init__(self, client, bucket, expires=3600, max_entries=128):
+        self.client = client
+        self.bucket = bucket
+        self.expires = expires
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # media key -> (reuse until, signed text)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Signed playlist text for a media key's HLS rendition."""
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        prefix = hls_prefix_for(key)
+        body = self.client.get_object(Bucket=self.bucket, Key=prefix + HLS_PLAYLIST)['Body'].read()
+        signed = self._sign(prefix, body.decode('utf-8'))
+
+        with self.lock:
+            self.entries[key] = (now + self.expires / 2, signed)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return signed
+
+    def _sign(self, prefix, playlist):
+        def presign(name):
+            return self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': prefix + name},
+                ExpiresIn=self.expires
+            )
+
+        lines = []
+        for line in playlist.splitlines():
+            if line.startswith('#EXT-X-MAP'):
+                line = MAP_URI.sub(lambda m: f'URI="{presign(m.group(1))}"', line)
+            elif line and not line.startswith('#'):
+                line = presign(line)
+            lines.append(line)
+        return '\n'.join(lines) + '\n'
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -0,0 +1,279 @@
+import os
+import random
+import socket
+import struct
+import subprocess
+import threading
+import time
+from collections import deque
+
+# Listeners kept spawned and bound ahead of time so a recording can start instantly
+PREWARM_LISTENERS = int(os.getenv("FFMPEG_PREWARM_LISTENERS", "1"))
+# How long to wait for a freshly spawned ffmpeg to reach its listen call
+LISTENER_START_TIMEOUT = 5.0
+# How long a stopping ffmpeg gets to finalize its output before it is killed
+LISTENER_STOP_TIMEOUT = 10.0
+MONITOR_INTERVAL = 0.5
+# Back-off before trying to pre-warm again after ffmpeg could not be spawned
+PREWARM_RETRY_SECONDS = 30.0
+
+# How often a starting listener is probed, and how long each probe waits for an answer
+READY_POLL_INTERVAL = 0.01
+READY_PROBE_TIMEOUT = 0.05
+
+# ffmpeg logs this (at info level) once a caller has connected and the stream has been probed
+CONNECTED_MARKER = "Input #0"
+
+# SRT handshake (version 4 induction, as a caller sends first): control packet header,
+# then version, UDT socket type (DGRAM), initial sequence number, MTU, flow window,
+# handshake type (1 = induction), socket id, SYN cookie and a 16-byte peer address
+SRT_INDUCTION = struct.Struct('>IIIIIIIIIIII16s')
+SRT_HANDSHAKE_REPLY_MIN = 48
+
+
+def allocate_udp_port(host='127.0.0.1'):
+    """Ask the OS for a currently free UDP port (SRT runs over UDP)."""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def srt_listening(port, host='127.0.0.1', timeout=READY_PROBE_TIMEOUT):
+    """
+    True once an SRT listener answers on the port.
+
+    Sends the induction handshake a caller would open with. A listener
+    answers it without setting up a connection, so probing leaves the
+    listener free for the real caller; with nothing bound the port is
+    refused (or the probe times out) and this returns False.
+    """
+    packet = SRT_INDUCTION.pack(0x80000000, 0, 0, 0, 4, 2, random.getrandbits(31), 1500, 8192, 1,
+                                random.getrandbits(31), 0, b'\0' * 16)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect((host, port))
+            sock.send(packet)
+            reply = sock.recv(1500)
+        except OSError:  # refused, reset or timed out
+            return False
+    # A handshake control packet back (the listener's induction response)
+    return len(reply) >= SRT_HANDSHAKE_REPLY_MIN and struct.unpack_from('>I', reply)[0] == 0x80000000
+
+
+class Listener:
+    """One ffmpeg process waiting for (or receiving) an SRT stream."""
+
+    def __init__(self, process, port, url, output_path):
+        self.process = process
+        self.port = port
+        self.url = url
+        self.output_path = output_path
+        self.ready = threading.Event()
+        self.exited = threading.Event()
+        self.connected = False
+        self.stop_deadline = None
+        self.on_exit = None
+        self.log = deque(maxlen=20)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def check_ready(self):
+        """Probe the port once; True (and ready set) when ffmpeg is listening."""
+        if not self.ready.is_set() and srt_listening(self.port):
+            self.ready.set()
+        return self.ready.is_set()
+
+    def last_error(self):
+        return ' | '.join(line for line in self.log if 'rror' in line) or (self.log[-1] if self.log else '')
+
+
+class ListenerManager:
+    """
+    Owns the ffmpeg SRT listener processes behind screen recordings.
+
+    Ports come from the OS (bind to port 0) instead of a random guess, and a
+    process counts as started once it answers an SRT handshake on its port,
+    so there is no fixed sleep. PREWARM_LISTENERS processes are kept spawned
+    and waiting; acquire() hands one out immediately and a replacement is
+    started in the background. Each process has a reader thread that drains
+    its log and reaps it on exit, and a monitor thread kills processes that
+    overrun their stop deadline, so stop() never blocks the caller.
+    """
+
+    def __init__(self, ffmpeg_path, output_dir, prewarm=PREWARM_LISTENERS, log=print):
+        self.ffmpeg_path = ffmpeg_path
+        self.output_dir = output_dir
+        self.prewarm = prewarm
+        self.log = log
+        self.lock = threading.Lock()
+        self.idle = deque()
+        self.active = set()
+        self.wakeup = threading.Event()
+        self.monitor = None
+        self.closed = False
+        self.prewarm_retry_at = 0.0
+
+    def start(self):
+        """Start the monitor (and with it the pre-warmed listeners)."""
+        with self.lock:
+            if self.monitor is None:
+                self.monitor = threading.Thread(target=self._monitor_loop, name="ffmpeg-listener-monitor", daemon=True)
+                self.monitor.start()
+
+    def _spawn(self):
+        port = allocate_udp_port()
+        url = f"srt://127.0.0.1:{port}"
+        # ffmpeg only creates the output once a caller connects, so an unused
+        # listener leaves nothing behind; the caller renames it on completion
+        output_path = os.path.normpath(os.path.join(self.output_dir, f"listener_{port}.mkv"))
+        process = subprocess.Popen(
+            [self.ffmpeg_path,
+             '-hide_banner', '-nostats', '-loglevel', 'info', '-y',
+             '-probesize', '10M',
+             '-flags', 'low_delay',
+             '-i', url + '?mode=listener',
+             '-map', '0:v',   # Map video first
+             '-map', '0:a?',   # Map audio second
+             '-c:v', 'copy',  # Then specify video codec
+             '-c:a', 'copy',  # Then specify audio codec
+             output_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+        listener = Listener(process, port, url, output_path)
+        threading.Thread(target=self._reader_loop, args=(listener,), name=f"ffmpeg-listener-{port}", daemon=True).start()
+        return listener
+
+    def _reader_loop(self, listener):
+        """Drain ffmpeg's log (it would stall on a full pipe), track its state, and reap it."""
+        for raw in listener.process.stderr:
+            line = raw.decode(errors='ignore').rstrip()
+            if not listener.connected and line.startswith(CONNECTED_MARKER):
+                listener.connected = True
+            listener.log.append(line)
+        listener.process.wait()
+        listener.exited.set()
+        listener.ready.set()  # release anyone still waiting for startup
+        with self.lock:
+            if listener in self.idle:
+                self.idle.remove(listener)
+            self.active.discard(listener)
+        self._fire_exit(listener)
+        self.wakeup.set()
+
+    def _fire_exit(self, listener):
+        # Handlers are one-shot; stop() and the reader thread may both get here
+        with self.lock:
+            handler, listener.on_exit = listener.on_exit, None
+        if handler:
+            try:
+                handler(listener)
+            except Exception as e:
+                self.log(f"Listener {listener.port} exit handler failed: {e}")
+
+    def acquire(self, timeout=LISTENER_START_TIMEOUT):
+        """
+        Return a Listener that is ready for a caller to connect.
+
+        Raises:
+            RuntimeError if ffmpeg exits or does not reach its listen call in time
+        """
+        self.start()
+        with self.lock:
+            while self.idle:
+                listener = self.idle.popleft()
+                if listener.alive():
+                    break
+            else:
+                listener = None
+        if listener is None:
+            listener = self._spawn()
+        self.wakeup.set()  # replace the pre-warmed listener we just took
+
+        deadline = time.monotonic() + timeout
+        while not listener.check_ready() and not listener.exited.is_set() and time.monotonic() < deadline:
+            time.sleep(READY_POLL_INTERVAL)
+        if not listener.ready.is_set() or listener.exited.is_set():
+            listener.process.kill()
+            raise RuntimeError(f"FFmpeg failed to start: {listener.last_error()}")
+        with self.lock:
+            self.active.add(listener)
+        return listener
+
+    def watch(self, listener, handler):
+        """Run handler(listener) once, on the reader thread, when the process exits
+        (immediately if it already has)."""
+        with self.lock:
+            listener.on_exit = handler
+        if listener.exited.is_set():
+            self._fire_exit(listener)
+
+    def stop(self, listener, timeout=LISTENER_STOP_TIMEOUT):
+        """
+        Ask a listener to finish without waiting for it.
+
+        A connected ffmpeg gets 'q' so it finalizes the file; one that never saw
+        a caller is terminated. Whatever was registered with watch() runs once
+        the process is gone; the monitor kills it if that takes over `timeout`.
+        """
+        listener.stop_deadline = time.monotonic() + timeout
+        if listener.exited.is_set():
+            return
+        try:
+            if listener.connected:
+                listener.process.stdin.write(b'q')
+                listener.process.stdin.flush()
+            else:
+                listener.process.terminate()
+        except (BrokenPipeError, OSError):
+            listener.process.terminate()
+        self.wakeup.set()
+
+    def _monitor_loop(self):
+        while not self.closed:
+            with self.lock:
+                missing = self.prewarm - len(self.idle)
+                overdue = [l for l in self.active if l.stop_deadline and time.monotonic() > l.stop_deadline]
+                starting = [l for l in self.idle if not l.ready.is_set()]
+            for listener in starting:
+                listener.check_ready()
+            for listener in overdue:
+                self.log(f"FFmpeg listener on port {listener.port} did not stop in time, killing it")
+                listener.stop_deadline = None
+                listener.process.kill()
+            if time.monotonic() < self.prewarm_retry_at:
+                missing = 0
+            for _ in range(max(missing, 0)):
+                try:
+                    listener = self._spawn()
+                except Exception as e:
+                    self.log(f"Could not pre-warm ffmpeg listener: {e}")
+                    self.prewarm_retry_at = time.monotonic() + PREWARM_RETRY_SECONDS
+                    break
+                with self.lock:
+                    self.idle.append(listener)
+            self.wakeup.wait(MONITOR_INTERVAL)
+            self.wakeup.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'prewarmed': sum(1 for l in self.idle if l.ready.is_set() and l.alive()),
+                'active': len(self.active),
+            }
+
+    def shutdown(self):
+        """Stop every listener: finalize connected ones, terminate idle ones."""
+        self.closed = True
+        self.wakeup.set()
+        with self.lock:
+            listeners = list(self.idle) + list(self.active)
+        for listener in listeners:
+            if listener.alive():
+                self.stop(listener)
+        for listener in listeners:
+            if not listener.exited.wait(LISTENER_STOP_TIMEOUT):
+                listener.process.kill()
@@ -0,0 +1,197 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, unquote
+
+# Where media fetched from S3 is kept; the app defaults this to <base_dir>/cache/media
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR")
+# Byte quota for cached copies; least recently viewed media is evicted past it
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Background downloads filling the cache at once
+MEDIA_CACHE_FILL_WORKERS = int(os.getenv("MEDIA_CACHE_FILL_WORKERS", "2"))
+PARTIAL_SUFFIX = '.part'
+
+
+class MediaCache:
+    """
+    Local copies of S3 media, looked up by object key, with LRU eviction.
+
+    Entries are either owned or seeded. Owned entries are files in the cache
+    directory (named after the quoted key, so the index can be rebuilt from a
+    directory listing on startup) and count against max_bytes. Seeded entries
+    point at captures that are still on disk where they were recorded; they
+    cost nothing and are never deleted by the cache, only forgotten if the
+    file goes away.
+
+    A miss is filled by a background download into a temporary file that is
+    renamed into place when complete, so a partially written copy is never
+    served. Concurrent misses for the same key start a single download.
+    """
+
+    def __init__(self, directory, max_bytes=MEDIA_CACHE_MAX_BYTES, fill_workers=MEDIA_CACHE_FILL_WORKERS, log=print):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.log = log
+        self.entries = OrderedDict()  # key -> (path, size, owned), least recently used first
+        self.owned_bytes = 0
+        self.filling = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=fill_workers, thread_name_prefix='media-cache')
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Re-index copies left by a previous run, oldest access first."""
+        found = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(PARTIAL_SUFFIX):
+                # An interrupted download
+                os.remove(entry.path)
+                continue
+            stat = entry.stat()
+            found.append((max(stat.st_atime, stat.st_mtime), unquote(entry.name), entry.path, stat.st_size))
+        for _, key, path, size in sorted(found):
+            self.entries[key] = (path, size, True)
+            self.owned_bytes += size
+        self._evict()
+
+    def _path_for(self, key):
+        return os.path.join(self.directory, quote(key, safe=''))
+
+    def get(self, key):
+        """Path of the local copy of key, or None. Counts as a use for eviction."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not os.path.exists(entry[0]):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def seed(self, key, path):
+        """
+        Serve key from a capture that already exists locally, without copying it.
+        An owned copy (downloaded or stored at upload) is the stored object
+        itself, so it is kept rather than replaced by the local file.
+        """
+        if not os.path.isfile(path):
+            return
+        with self.lock:
+            if key in self.entries:
+                if self.entries[key][2]:
+                    return
+                self._drop(key)
+            self.entries[key] = (path, os.path.getsize(path), False)
+
+    def put_bytes(self, key, body):
+        """Keep a copy of bytes that were just uploaded as key."""
+        self._store(key, lambda f: f.write(body))
+
+    def put_file(self, key, fileobj):
+        """Keep a copy of a file object that was just uploaded as key."""
+        fileobj.seek(0)
+
+        def write(f):
+            while True:
+                chunk = fileobj.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+        self._store(key, write)
+
+    def fill(self, key, download):
+        """
+        Fetch key in the background unless it is cached or already on its way.
+
+        Args:
+            key: object key
+            download: callable writing the object's bytes to a binary file object
+        """
+        with self.lock:
+            if key in self.entries or key in self.filling:
+                return
+            self.filling.add(key)
+
+        def run():
+            try:
+                self._store(key, download)
+            except Exception as e:
+                self.log(f"Warning: Could not cache {key}: {e}")
+            finally:
+                with self.lock:
+                    self.filling.discard(key)
+        self.executor.submit(run)
+
+    def _store(self, key, write):
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix=PARTIAL_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            path = self._path_for(key)
+            with self.lock:
+                if key in self.entries:
+                    self._drop(key)
+                os.replace(partial, path)
+                size = os.path.getsize(path)
+                self.entries[key] = (path, size, True)
+                self.owned_bytes += size
+                self._evict()
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def _drop(self, key):
+        """Forget key, deleting its copy if the cache owns it. Caller holds the lock."""
+        path, size, owned = self.entries.pop(key)
+        if owned:
+            self.owned_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        if self.owned_bytes <= self.max_bytes:
+            return
+        for key in [key for key, (_, _, owned) in self.entries.items() if owned]:
+            if self.owned_bytes <= self.max_bytes:
+                break
+            self._drop(key)
+            self.evictions += 1
+
+    def discard(self, key):
+        """The object was deleted; stop serving it."""
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+
+    def discard_prefix(self, prefix):
+        """Stop serving every key under prefix."""
+        with self.lock:
+            for key in [key for key in self.entries if key.startswith(prefix)]:
+                self._drop(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'seeded': sum(1 for _, _, owned in self.entries.values() if not owned),
+                'bytes': self.owned_bytes,
+                'max_bytes': self.max_bytes,
+                'filling': len(self.filling),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
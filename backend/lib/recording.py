@@ -1,77 +1,189 @@
 import os
-import time
-import pyautogui
+import threading
 import cv2
 import numpy as np
 from PyQt5.QtCore import QDateTime, QThread, pyqtSignal
-from moviepy.editor import VideoFileClip
-from PIL import Image
+import imageio_ffmpeg
+
+from lib.activity import REC_VFR, ActivityDetector
+from lib.capture import DROP_OLDEST, FramePacer, FrameRing, create_frame_source
+from lib.remux import retime_mp4_frames
+from lib.replay import ReplayEncoder
+from lib.thumbnails import extract_poster_frame
 
 class RecorderThread(QThread):
-    started = pyqtSignal()  # Signal for when recording starts
-    stopped = pyqtSignal()  # Signal for when recording stops
+    # Both signals carry the stats() snapshot (captured/encoded/dropped counters, queue depth)
+    started = pyqtSignal(dict)  # Signal for when recording starts
+    stopped = pyqtSignal(dict)  # Signal for when recording stops
 
-    def __init__(self):
+    def __init__(self, fps=30, frame_source=None, buffer_frames=8, drop_policy=DROP_OLDEST,
+                 replay_seconds=0, ffmpeg_path=None, vfr=None):
+        """
+        Args:
+            fps: target capture rate; paced on the monotonic clock so it is actually met
+            frame_source: a lib.capture.FrameSource, or a kind name for create_frame_source
+                          ('auto', 'mss', 'pyautogui', 'synthetic')
+            buffer_frames: frames the capture thread may run ahead of the encoder
+            drop_policy: 'drop_oldest' or 'drop_newest' when the encoder falls behind
+            replay_seconds: when > 0, run in replay mode: keep only the last N seconds
+                            of encoded video in memory (see lib.replay) instead of a file
+            ffmpeg_path: ffmpeg used for replay encoding and thumbnails (bundled one by default)
+            vfr: skip frames where the screen did not change and sample less often while it
+                 is idle (defaults to REC_VFR); the file is retimed so every kept frame is
+                 shown for as long as it was on screen. Not used in replay mode.
+        """
         super().__init__()
         self.recording = False
+        self.stop_requested = False
         self.video_path = None
         self.thumbnail_path = None
         self.out = None
+        self.fps = fps
+        self.frame_source = frame_source or 'auto'
+        self.buffer_frames = buffer_frames
+        self.drop_policy = drop_policy
+        self.replay_seconds = replay_seconds
+        self.ffmpeg_path = ffmpeg_path or imageio_ffmpeg.get_ffmpeg_exe()
+        self.vfr = REC_VFR if vfr is None else vfr
+        self.activity = None
+        self.slot_ticks = None
+        self.frame_ticks = None
+        self.replay = None
+        self.ring = None
+        self.pacer = None
+        self.write_frame = None
+
+    def stats(self):
+        """Capture/encode counters and target vs. measured rate for the current (or last) recording."""
+        elapsed = self.pacer.elapsed() if self.pacer else 0.0
+        ring_stats = self.ring.stats() if self.ring else {}
+        captured = ring_stats.get('captured_frames', 0)
+        stats = {
+            'target_fps': self.fps,
+            'measured_fps': round(captured / elapsed, 2) if elapsed else 0.0,
+            'late_frames': self.pacer.late_frames if self.pacer else 0,
+            **ring_stats,
+        }
+        if self.activity:
+            stats.update(self.activity.stats())
+        if self.replay:
+            stats['replay'] = self.replay.ring.stats()
+        return stats
+
+    def _encode_loop(self):
+        """Consumer side: encode published frames until the ring is closed and drained."""
+        while True:
+            slot = self.ring.acquire_read()
+            if slot is None:
+                return
+            self.write_frame(self.ring.frames[slot])
+            if self.frame_ticks is not None:
+                self.frame_ticks.append(int(self.slot_ticks[slot]))
+            self.ring.release(slot)
 
     def run(self):
-        screen_size = pyautogui.size()
-        fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # Use MP4 codec
-        now = QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')
-        self.video_path = f"recordings/recording_{now}.mp4"
-        self.thumbnail_path = f"recordings/thumbnails/recording_{now}.png"
+        source = self.frame_source
+        if isinstance(source, str):
+            source = create_frame_source(source)
+        width, height = source.size
+
+        if self.replay_seconds:
+            # Replay mode: encoded GOPs roll through a bounded in-memory ring
+            self.replay = ReplayEncoder(self.ffmpeg_path, width, height, self.fps, self.replay_seconds)
+            self.write_frame = self.replay.write
+        else:
+            fourcc = cv2.VideoWriter_fourcc(*"mp4v")  # Use MP4 codec
+            now = QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')
+            self.video_path = f"recordings/recording_{now}.mp4"
+            self.thumbnail_path = f"recordings/thumbnails/recording_{now}.png"
+
+            self.out = cv2.VideoWriter(self.video_path, fourcc, float(self.fps), (width, height))
+            self.write_frame = self.out.write
 
-        self.out = cv2.VideoWriter(self.video_path, fourcc, 10.0, (screen_size.width, screen_size.height))
+        # Capture (this thread) and encode (a worker) share preallocated frames,
+        # so a slow encode no longer delays the next grab
+        self.ring = FrameRing(self.buffer_frames, width, height, self.drop_policy)
+        self.pacer = FramePacer(self.fps)
+        if self.vfr and not self.replay_seconds:
+            # Pacer tick of the frame in each slot, and of every frame actually encoded
+            self.activity = ActivityDetector(width, height, self.fps)
+            self.slot_ticks = np.zeros(self.buffer_frames, dtype=np.int64)
+            self.frame_ticks = []
+        encoder = threading.Thread(target=self._encode_loop, name="recorder-encoder", daemon=True)
+        encoder.start()
 
         # Emit started signal when recording begins
-        self.started.emit()
+        self.started.emit(self.stats())
 
         self.recording = True
+        if self.stop_requested:
+            self.recording = False  # stop() ran before the loop started
         try:
             while self.recording:
-                img = pyautogui.screenshot()
-                frame = np.array(img)
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame = cv2.resize(frame, (screen_size.width, screen_size.height))
-
-                # Check for resolution mismatch
-                if frame.shape[1::-1] != (screen_size.width, screen_size.height):
-                    print("Frame size mismatch!")
-                    break
-
-                self.out.write(frame)
-                time.sleep(0.1)
+                self.pacer.wait()
+                tick = self.pacer.frame
+                if self.activity and not self.activity.should_sample(tick):
+                    continue  # idle: sample at the reduced rate
+                dropped = self.ring.dropped
+                slot = self.ring.acquire_write()
+                if slot is None:
+                    continue  # drop_newest: encoder is behind, skip this frame
+                frame = self.ring.frames[slot]
+                source.grab_into(frame)
+                if self.activity:
+                    if self.ring.dropped != dropped:
+                        # drop_oldest recycled a kept frame, so compare against nothing
+                        self.activity.have_reference = False
+                    if not self.activity.changed(frame):
+                        self.ring.discard(slot)
+                        continue
+                    self.slot_ticks[slot] = tick
+                self.ring.publish(slot)
         except Exception as e:
             print(f"Error during recording: {e}")
         finally:
-            self.out.release()
-            print(f"Recording finalized at {self.video_path}")
+            self.ring.close()
+            encoder.join()
+            if self.replay:
+                self.replay.close()
+            else:
+                self.out.release()
+                self._retime()
+            source.close()
+            stats = self.stats()
+            if self.replay:
+                print(f"Replay buffer stopped ({stats})")
+            else:
+                print(f"Recording finalized at {self.video_path} ({stats})")
 
             # Emit stopped signal when recording ends
-            self.stopped.emit()  # Emit stop signal when recording ends
+            self.stopped.emit(stats)  # Emit stop signal when recording ends
+
+    def _retime(self):
+        """Stretch each kept frame over the ticks that were skipped after it."""
+        ticks = self.frame_ticks
+        if not ticks or ticks[-1] - ticks[0] == len(ticks) - 1:
+            return  # every tick was encoded, the constant rate is already right
+        try:
+            if not retime_mp4_frames(self.video_path, ticks, self.pacer.frame + 1, self.ffmpeg_path):
+                print(f"Could not retime {self.video_path}; idle stretches will play back faster")
+        except Exception as e:
+            print(f"Error retiming {self.video_path}: {e}")
 
     def stop(self):
+        self.stop_requested = True
         self.recording = False
-        time.sleep(1)  # Allow pending writes to complete
-        if self.out and self.out.isOpened():
-            self.out.release()
-            print("VideoWriter released")
+        # run() drains the encoder and releases the VideoWriter before it returns
+        self.wait()
 
-    def generate_thumbnail(self):
+    def generate_thumbnail(self, ffmpeg_path=None):
         if not os.path.exists(self.video_path) or os.path.getsize(self.video_path) == 0:
             print(f"File {self.video_path} is invalid or incomplete.")
             return
 
-        try:
-            clip = VideoFileClip(self.video_path)
-            frame_time = min(1, clip.duration / 2)
-            frame = clip.get_frame(frame_time)
-            image = Image.fromarray(frame)
-            image.save(self.thumbnail_path)
+        # A single ffmpeg seek avoids decoding the whole clip just for one frame
+        ffmpeg_path = ffmpeg_path or self.ffmpeg_path
+        if extract_poster_frame(ffmpeg_path, self.video_path, self.thumbnail_path):
             print(f"Thumbnail generated at {self.thumbnail_path}")
-        except Exception as e:
-            print(f"Failed to generate thumbnail for {self.video_path}: {e}")
+        else:
+            print(f"Failed to generate thumbnail for {self.video_path}")
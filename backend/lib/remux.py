@@ -0,0 +1,335 @@
+import os
+import struct
+import subprocess
+
+import numpy as np
+
+
+def remux_faststart(ffmpeg_path, input_path, output_path=None):
+    """
+    Stream-copy a finished recording into an MP4 with the moov atom up front.
+
+    With +faststart the index sits before the media data, so a browser can
+    start playback and seek with range requests after fetching only the first
+    few kilobytes, however long the file is. No re-encode happens; the cost is
+    one sequential read and write of the file.
+
+    Args:
+        ffmpeg_path: ffmpeg binary to use
+        input_path: source recording (e.g. the .mkv written from the SRT stream)
+        output_path: destination, defaults to input_path with an .mp4 extension
+
+    Returns:
+        output_path on success, None if the streams could not be copied into MP4
+    """
+    output_path = output_path or os.path.splitext(input_path)[0] + '.mp4'
+    result = subprocess.run(
+        [ffmpeg_path,
+         '-hide_banner', '-loglevel', 'error', '-y',
+         '-i', input_path,
+         '-map', '0',
+         '-c', 'copy',
+         '-movflags', '+faststart',
+         output_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=600
+    )
+    if result.returncode != 0 or not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+        print(f"Failed to remux {input_path} to MP4: {result.stderr.decode(errors='ignore').strip()}")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return None
+    return output_path
+
+
+# Boxes on the path from the file root down to a track's sample table
+MP4_CONTAINERS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'edts'}
+
+
+def _mp4_boxes(data, start, end):
+    """Yield (type, start, end, header size) for each box in data[start:end]."""
+    while start < end:
+        size, box_type = struct.unpack_from('>I4s', data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        yield box_type, start, start + size, header
+        start += size
+
+
+def _file_boxes(f, file_size):
+    """Like _mp4_boxes for the top level of an open file, reading only the box headers."""
+    start = 0
+    while start + 8 <= file_size:
+        f.seek(start)
+        header_bytes = f.read(16)
+        size, box_type = struct.unpack_from('>I4s', header_bytes)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', header_bytes, 8)[0]
+            header = 16
+        elif size == 0:
+            size = file_size - start
+        if size < header:
+            raise ValueError(f"Invalid {box_type!r} box at offset {start}")
+        yield box_type, start, start + size, header
+        start += size
+
+
+def _set_duration(box, offset_v0, offset_v1, duration):
+    """Overwrite the duration field of a full box (32-bit in version 0, 64-bit in version 1)."""
+    if box[8] == 1:
+        struct.pack_into('>Q', box, offset_v1, duration)
+    else:
+        struct.pack_into('>I', box, offset_v0, min(duration, 0xFFFFFFFF))
+
+
+def _shift_chunk_offsets(moov, start, end, shift):
+    """Add shift to every chunk offset (stco/co64) under moov[start:end]."""
+    for box_type, box_start, box_end, header in _mp4_boxes(moov, start, end):
+        if box_type in MP4_CONTAINERS:
+            _shift_chunk_offsets(moov, box_start + header, box_end, shift)
+        elif box_type in (b'stco', b'co64'):
+            entries = struct.unpack_from('>I', moov, box_start + 12)[0]
+            dtype = '>u4' if box_type == b'stco' else '>u8'
+            table = np.frombuffer(moov, dtype=dtype, count=entries, offset=box_start + 16).astype(np.int64) + shift
+            moov[box_start + 16:box_start + 16 + table.size * np.dtype(dtype).itemsize] = table.astype(dtype).tobytes()
+
+
+# Bytes copied at a time when moov has to move in front of the media data
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def packet_times(ffmpeg_path, path):
+    """
+    Presentation timestamps and durations of the first video stream's packets,
+    as ffmpeg reads them back (stream copy to framemd5, nothing is decoded).
+
+    Returns:
+        (pts, durations) int64 arrays in presentation order, in the stream's time base
+    """
+    result = subprocess.run(
+        [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-i', path,
+         '-map', '0:v:0', '-c', 'copy', '-f', 'framemd5', '-'],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=600
+    )
+    if result.returncode != 0:
+        raise ValueError(result.stderr.decode(errors='ignore').strip() or f"ffmpeg exited with {result.returncode}")
+    rows = [line.split(',') for line in result.stdout.decode().splitlines() if line and not line.startswith('#')]
+    packets = np.array([[int(row[2]), int(row[3])] for row in rows], dtype=np.int64).reshape(-1, 2)
+    packets = packets[np.argsort(packets[:, 0], kind='stable')]
+    return packets[:, 0], packets[:, 1]
+
+
+def retime_mp4_frames(path, frame_ticks, end_tick, ffmpeg_path=None):
+    """
+    Give the frames of a constant-rate, single-track MP4 their real timestamps.
+
+    The recorder writes only frames that changed, back to back, so as written
+    every frame lasts one frame period. frame_ticks holds the capture tick
+    (frame period index) of each written frame; here each frame's duration
+    becomes the gap to the next one by rewriting the sample durations (stts)
+    and the durations in the movie, track, media and edit-list headers. Only
+    the moov box changes size: the samples are not touched and nothing is
+    re-encoded.
+
+    Only moov is read into memory, so memory use follows the frame count and
+    not the file size. The new moov is written in place when it fits (padded
+    with a free box) or when it sits after the media data; only a moov in
+    front of mdat that grows makes the rest of the file be copied, in chunks,
+    with the chunk offsets shifted to match.
+
+    With ffmpeg_path, the rewritten file is read back with ffmpeg and its
+    frame timestamps are checked against the capture ticks; if they don't
+    match, the original moov is put back, so a bad rewrite never costs the
+    recording.
+
+    Args:
+        path: MP4 written at one sample per tick
+        frame_ticks: increasing capture tick of every sample in the file
+        end_tick: tick at which the last frame stops being shown
+        ffmpeg_path: ffmpeg binary used to verify the result (optional)
+
+    Returns:
+        True if the file was rewritten, False if it does not have the expected
+        layout or the rewrite did not verify
+    """
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        try:
+            top = list(_file_boxes(f, file_size))
+        except (ValueError, struct.error) as e:
+            print(f"Could not retime {path}: {e}")
+            return False
+        boxes = {box_type: (start, end, header) for box_type, start, end, header in top}
+        if b'moov' not in boxes or b'mdat' not in boxes:
+            return False
+        moov_start, moov_end, moov_header = boxes[b'moov']
+        f.seek(moov_start)
+        data = f.read(moov_end - moov_start)
+    moov_first = moov_start < boxes[b'mdat'][0]
+    moov_last = top[-1][0] == b'moov'
+
+    ticks = np.asarray(frame_ticks, dtype=np.int64)
+    gaps = np.diff(np.append(ticks, max(end_tick, ticks[-1] + 1)))
+    state = {}
+
+    def rebuild(start, end):
+        """Rebuild the boxes in data[start:end], applying the edits on the way."""
+        out = bytearray()
+        for box_type, box_start, box_end, header in _mp4_boxes(data, start, end):
+            box = bytearray(data[box_start:box_end])
+            if box_type in MP4_CONTAINERS:
+                box = box[:header] + rebuild(box_start + header, box_end)
+            elif box_type == b'mvhd':
+                state['movie_timescale'] = struct.unpack_from('>I', box, 20 if box[8] == 0 else 28)[0]
+            elif box_type == b'mdhd':
+                state['media_timescale'] = struct.unpack_from('>I', box, 20 if box[8] == 0 else 28)[0]
+            elif box_type == b'stts':
+                entries = struct.unpack_from('>I', box, 12)[0]
+                if entries != 1 or struct.unpack_from('>I', box, 16)[0] != len(ticks):
+                    raise ValueError("stts does not describe one sample per tick")
+                period = struct.unpack_from('>I', box, 20)[0]
+                state['period'] = period
+                # Run-length encode the new per-sample durations
+                change = np.flatnonzero(np.diff(gaps)) + 1
+                starts = np.concatenate(([0], change))
+                counts = np.diff(np.append(starts, len(gaps)))
+                runs = np.empty((len(starts), 2), dtype='>u4')
+                runs[:, 0] = counts
+                runs[:, 1] = gaps[starts] * period
+                box = bytearray(struct.pack('>I4sII', 16 + runs.nbytes, b'stts', 0, len(runs))) + runs.tobytes()
+                state['media_duration'] = int(gaps.sum()) * period
+            if box_type in MP4_CONTAINERS or box_type == b'stts':
+                struct.pack_into('>I', box, 0, len(box))
+            out += box
+        return out
+
+    try:
+        moov = rebuild(moov_header, len(data))
+    except (ValueError, struct.error) as e:
+        print(f"Could not retime {path}: {e}")
+        return False
+    if 'media_duration' not in state:
+        return False
+    moov = bytearray(struct.pack('>I4s', 0, b'moov')) + moov
+    struct.pack_into('>I', moov, 0, len(moov))
+
+    # Durations live in boxes that come before stts was seen, so patch them in a second pass
+    seconds = state['media_duration'] / state['media_timescale']
+    movie_duration = round(seconds * state['movie_timescale'])
+
+    def patch(start, end):
+        for box_type, box_start, box_end, header in _mp4_boxes(moov, start, end):
+            if box_type in MP4_CONTAINERS:
+                patch(box_start + header, box_end)
+            elif box_type == b'mvhd':
+                _set_duration(moov, box_start + 24, box_start + 32, movie_duration)
+            elif box_type == b'tkhd':
+                _set_duration(moov, box_start + 28, box_start + 36, movie_duration)
+            elif box_type == b'mdhd':
+                _set_duration(moov, box_start + 24, box_start + 32, state['media_duration'])
+            elif box_type == b'elst':
+                view = memoryview(moov)[box_start:box_end]
+                if struct.unpack_from('>I', view, 12)[0] == 1:
+                    _set_duration(view, 16, 16, movie_duration)
+    patch(8, len(moov))
+
+    def verify(candidate):
+        """True when ffmpeg reads back one frame per tick at the retimed timestamps."""
+        if not ffmpeg_path:
+            return True
+        try:
+            pts, _ = packet_times(ffmpeg_path, candidate)
+        except (ValueError, OSError, subprocess.SubprocessError) as e:
+            print(f"Could not verify retimed {path}: {e}")
+            return False
+        # Timestamps are in the media timescale, as the stts durations are. The
+        # last frame's duration is left out: ffmpeg derives it from the movie
+        # duration, which is rounded to the coarser movie timescale
+        return len(pts) == len(ticks) and np.array_equal(np.diff(pts), gaps[:-1] * state['period'])
+
+    old_size = moov_end - moov_start
+    spare = old_size - len(moov)
+    if spare == 0 or spare >= 8 or moov_last or not moov_first:
+        with open(path, 'r+b') as f:
+            if spare == 0 or spare >= 8 or moov_last:
+                # Fits where the old moov was (the rest becomes a free box), or is
+                # the last box and may grow into the end of the file
+                f.seek(moov_start)
+                f.write(moov)
+                if moov_last:
+                    f.truncate()
+                elif spare:
+                    f.write(struct.pack('>I4s', spare, b'free'))
+            else:
+                # After the media data: append the new moov, then retire the old one.
+                # Until the retype lands the old moov is the one players find first
+                f.seek(file_size)
+                f.write(moov)
+                f.flush()
+                os.fsync(f.fileno())
+                f.seek(moov_start + 4)
+                f.write(b'free')
+        if verify(path):
+            return True
+        # Only moov (and what follows it) changed, so writing the old one back restores the file
+        print(f"Retimed {path} did not verify, restoring its original timing")
+        with open(path, 'r+b') as f:
+            f.seek(moov_start)
+            f.write(data)
+            f.truncate(file_size)
+        return False
+
+    # moov sits in front of the media data and grew: everything after it moves
+    _shift_chunk_offsets(moov, 8, len(moov), len(moov) - old_size)
+    temp_path = path + '.retime'
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        dst.write(src.read(moov_start))
+        dst.write(moov)
+        src.seek(moov_end)
+        for chunk in iter(lambda: src.read(COPY_CHUNK_SIZE), b''):
+            dst.write(chunk)
+    if not verify(temp_path):
+        print(f"Retimed {path} did not verify, keeping its original timing")
+        os.remove(temp_path)
+        return False
+    os.replace(temp_path, path)
+    return True
+
+
+if __name__ == '__main__':
+    # Round trip: write one frame per tick the way the recorder does, retime, and
+    # check the timestamps ffmpeg reads back, with moov at the end and up front
+    import sys
+    import tempfile
+
+    import cv2
+    import imageio_ffmpeg
+
+    ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+    ticks = np.array([0, 1, 2, 10, 11, 40, 41, 42, 90, 300])
+    with tempfile.TemporaryDirectory() as temp_dir:
+        written = os.path.join(temp_dir, 'written.mp4')
+        writer = cv2.VideoWriter(written, cv2.VideoWriter_fourcc(*'mp4v'), 30, (64, 48))
+        for i in range(len(ticks)):
+            writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+        writer.release()
+        faststart = remux_faststart(ffmpeg, written, os.path.join(temp_dir, 'faststart.mp4'))
+        failed = False
+        for layout, path in (('moov last', written), ('moov first', faststart)):
+            retimed = retime_mp4_frames(path, ticks, 301, ffmpeg)
+            pts, _ = packet_times(ffmpeg, path)
+            period = np.diff(pts).min() if len(pts) > 1 else 0
+            matches = bool(period) and np.array_equal((pts - pts[0]) // period, ticks - ticks[0])
+            print(f"{layout}: retimed={retimed} frames={len(pts)} timestamps match={matches}")
+            failed |= not (retimed and matches)
+    sys.exit(1 if failed else 0)
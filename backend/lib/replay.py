@@ -0,0 +1,256 @@
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import soundfile as sf
+
+# Seconds of history kept while replay mode is idling in the background
+REPLAY_SECONDS = int(os.getenv("REPLAY_SECONDS", "60"))
+# Hard cap on encoded video held in memory, whatever the bitrate turns out to be
+REPLAY_MAX_BYTES = int(os.getenv("REPLAY_MAX_BYTES", str(256 * 1024 * 1024)))
+# Capture rate and longest encoded edge; kept modest so the idle cost stays low
+REPLAY_FPS = int(os.getenv("REPLAY_FPS", "15"))
+REPLAY_MAX_DIMENSION = int(os.getenv("REPLAY_MAX_DIMENSION", "1280"))
+# Seconds per GOP; the replay window can only start on a GOP boundary
+REPLAY_KEYFRAME_SECONDS = 2
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+
+def keyframe_packet_offsets(packets):
+    """
+    Indices of the packets that start a keyframe in an (n, 188) uint8 array of
+    MPEG-TS packets: payload-unit start with the random-access indicator set
+    in the adaptation field. Vectorized so a whole read is scanned at once.
+    """
+    has_adaptation = (packets[:, 3] & 0x20) != 0
+    unit_start = (packets[:, 1] & 0x40) != 0
+    random_access = has_adaptation & (packets[:, 4] > 0) & ((packets[:, 5] & 0x40) != 0)
+    return np.flatnonzero(unit_start & random_access)
+
+
+class GopRing:
+    """
+    Rolling window of encoded MPEG-TS video, stored as whole GOPs.
+
+    Each GOP starts on a keyframe, so any suffix of the ring is independently
+    decodable. GOPs are evicted once the next one already covers the start of
+    the window, or when the byte cap is exceeded. PAT/PMT packets seen before
+    the first keyframe are kept as a header and prepended to every dump.
+    """
+
+    def __init__(self, seconds, max_bytes=REPLAY_MAX_BYTES):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.header = bytearray()
+        self.gops = deque()  # (monotonic start time, bytearray of packets)
+        self.bytes = 0
+        self.pending = b''
+        self.lock = threading.Lock()
+
+    def feed(self, data):
+        """Append raw encoder output; may end mid-packet."""
+        data = self.pending + data
+        usable = len(data) - len(data) % TS_PACKET_SIZE
+        self.pending = data[usable:]
+        if not usable:
+            return
+        packets = np.frombuffer(data, dtype=np.uint8, count=usable).reshape(-1, TS_PACKET_SIZE)
+        if packets[0, 0] != TS_SYNC_BYTE:
+            # Lost sync (should not happen on a pipe); drop up to the next sync byte
+            resync = data.find(bytes([TS_SYNC_BYTE]), 1)
+            self.pending = data[resync:] if resync > 0 else b''
+            return
+
+        now = time.monotonic()
+        keyframes = keyframe_packet_offsets(packets).tolist()
+        bounds = [0, *keyframes, len(packets)]
+        keyframes = set(keyframes)
+        with self.lock:
+            for start, end in zip(bounds, bounds[1:]):
+                if start == end:
+                    continue
+                chunk = data[start * TS_PACKET_SIZE:end * TS_PACKET_SIZE]
+                if start in keyframes:
+                    self.gops.append((now, bytearray()))
+                if self.gops:
+                    self.gops[-1][1].extend(chunk)
+                else:
+                    self.header.extend(chunk)
+                self.bytes += len(chunk)
+            self._evict(now)
+
+    def _evict(self, now):
+        while len(self.gops) > 1 and (self.gops[1][0] <= now - self.seconds or self.bytes > self.max_bytes):
+            _, dropped = self.gops.popleft()
+            self.bytes -= len(dropped)
+
+    def snapshot(self, seconds=None):
+        """
+        Copy out the last `seconds` (default: the whole window).
+
+        Returns:
+            (start time on the monotonic clock, MPEG-TS bytes), or (None, b'') if empty
+        """
+        seconds = seconds or self.seconds
+        with self.lock:
+            if not self.gops:
+                return None, b''
+            cutoff = time.monotonic() - seconds
+            gops = list(self.gops)
+            first = 0
+            for i, (start, _) in enumerate(gops):
+                if start <= cutoff:
+                    first = i
+            return gops[first][0], bytes(self.header) + b''.join(gop for _, gop in gops[first:])
+
+    def stats(self):
+        with self.lock:
+            return {
+                'buffered_seconds': round(time.monotonic() - self.gops[0][0], 1) if self.gops else 0.0,
+                'buffered_bytes': self.bytes,
+                'gops': len(self.gops),
+            }
+
+
+class ReplayEncoder:
+    """
+    Encodes raw BGR frames with ffmpeg (H.264, ultrafast) into a GopRing.
+
+    Frames go in on ffmpeg's stdin and MPEG-TS comes back on stdout, where a
+    reader thread splits it into GOPs. Nothing touches the disk until a replay
+    is saved.
+    """
+
+    def __init__(self, ffmpeg_path, width, height, fps, seconds, max_bytes=REPLAY_MAX_BYTES,
+                 max_dimension=REPLAY_MAX_DIMENSION):
+        self.ring = GopRing(seconds, max_bytes)
+        scale = f"scale='min({max_dimension},iw)':'min({max_dimension},ih)':force_original_aspect_ratio=decrease:force_divisible_by=2"
+        self.process = subprocess.Popen(
+            [ffmpeg_path,
+             '-hide_banner', '-loglevel', 'error',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', str(fps),
+             '-i', '-',
+             '-vf', scale,
+             '-c:v', 'libx264', '-preset', 'ultrafast', '-tune', 'zerolatency',
+             '-pix_fmt', 'yuv420p',
+             '-g', str(fps * REPLAY_KEYFRAME_SECONDS),
+             '-flush_packets', '1',
+             '-f', 'mpegts', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        self.reader = threading.Thread(target=self._read_loop, name="replay-reader", daemon=True)
+        self.reader.start()
+
+    def _read_loop(self):
+        while True:
+            data = self.process.stdout.read1(64 * 1024)
+            if not data:
+                return
+            self.ring.feed(data)
+
+    def write(self, frame):
+        """Hand one (height, width, 3) BGR frame to the encoder."""
+        try:
+            self.process.stdin.write(frame.data)
+        except (BrokenPipeError, ValueError):
+            pass  # encoder already gone; the ring keeps what it had
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.reader.join()
+
+
+class AudioHistory:
+    """
+    Fixed-size rolling history of PCM audio for replay mode.
+
+    Samples are stored as int16 in a preallocated circular buffer, so memory
+    is fixed at (seconds + one GOP) * samplerate * channels * 2 bytes.
+    """
+
+    def __init__(self, seconds, samplerate, channels):
+        self.samplerate = samplerate
+        # One extra GOP so the audio still reaches back to the keyframe the video dump starts on
+        self.capacity = int((seconds + REPLAY_KEYFRAME_SECONDS) * samplerate)
+        self.buffer = np.zeros((self.capacity, channels), dtype=np.int16)
+        self.total = 0
+        self.last_write = None
+        self.lock = threading.Lock()
+
+    def append(self, block):
+        """Append a float32 (frames, channels) block, overwriting the oldest audio."""
+        block = block[-self.capacity:]
+        frames = len(block)
+        with self.lock:
+            start = self.total % self.capacity
+            first = min(frames, self.capacity - start)
+            np.multiply(np.clip(block[:first], -1.0, 1.0), 32767, out=self.buffer[start:start + first], casting='unsafe')
+            np.multiply(np.clip(block[first:], -1.0, 1.0), 32767, out=self.buffer[:frames - first], casting='unsafe')
+            self.total += frames
+            self.last_write = time.monotonic()
+
+    def snapshot_since(self, start_time):
+        """Copy of the audio recorded since `start_time` (monotonic), oldest first."""
+        with self.lock:
+            if self.last_write is None:
+                return np.zeros((0, self.buffer.shape[1]), dtype=np.int16)
+            wanted = int((self.last_write - start_time) * self.samplerate)
+            frames = max(0, min(wanted, self.total, self.capacity))
+            end = self.total % self.capacity
+            indices = np.arange(end - frames, end) % self.capacity
+            return self.buffer[indices]
+
+
+def save_replay(ffmpeg_path, video_ring, output_path, audio_history=None, seconds=None):
+    """
+    Write the current replay window to `output_path` as a fast-start MP4.
+
+    The video is stream-copied out of the ring; audio covering the same span
+    is taken from the history and encoded to AAC in the same ffmpeg call.
+
+    Returns:
+        output_path, or None if nothing has been buffered yet
+    """
+    start_time, video = video_ring.snapshot(seconds)
+    if not video:
+        return None
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = os.path.join(workdir, 'replay.ts')
+        with open(video_path, 'wb') as f:
+            f.write(video)
+        command = [ffmpeg_path, '-hide_banner', '-loglevel', 'error', '-y', '-i', video_path]
+        maps = ['-map', '0:v']
+
+        audio = audio_history.snapshot_since(start_time) if audio_history else None
+        if audio is not None and len(audio):
+            audio_path = os.path.join(workdir, 'replay.wav')
+            sf.write(audio_path, audio, audio_history.samplerate, subtype='PCM_16')
+            command += ['-i', audio_path]
+            maps += ['-map', '1:a', '-c:a', 'aac', '-b:a', '128k']
+
+        result = subprocess.run(
+            command + maps + ['-c:v', 'copy', '-avoid_negative_ts', 'make_zero',
+                              '-movflags', '+faststart', output_path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=120
+        )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to save replay: {result.stderr.decode(errors='ignore').strip()}")
+    return output_path
@@ -0,0 +1,167 @@
+import bisect
+import random
+import threading
+from datetime import datetime, timezone
+
+from lib.dedup import CONTENT_REF_TAG
+
+SCREENSHOT_PREFIX = 'screenshot_'
+
+
+def is_screenshot_key(key, username):
+    """Screenshots sit directly under the user's prefix as screenshot_*."""
+    return key.startswith(f"{username}/{SCREENSHOT_PREFIX}") and key.count('/') == 1
+
+
+class ScreenshotIndex:
+    """
+    Per-user index of screenshot keys ordered by upload time.
+
+    Entries are kept in parallel lists sorted by timestamp, so the newest
+    screenshot is the last element (O(1)) and "anything taken before T" is a
+    prefix found by bisection (O(log n)); picking a random member of that
+    prefix is then a single index. A per-day count is kept alongside for
+    day-bucketed summaries. The index lives in memory: it is built from one
+    paginated listing the first time it is needed and then kept current by
+    the upload and delete routes, so lookups never list S3.
+
+    Deduplicated screenshots are zero-byte pointers; each entry carries the
+    key holding the bytes when it is known, and otherwise it is resolved from
+    the pointer's tags on first use.
+    """
+
+    def __init__(self, client, bucket, username):
+        self.client = client
+        self.bucket = bucket
+        self.username = username
+        self.times = None  # epoch seconds, ascending
+        self.keys = []
+        self.positions = {}  # key -> timestamp, for removal
+        self.content = {}  # pointer key -> key holding its bytes (None until resolved)
+        self.day_counts = {}
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.times is not None:
+            return
+        entries = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.username}/{SCREENSHOT_PREFIX}"):
+            for item in page.get('Contents', []):
+                if not is_screenshot_key(item['Key'], self.username):
+                    continue
+                entries.append((item['LastModified'].timestamp(), item['Key']))
+                if item['Size'] == 0:
+                    self.content[item['Key']] = None
+        entries.sort()
+        self.times = [timestamp for timestamp, _ in entries]
+        self.keys = [key for _, key in entries]
+        self.positions = {key: timestamp for timestamp, key in entries}
+        for timestamp in self.times:
+            self._count(timestamp, 1)
+
+    def _count(self, timestamp, delta):
+        day = datetime.fromtimestamp(timestamp, timezone.utc).date()
+        count = self.day_counts.get(day, 0) + delta
+        if count:
+            self.day_counts[day] = count
+        else:
+            self.day_counts.pop(day, None)
+
+    def add(self, key, content_key=None, timestamp=None):
+        """Record a screenshot uploaded now (or at `timestamp`); content_key for pointers."""
+        timestamp = timestamp if timestamp is not None else datetime.now(timezone.utc).timestamp()
+        with self.lock:
+            self._load()
+            if key in self.positions:
+                self._remove(key)
+            # New uploads are the newest entry, so this is almost always an append
+            position = bisect.bisect_right(self.times, timestamp)
+            self.times.insert(position, timestamp)
+            self.keys.insert(position, key)
+            self.positions[key] = timestamp
+            if content_key and content_key != key:
+                self.content[key] = content_key
+            self._count(timestamp, 1)
+
+    def _remove(self, key):
+        timestamp = self.positions.pop(key)
+        position = bisect.bisect_left(self.times, timestamp)
+        while self.keys[position] != key:
+            position += 1
+        del self.times[position]
+        del self.keys[position]
+        self.content.pop(key, None)
+        self._count(timestamp, -1)
+
+    def remove(self, key):
+        with self.lock:
+            if self.times is None or key not in self.positions:
+                return
+            self._remove(key)
+
+    def forget_content(self, content_key):
+        """The bytes of content_key moved (dedup promotion); resolve its pointers again."""
+        with self.lock:
+            for key, target in self.content.items():
+                if target == content_key:
+                    self.content[key] = None
+
+    def _content_key(self, key):
+        if key not in self.content:
+            return key
+        if self.content[key] is None:
+            response = self.client.get_object_tagging(Bucket=self.bucket, Key=key)
+            tags = {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+            self.content[key] = tags.get(CONTENT_REF_TAG, key)
+        return self.content[key]
+
+    def content_key(self, key):
+        """Key holding the bytes of a screenshot (itself unless it is a pointer)."""
+        with self.lock:
+            self._load()
+            return self._content_key(key)
+
+    def latest(self):
+        """(key, key holding its bytes) of the newest screenshot, or None."""
+        with self.lock:
+            self._load()
+            if not self.keys:
+                return None
+            key = self.keys[-1]
+            return key, self._content_key(key)
+
+    def random_before(self, timestamp, rng=random):
+        """(key, key holding its bytes) of a random screenshot taken at or before `timestamp`, or None."""
+        with self.lock:
+            self._load()
+            count = bisect.bisect_right(self.times, timestamp)
+            if not count:
+                return None
+            key = self.keys[rng.randrange(count)]
+            return key, self._content_key(key)
+
+    def days(self):
+        """{date: screenshot count}, oldest day first."""
+        with self.lock:
+            self._load()
+            return dict(sorted(self.day_counts.items()))
+
+    def __len__(self):
+        with self.lock:
+            self._load()
+            return len(self.keys)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_screenshot_index(client, bucket, username):
+    """Return the shared ScreenshotIndex for a user, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get((bucket, username))
+        if index is None:
+            index = ScreenshotIndex(client, bucket, username)
+            _indexes[(bucket, username)] = index
+        return index
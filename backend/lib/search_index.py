@@ -0,0 +1,660 @@
+import bisect
+import json
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from lib.dedup import CONTENT_REF_TAG
+from lib.thumbnails import is_thumbnail_key, thumbnail_key_for
+
+# Index changes are written back to S3 at most this often
+SEARCH_SAVE_SECONDS = float(os.getenv("SEARCH_SAVE_SECONDS", "5"))
+# Tag reads in flight while the index is first built
+SEARCH_LOAD_WORKERS = int(os.getenv("SEARCH_LOAD_WORKERS", "8"))
+SEARCH_MAX_LIMIT = 500
+# Fields a query can filter on
+SEARCH_FIELDS = ('app', 'with', 'type', 'session', 'date')
+TIMELINE_GRANULARITIES = ('day', 'hour')
+TIMELINE_MAX_BUCKETS = 200
+# Preferred kinds of capture to stand for a timeline bucket
+REPRESENTATIVE_TYPES = ('screenshot', 'video')
+
+MEDIA_TYPES = {
+    'video': ('mp4', 'mov', 'mkv'),
+    'audio': ('mp3', 'wav', 'flac', 'ogg'),
+    'screenshot': ('jpg', 'jpeg', 'png', 'webp', 'avif'),
+}
+
+
+def media_type_for(key):
+    """'video', 'audio', 'screenshot' or 'unknown', from the key's extension."""
+    extension = key.rsplit('.', 1)[-1].lower()
+    for media_type, extensions in MEDIA_TYPES.items():
+        if extension in extensions:
+            return media_type
+    return 'unknown'
+
+
+def _terms(value):
+    return value.strip().lower()
+
+
+def _companions(user_with):
+    """The '+'-separated list of people a capture was made with."""
+    return {_terms(name) for name in (user_with or '').split('+') if name.strip() and name.strip() != '0'}
+
+
+def bucket_bounds(bucket):
+    """
+    (start, end) timestamps of a timeline bucket in local time.
+
+    e.g. "2024-05-01" -> that whole day, "2024-05-01T14" -> 14:00 to 15:00
+    """
+    if 'T' in bucket:
+        start = datetime.strptime(bucket, '%Y-%m-%dT%H')
+        end = start + timedelta(hours=1)
+    else:
+        start = datetime.strptime(bucket, '%Y-%m-%d')
+        end = start + timedelta(days=1)
+    return start.astimezone().timestamp(), end.astimezone().timestamp()
+
+
+def _bucket_of(timestamp, granularity):
+    moment = datetime.fromtimestamp(timestamp)
+    return moment.strftime('%Y-%m-%dT%H') if granularity == 'hour' else moment.date().isoformat()
+
+
+def _parse_time(value):
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        # Session files store naive local times
+        moment = moment.astimezone()
+    return moment.timestamp()
+
+
+class SearchIndex:
+    """
+    Per-user inverted index over media metadata: app name, companions,
+    media type, capture date and the session a capture fell in.
+
+    Every media object gets an integer id; each field maps its (lowercased)
+    values to sets of ids, and a sorted copy of each field's values allows
+    prefix matching by bisection. A query intersects and unites those sets
+    and orders the survivors newest first with one NumPy argsort over their
+    timestamps, so it never touches S3.
+
+    Sessions have no id in the session file; a capture belongs to the
+    session (named by its start_timestamp) whose time window contains it.
+    Session postings are rebuilt from the time-ordered ids whenever the
+    session list changes.
+
+    The documents are persisted as {username}/SEARCH_{username}.json. On
+    first use that snapshot is reconciled with one paginated listing: keys
+    that appeared since are read from their tags (several at a time), keys
+    that are gone are dropped. That build runs on a background thread
+    without the lock; queries wait for it, while updates that arrive in the
+    meantime are queued and applied once it is done, so an upload never
+    waits on it. After that the upload, metadata and delete routes keep it
+    current, and writes are batched. A capture whose entry is replaced
+    reuses its old slot, so the document list only grows with the library.
+    """
+
+    def __init__(self, client, bucket, username, is_media, save_delay=SEARCH_SAVE_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.username = username
+        self.is_media = is_media
+        self.index_key = f"{username}/SEARCH_{username}.json"
+        self.session_key = f"{username}/SESSION_{username}.json"
+        self.save_delay = save_delay
+        self.docs = None  # id -> {'key', 'time', 'content_key', 'app_name', 'user_with', 'type'} or None
+        self.free_ids = []  # slots of deleted documents, reused by the next insert
+        self.ids = {}
+        self.times = np.zeros(0, dtype=np.float64)
+        self.postings = {field: {} for field in SEARCH_FIELDS}
+        self.values = {field: [] for field in SEARCH_FIELDS}
+        self.thumbnails = set()  # thumbnail keys that exist, so only real ones are linked
+        self.sessions = None
+        self.session_spans = []  # (start, end or None while active, session), oldest first
+        self.save_timer = None
+        self.lock = threading.Lock()
+        self.loader = None
+        self.loaded = threading.Event()
+        self.load_error = None
+        self.pending = []  # updates that arrived while the index was being built
+
+    # Loading and persistence
+
+    def start_loading(self):
+        """Start building the index in the background, unless it is built or being built."""
+        with self.lock:
+            self._start_loader()
+
+    def _start_loader(self):
+        """Caller holds the lock."""
+        if self.docs is not None or self.loader is not None:
+            return
+        self.loaded.clear()
+        self.loader = threading.Thread(target=self._build, name=f"search-index-{self.username}", daemon=True)
+        self.loader.start()
+
+    def _wait_loaded(self):
+        """Block until the documents are loaded. Call without the lock."""
+        self.start_loading()
+        self.loaded.wait()
+        if self.docs is None:
+            raise RuntimeError(f"Search index could not be loaded: {self.load_error}")
+
+    def _build(self):
+        """Read the snapshot, the listing and any missing tags off-lock, then install them."""
+        try:
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=self.index_key)
+                snapshot = json.loads(response["Body"].read().decode("utf-8"))
+            except self.client.exceptions.NoSuchKey:
+                snapshot = {}
+            listed = {}
+            thumbnails = set()
+            paginator = self.client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=f"{self.username}/"):
+                for item in page.get('Contents', []):
+                    if self.is_media(item['Key']):
+                        listed[item['Key']] = item['LastModified'].timestamp()
+                    elif is_thumbnail_key(item['Key']):
+                        thumbnails.add(item['Key'])
+            missing = [key for key in listed if key not in snapshot]
+            with ThreadPoolExecutor(max_workers=SEARCH_LOAD_WORKERS, thread_name_prefix='search-tags') as executor:
+                tags = dict(zip(missing, executor.map(self._read_tags, missing)))
+            sessions = self._fetch_sessions()
+        except Exception as e:
+            print(f"Warning: Could not build search index for {self.username}: {e}")
+            with self.lock:
+                self.load_error = e
+                self.loader = None
+                self.loaded.set()
+            return
+
+        with self.lock:
+            self.docs = []
+            self.times = np.zeros(max(1024, len(listed)), dtype=np.float64)
+            self.thumbnails |= thumbnails
+            for key, timestamp in listed.items():
+                self._insert(key, timestamp, snapshot[key] if key in snapshot else tags[key])
+            self.sessions = sessions
+            self._index_sessions()
+            pending, self.pending = self.pending, []
+            for apply in pending:
+                apply()
+            if missing or pending or len(snapshot) != len(listed):
+                self._schedule_save()
+            self.load_error = None
+            self.loader = None
+            self.loaded.set()
+
+    def _load(self):
+        """Re-read the session list if it changed. Caller holds the lock and has
+        waited for the documents (see _wait_loaded)."""
+        if self.sessions is None:
+            self._load_sessions()
+
+    def _defer(self, apply):
+        """Run apply() now if the index is built, otherwise once it is. Caller holds the lock."""
+        if self.docs is None:
+            self.pending.append(apply)
+            self._start_loader()
+            return
+        apply()
+
+    def _read_tags(self, key):
+        try:
+            response = self.client.get_object_tagging(Bucket=self.bucket, Key=key)
+            return {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])}
+        except Exception as e:
+            print(f"Warning: Could not read tags for {key}: {e}")
+            return {}
+
+    def _fetch_sessions(self):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.session_key)
+            sessions = json.loads(response["Body"].read().decode("utf-8"))
+        except self.client.exceptions.NoSuchKey:
+            sessions = []
+        return sessions if isinstance(sessions, list) else []
+
+    def _load_sessions(self):
+        self.sessions = self._fetch_sessions()
+        self._index_sessions()
+
+    def _schedule_save(self):
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """Write pending changes to S3 now."""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if self.docs is None:
+                return
+            body = json.dumps({
+                doc['key']: {
+                    CONTENT_REF_TAG: doc['content_key'],
+                    'app_name': doc['app_name'],
+                    'user_with': doc['user_with'],
+                }
+                for doc in self.docs if doc is not None
+            })
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.index_key,
+            Body=body,
+            ContentType="application/json",
+        )
+
+    # Postings
+
+    def _post(self, field, value, doc_id):
+        ids = self.postings[field].get(value)
+        if ids is None:
+            ids = self.postings[field][value] = set()
+            bisect.insort(self.values[field], value)
+        ids.add(doc_id)
+
+    def _unpost(self, field, value, doc_id):
+        ids = self.postings[field].get(value)
+        if ids is None:
+            return
+        ids.discard(doc_id)
+        if not ids:
+            del self.postings[field][value]
+            values = self.values[field]
+            del values[bisect.bisect_left(values, value)]
+
+    def _fields(self, doc):
+        if doc['app_name'].strip():
+            yield 'app', _terms(doc['app_name'])
+        for companion in _companions(doc['user_with']):
+            yield 'with', companion
+        yield 'type', doc['type']
+        # Local calendar day, as the diary shows it
+        yield 'date', datetime.fromtimestamp(doc['time']).date().isoformat()
+
+    def _insert(self, key, timestamp, tags):
+        doc = {
+            'key': key,
+            'time': timestamp,
+            'content_key': tags.get(CONTENT_REF_TAG) or key,
+            'app_name': tags.get('app_name', ''),
+            'user_with': tags.get('user_with', ''),
+            'type': media_type_for(key),
+        }
+        if self.free_ids:
+            doc_id = self.free_ids.pop()
+            self.docs[doc_id] = doc
+        else:
+            doc_id = len(self.docs)
+            self.docs.append(doc)
+        self.ids[key] = doc_id
+        if doc_id == len(self.times):
+            self.times = np.concatenate((self.times, np.zeros(len(self.times), dtype=np.float64)))
+        self.times[doc_id] = timestamp
+        for field, value in self._fields(doc):
+            self._post(field, value, doc_id)
+        return doc_id
+
+    def _delete(self, key):
+        doc_id = self.ids.pop(key, None)
+        if doc_id is None:
+            return None
+        doc = self.docs[doc_id]
+        for field, value in self._fields(doc):
+            self._unpost(field, value, doc_id)
+        for session_ids in self.postings['session'].values():
+            session_ids.discard(doc_id)
+        self.docs[doc_id] = None
+        self.free_ids.append(doc_id)
+        return doc
+
+    def _index_sessions(self):
+        """Assign every capture to the sessions whose time window contains it."""
+        self.postings['session'] = {}
+        self.values['session'] = []
+        self.session_spans = []
+        live = np.array([doc_id for doc_id, doc in enumerate(self.docs) if doc is not None], dtype=np.int64)
+        order = live[np.argsort(self.times[live], kind='stable')]
+        ordered_times = self.times[order]
+        now = datetime.now(timezone.utc).timestamp()
+        for session in self.sessions:
+            try:
+                start = _parse_time(session['start_timestamp'])
+                end = _parse_time(session['end_timestamp']) if session.get('end_timestamp') else None
+            except (KeyError, TypeError, ValueError):
+                continue
+            self.session_spans.append((start, end, session))
+            first = np.searchsorted(ordered_times, start, side='left')
+            last = np.searchsorted(ordered_times, end if end is not None else now, side='right')
+            self.postings['session'][session['start_timestamp']] = set(order[first:last].tolist())
+            bisect.insort(self.values['session'], session['start_timestamp'])
+        self.session_spans.sort(key=lambda span: span[0])
+
+    def _session_of(self, timestamp):
+        now = datetime.now(timezone.utc).timestamp()
+        for start, end, session in reversed(self.session_spans):
+            if start <= timestamp <= (end if end is not None else now):
+                return session['start_timestamp']
+        return None
+
+    # Updates from the routes
+
+    def add(self, key, tags, timestamp=None):
+        """Index a capture stored now (or at `timestamp`) with these tags."""
+        timestamp = timestamp if timestamp is not None else datetime.now(timezone.utc).timestamp()
+
+        def apply():
+            self._load()
+            self._delete(key)
+            doc_id = self._insert(key, timestamp, tags)
+            session = self._session_of(timestamp)
+            if session is not None:
+                self._post('session', session, doc_id)
+            self._schedule_save()
+
+        with self.lock:
+            self._defer(apply)
+
+    def update(self, key, tags):
+        """Tags of an indexed capture changed (only the given ones)."""
+        def apply():
+            self._load()
+            doc_id = self.ids.get(key)
+            if doc_id is None:
+                return
+            doc = self.docs[doc_id]
+            sessions = [value for value, ids in self.postings['session'].items() if doc_id in ids]
+            self._delete(key)
+            merged = {CONTENT_REF_TAG: doc['content_key'], 'app_name': doc['app_name'], 'user_with': doc['user_with']}
+            merged.update(tags)
+            # Takes the slot _delete just freed
+            doc_id = self._insert(key, doc['time'], merged)
+            for session in sessions:
+                self._post('session', session, doc_id)
+            self._schedule_save()
+
+        with self.lock:
+            self._defer(apply)
+
+    def remove(self, key):
+        def apply():
+            if self._delete(key) is not None:
+                self._schedule_save()
+
+        with self.lock:
+            # Nothing to do before a build has been asked for; it reads the listing
+            if self.docs is None and self.loader is None:
+                return
+            self._defer(apply)
+
+    def add_thumbnail(self, thumb_key):
+        """A thumbnail was stored (see lib.thumbnails)."""
+        with self.lock:
+            self.thumbnails.add(thumb_key)
+
+    def repoint(self, old_content_key, new_content_key):
+        """Deduplicated captures now find their bytes under a different key."""
+        def apply():
+            if thumbnail_key_for(old_content_key) in self.thumbnails:
+                self.thumbnails.add(thumbnail_key_for(new_content_key))
+            for doc in self.docs:
+                if doc is not None and doc['content_key'] == old_content_key:
+                    doc['content_key'] = new_content_key
+            self._schedule_save()
+
+        with self.lock:
+            if self.docs is None and self.loader is None:
+                return
+            self._defer(apply)
+
+    def sessions_changed(self):
+        """The session file was written; re-read it on the next query."""
+        with self.lock:
+            self.sessions = None
+
+    # Queries
+
+    def _match(self, field, term):
+        """Ids matching one term: exact, or a prefix when it ends in '*'."""
+        # Session names are timestamps, stored as written
+        term = term.strip() if field == 'session' else _terms(term)
+        if term.endswith('*'):
+            prefix = term[:-1]
+            values = self.values[field]
+            matched = set()
+            for value in values[bisect.bisect_left(values, prefix):]:
+                if not value.startswith(prefix):
+                    break
+                matched |= self.postings[field][value]
+            return matched
+        return self.postings[field].get(term, set())
+
+    def search(self, filters=None, date_from=None, date_to=None, offset=0, limit=50):
+        """
+        Captures matching every filter, newest first.
+
+        Args:
+            filters: {field: [terms]}. Terms of one field are OR-ed and fields
+                are AND-ed; a term starting with '-' excludes its matches, and
+                one ending in '*' matches by prefix. Session terms are session
+                start timestamps.
+            date_from, date_to: inclusive YYYY-MM-DD bounds
+            offset, limit: page of the ordered results
+
+        Returns:
+            (total matches, [document dicts])
+        """
+        self._wait_loaded()
+        with self.lock:
+            self._load()
+            result = self._matching(filters, date_from, date_to)
+            return len(result), self._page(result, offset, limit)
+
+    def keys(self, filters=None, date_from=None, date_to=None):
+        """Every key matching a query (see search()), newest first."""
+        self._wait_loaded()
+        with self.lock:
+            self._load()
+            ids = self._matching(filters, date_from, date_to)
+            ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+            return [self.docs[doc_id]['key'] for doc_id in ids[np.argsort(-self.times[ids], kind='stable')]]
+
+    def _matching(self, filters, date_from, date_to):
+        """Ids matching a query. Caller holds the lock."""
+        included, excluded = [], []
+        for field, terms in (filters or {}).items():
+            if field not in SEARCH_FIELDS:
+                raise ValueError(f"Unknown field: {field}")
+            include = [term for term in terms if not term.startswith('-')]
+            exclude = [term[1:] for term in terms if term.startswith('-')]
+            if include:
+                included.append(set().union(*(self._match(field, term) for term in include)))
+            if exclude:
+                excluded.append(set().union(*(self._match(field, term) for term in exclude)))
+        if date_from or date_to:
+            dates = self.values['date']
+            low = bisect.bisect_left(dates, date_from) if date_from else 0
+            high = bisect.bisect_right(dates, date_to) if date_to else len(dates)
+            included.append(set().union(*(self.postings['date'][date] for date in dates[low:high])))
+
+        # Narrowest sets first, so every later step works on fewer ids
+        included.sort(key=len)
+        if included:
+            result = included[0].intersection(*included[1:])
+        else:
+            result = self.ids.values()
+        if excluded:
+            result = set(result).difference(*excluded)
+        return result
+
+    def _page(self, ids, offset, limit):
+        """Documents offset..offset+limit of a set of ids ordered newest first."""
+        ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        limit = max(0, min(limit, SEARCH_MAX_LIMIT))
+        end = offset + limit
+        keys = -self.times[ids]
+        if end < len(ids):
+            # Only the requested page has to be fully ordered
+            ids = ids[np.argpartition(keys, end)[:end]]
+            keys = -self.times[ids]
+        order = ids[np.argsort(keys, kind='stable')]
+        return [self._describe(doc_id) for doc_id in order[offset:end]]
+
+    def _thumbnail_of(self, doc):
+        thumb_key = thumbnail_key_for(doc['content_key'])
+        return thumb_key if thumb_key in self.thumbnails else None
+
+    def _describe(self, doc_id):
+        doc = self.docs[doc_id]
+        sessions = [value for value, ids in self.postings['session'].items() if doc_id in ids]
+        return {
+            's3_key': doc['key'],
+            'content_key': doc['content_key'],
+            'thumbnail_key': self._thumbnail_of(doc),
+            'type': doc['type'],
+            'app_name': doc['app_name'],
+            'user_with': doc['user_with'],
+            'timestamp': datetime.fromtimestamp(doc['time'], timezone.utc).isoformat(),
+            'session': sessions[-1] if sessions else None,
+        }
+
+    def facets(self, field):
+        """{value: count} for one field, for filter pickers."""
+        self._wait_loaded()
+        with self.lock:
+            self._load()
+            return {value: len(self.postings[field][value]) for value in self.values[field]}
+
+    # Timeline
+
+    def timeline(self, granularity='day', cursor=None, date_from=None, date_to=None, limit=30):
+        """
+        Summaries of the day or hour buckets holding captures or session
+        starts, newest first, without any per-capture detail.
+
+        Days come straight from the date postings, so a page only looks at
+        the captures of the days it returns, however long the history.
+
+        Args:
+            granularity: 'day' or 'hour'
+            cursor: bucket the previous page ended with; this page starts just before it
+            date_from, date_to: inclusive YYYY-MM-DD bounds
+            limit: buckets per page
+
+        Returns:
+            ([bucket dicts], cursor for the next page or None)
+        """
+        if granularity not in TIMELINE_GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity}")
+        limit = max(1, min(limit, TIMELINE_MAX_BUCKETS))
+        self._wait_loaded()
+        with self.lock:
+            self._load()
+            session_buckets = {}
+            for start, _, session in self.session_spans:
+                session_buckets.setdefault(_bucket_of(start, granularity), []).append(session)
+            days = sorted(set(self.values['date']) | {bucket[:10] for bucket in session_buckets})
+            low = bisect.bisect_left(days, date_from) if date_from else 0
+            high = bisect.bisect_right(days, date_to) if date_to else len(days)
+            if cursor:
+                # An hour cursor can leave earlier hours of its day to come
+                high = min(high, bisect.bisect_right(days, cursor[:10]) if granularity == 'hour'
+                           else bisect.bisect_left(days, cursor))
+
+            buckets = []
+            for day in reversed(days[low:high]):
+                ids = self.postings['date'].get(day, set())
+                if granularity == 'day':
+                    groups = {day: ids}
+                else:
+                    groups = {bucket: set() for bucket in session_buckets if bucket.startswith(day)}
+                    for doc_id in ids:
+                        groups.setdefault(_bucket_of(self.times[doc_id], 'hour'), set()).add(doc_id)
+                for bucket in sorted(groups, reverse=True):
+                    if cursor and bucket >= cursor:
+                        continue
+                    if len(buckets) == limit:
+                        return buckets, buckets[-1]['bucket']
+                    buckets.append(self._summarize(bucket, groups[bucket]))
+            return buckets, None
+
+    def _summarize(self, bucket, ids):
+        start, end = bucket_bounds(bucket)
+        now = datetime.now(timezone.utc).timestamp()
+        docs = sorted((self.docs[doc_id] for doc_id in ids), key=lambda doc: doc['time'], reverse=True)
+        # Any screenshot can be rendered at tile size; a video only stands for
+        # the bucket when its poster frame exists
+        representative = None
+        for media_type in REPRESENTATIVE_TYPES:
+            representative = next((doc for doc in docs if doc['type'] == media_type
+                                   and (media_type == 'screenshot' or self._thumbnail_of(doc))), None)
+            if representative is not None:
+                break
+        sessions = [
+            session for session_start, session_end, session in self.session_spans
+            if session_start < end and (session_end if session_end is not None else now) >= start
+        ]
+        return {
+            'bucket': bucket,
+            'start': datetime.fromtimestamp(start, timezone.utc).isoformat(),
+            'end': datetime.fromtimestamp(end, timezone.utc).isoformat(),
+            'count': len(docs),
+            'counts': dict(Counter(doc['type'] for doc in docs)),
+            'representative_key': representative['content_key'] if representative else None,
+            'representative_type': representative['type'] if representative else None,
+            'thumbnail_key': self._thumbnail_of(representative) if representative else None,
+            'sessions': sessions,
+        }
+
+    def bucket_items(self, bucket, offset=0, limit=50):
+        """
+        Captures of one timeline bucket, newest first.
+
+        Returns:
+            (total, [document dicts])
+        """
+        start, end = bucket_bounds(bucket)
+        self._wait_loaded()
+        with self.lock:
+            self._load()
+            ids = self.postings['date'].get(bucket[:10], set())
+            if 'T' in bucket:
+                ids = {doc_id for doc_id in ids if start <= self.times[doc_id] < end}
+            return len(ids), self._page(ids, offset, limit)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(client, bucket, username, is_media):
+    """Return the shared SearchIndex for a user, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get((bucket, username))
+        if index is None:
+            index = SearchIndex(client, bucket, username, is_media)
+            _indexes[(bucket, username)] = index
+        return index
+
+
+def flush_search_indexes():
+    """Write every index with pending changes; called on shutdown."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        if index.save_timer is not None:
+            index.flush()
@@ -0,0 +1,165 @@
+import os
+
+import numpy as np
+import soundfile as sf
+
+# Compress long silences in audio captures before they are stored. Off unless
+# asked for: the silence that is cut can't be recovered from the stored file
+AUDIO_SILENCE_TRIM = os.getenv("AUDIO_SILENCE_TRIM", "0").lower() in ("1", "true", "yes")
+# A 20 ms window is silent when its RMS level is below this (dBFS)
+AUDIO_SILENCE_THRESHOLD_DB = float(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-50"))
+# Silences shorter than this are left untouched (pauses in speech, between rounds)
+AUDIO_SILENCE_MIN_SECONDS = float(os.getenv("AUDIO_SILENCE_MIN_SECONDS", "2.0"))
+# How much of a long silence survives, split between its start and its end
+AUDIO_SILENCE_KEEP_SECONDS = float(os.getenv("AUDIO_SILENCE_KEEP_SECONDS", "0.5"))
+SILENCE_WINDOW_MS = 20
+SILENCE_BLOCK_FRAMES = 1 << 16
+
+
+class SilenceTrimmer:
+    """
+    Streaming silence compressor for (frames, channels) float audio blocks.
+
+    Audio is cut into fixed windows whose RMS level is computed for a whole
+    block at once; consecutive windows with the same silent/voiced state are
+    handled as one run. A silence is held back until it either ends (and is
+    passed through unchanged) or reaches min_silence, at which point only
+    keep_silence of it is kept: half from its start and half from just before
+    the next voiced audio. The delay this adds is bounded by min_silence.
+
+    Voiced regions are recorded on the source timeline, each with the offset
+    it ended up at in the trimmed output, so playback positions can be mapped
+    back to when things actually happened.
+    """
+
+    def __init__(self, samplerate, channels, threshold_db=AUDIO_SILENCE_THRESHOLD_DB,
+                 min_silence=AUDIO_SILENCE_MIN_SECONDS, keep_silence=AUDIO_SILENCE_KEEP_SECONDS,
+                 window_ms=SILENCE_WINDOW_MS):
+        self.samplerate = samplerate
+        self.channels = channels
+        self.window = max(1, int(samplerate * window_ms / 1000))
+        self.threshold = 10 ** (threshold_db / 20)
+        self.min_frames = max(1, round(min_silence * 1000 / window_ms)) * self.window
+        keep_frames = min(round(keep_silence * 1000 / window_ms) * self.window, self.min_frames)
+        self.head_frames = keep_frames // 2
+        self.tail_frames = keep_frames - self.head_frames
+        self.carry = np.zeros((0, channels), dtype=np.float32)
+        self.pending = self.carry
+        self.trimming = False
+        self.frames_in = 0
+        self.frames_out = 0
+        self.regions = []
+        self.region_start = None
+        self.region_offset = 0
+
+    def feed(self, block, sink):
+        """Analyze a block and pass whatever survives trimming to sink()."""
+        data = np.concatenate((self.carry, block)) if len(self.carry) else block
+        whole = len(data) - len(data) % self.window
+        self.carry = np.array(data[whole:], dtype=np.float32)
+        if whole:
+            self._handle(self._runs(data[:whole]), sink)
+
+    def _runs(self, data):
+        """Split whole windows of audio into (frames, silent) runs of equal state."""
+        windows = len(data) // self.window
+        levels = np.sqrt(np.mean(np.square(data.reshape(windows, -1)), axis=1))
+        silent = levels < self.threshold
+        bounds = np.flatnonzero(silent[1:] != silent[:-1]) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [windows]))
+        return [(data[s * self.window:e * self.window], bool(silent[s])) for s, e in zip(starts, ends)]
+
+    def _handle(self, runs, sink):
+        for run, silent in runs:
+            if silent:
+                self._silence(run, sink)
+            else:
+                self._voice(run, sink)
+            self.frames_in += len(run)
+
+    def _emit(self, frames, sink):
+        if len(frames):
+            sink(frames)
+            self.frames_out += len(frames)
+
+    def _voice(self, run, sink):
+        if self.trimming:
+            self._emit(self.pending[len(self.pending) - self.tail_frames:], sink)
+            self.trimming = False
+        else:
+            self._emit(self.pending, sink)
+        self.pending = self.pending[:0]
+        if self.region_start is None:
+            self.region_start = self.frames_in
+            self.region_offset = self.frames_out
+        self._emit(run, sink)
+
+    def _silence(self, run, sink):
+        pending = np.concatenate((self.pending, run))
+        if self.trimming:
+            # Only what could still become the tail is worth keeping
+            self.pending = pending[len(pending) - self.tail_frames:]
+            return
+        self.pending = pending
+        if len(pending) >= self.min_frames:
+            self._emit(pending[:self.head_frames], sink)
+            self._close_region(self.frames_in + len(run) - len(pending))
+            self.pending = pending[len(pending) - self.tail_frames:]
+            self.trimming = True
+
+    def _close_region(self, end):
+        if self.region_start is not None:
+            self.regions.append({
+                'start': round(self.region_start / self.samplerate, 2),
+                'end': round(end / self.samplerate, 2),
+                'offset': round(self.region_offset / self.samplerate, 2),
+            })
+            self.region_start = None
+
+    def close(self, sink):
+        """Flush the last partial window; a silence still being trimmed is dropped."""
+        if len(self.carry):
+            carry, self.carry = self.carry, self.carry[:0]
+            self._handle([(carry, bool(np.sqrt(np.mean(np.square(carry))) < self.threshold))], sink)
+        if not self.trimming:
+            self._emit(self.pending, sink)
+        self.pending = self.pending[:0]
+        self._close_region(self.frames_in)
+
+    def timeline(self):
+        """Voiced regions plus how much audio went in and came out."""
+        return {
+            'regions': self.regions,
+            'source_seconds': round(self.frames_in / self.samplerate, 2),
+            'stored_seconds': round(self.frames_out / self.samplerate, 2),
+        }
+
+
+def trim_silence_file(source, output_path, **options):
+    """
+    Write a copy of an audio file with long silences compressed.
+
+    The copy keeps the source's format and subtype and is produced block by
+    block, so memory use does not depend on the length of the capture.
+
+    Args:
+        source: path or seekable file object of any format soundfile reads
+        output_path: where to write the trimmed copy
+        **options: overrides for SilenceTrimmer (threshold_db, min_silence, keep_silence)
+
+    Returns:
+        the trimmer's timeline()
+    """
+    if not isinstance(source, str):
+        source.seek(0)
+    info = sf.info(source)
+    if not isinstance(source, str):
+        source.seek(0)
+    trimmer = SilenceTrimmer(info.samplerate, info.channels, **options)
+    with sf.SoundFile(output_path, 'w', samplerate=info.samplerate, channels=info.channels,
+                      format=info.format, subtype=info.subtype) as out:
+        for block in sf.blocks(source, blocksize=SILENCE_BLOCK_FRAMES, dtype='float32', always_2d=True):
+            trimmer.feed(block, out.write)
+        trimmer.close(out.write)
+    return trimmer.timeline()
@@ -0,0 +1,281 @@
+import io
+import json
+import os
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Tag holding a screenshot's perceptual hash (16 hex digits)
+PHASH_TAG = 'phash'
+# Hashes within this many differing bits count as the same moment
+SIMILAR_MAX_DISTANCE = int(os.getenv("SIMILAR_MAX_DISTANCE", "10"))
+DUPLICATE_MAX_DISTANCE = int(os.getenv("DUPLICATE_MAX_DISTANCE", "4"))
+# Index changes are written back to S3 at most this often
+PHASH_SAVE_SECONDS = float(os.getenv("PHASH_SAVE_SECONDS", "5"))
+PHASH_SIZE = 32
+PHASH_LOW = 8
+# Rows compared per step of the all-pairs scan used for very loose duplicate thresholds
+CLUSTER_BLOCK = 256
+
+
+def _dct_matrix(size):
+    n = np.arange(size)
+    matrix = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+DCT_MATRIX = _dct_matrix(PHASH_SIZE)
+BIT_WEIGHTS = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+# Per-byte popcounts, for NumPy builds without np.bitwise_count
+POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def perceptual_hash(data):
+    """
+    64-bit pHash of an image, as 16 hex digits. Runs inside an encoder worker process.
+
+    The image is reduced to 32x32 grayscale and transformed with a 2-D DCT;
+    each bit says whether one of the 8x8 lowest frequencies (skipping the DC
+    term) is above their median. Re-encoding, rescaling and small edits
+    barely move those frequencies, so near-identical screenshots land a few
+    bits apart.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft('L', (PHASH_SIZE * 4, PHASH_SIZE * 4))
+        pixels = np.asarray(image.convert('L').resize((PHASH_SIZE, PHASH_SIZE), Image.BOX), dtype=np.float64)
+    low = (DCT_MATRIX @ pixels @ DCT_MATRIX.T)[:PHASH_LOW, :PHASH_LOW].ravel()
+    bits = low > np.median(low[1:])
+    return f"{int(np.sum(BIT_WEIGHTS[bits], dtype=np.uint64)):016x}"
+
+
+def popcount(values):
+    """Set bits of every uint64 in an array of any shape."""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    values = np.ascontiguousarray(values)
+    return POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8)
+
+
+def hamming(hashes, value):
+    """Bit distance from every uint64 in `hashes` to `value`."""
+    return popcount(np.bitwise_xor(hashes, np.uint64(value)))
+
+
+def near_pairs(hashes, max_distance):
+    """
+    Index pairs (i < j) of distinct hashes at most max_distance bits apart.
+
+    Split into max_distance + 1 bit ranges, two hashes that close must agree
+    exactly on at least one range (pigeonhole). So for each range the hashes
+    are sorted by that range's bits and only neighbours sharing it are
+    compared, one vectorized pass per offset, instead of all n^2 pairs.
+    Thresholds too loose for ranges of 4+ bits fall back to a blocked scan.
+    """
+    count = len(hashes)
+    found_i, found_j = [], []
+    chunks = max_distance + 1
+    if 64 // chunks >= 4:
+        edges = [64 * k // chunks for k in range(chunks + 1)]
+        for low, high in zip(edges[:-1], edges[1:]):
+            values = (hashes >> np.uint64(low)) & np.uint64((1 << (high - low)) - 1)
+            order = np.argsort(values, kind='stable')
+            ordered = values[order]
+            for offset in range(1, count):
+                same = ordered[offset:] == ordered[:-offset]
+                if not same.any():
+                    break
+                i, j = order[:-offset][same], order[offset:][same]
+                close = popcount(hashes[i] ^ hashes[j]) <= max_distance
+                found_i.append(np.minimum(i[close], j[close]))
+                found_j.append(np.maximum(i[close], j[close]))
+    else:
+        for start in range(0, count, CLUSTER_BLOCK):
+            block = hashes[start:start + CLUSTER_BLOCK]
+            rows, columns = np.nonzero(popcount(block[:, None] ^ hashes[None, start:]) <= max_distance)
+            above = rows + start < columns + start
+            found_i.append(rows[above] + start)
+            found_j.append(columns[above] + start)
+    if not found_i:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # A pair agreeing on several ranges is found once per range
+    pairs = np.unique(np.stack((np.concatenate(found_i), np.concatenate(found_j)), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class SimilarityIndex:
+    """
+    Per-user perceptual hashes of screenshots, for "similar moments" and
+    duplicate reports.
+
+    Hashes sit in one contiguous uint64 array (rows freed by deletes are
+    filled by the last row), so a query is a single vectorized XOR and
+    popcount over every screenshot. The key -> hash map is persisted as
+    {username}/PHASHES_{username}.json next to the content hash index; the
+    hash is also written as a tag on each screenshot. Writes are batched so
+    a burst of uploads costs one save.
+    """
+
+    def __init__(self, client, bucket, username, save_delay=PHASH_SAVE_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.username = username
+        self.index_key = f"{username}/PHASHES_{username}.json"
+        self.save_delay = save_delay
+        self.keys = None
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.rows = {}
+        self.save_timer = None
+        self.clusters_cache = {}
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.keys is not None:
+            return
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self.index_key)
+            data = json.loads(response["Body"].read().decode("utf-8"))
+        except self.client.exceptions.NoSuchKey:
+            data = {}
+        self.keys = list(data)
+        self.hashes = np.zeros(max(16, len(self.keys) * 2), dtype=np.uint64)
+        self.hashes[:len(self.keys)] = [int(value, 16) for value in data.values()]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+
+    def _changed(self):
+        self.clusters_cache = {}
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(self.save_delay, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        """Write pending changes to S3 now."""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            if self.keys is None:
+                return
+            body = json.dumps({key: f"{int(value):016x}" for key, value in zip(self.keys, self.hashes)})
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self.index_key,
+            Body=body,
+            ContentType="application/json",
+        )
+
+    def add(self, key, value):
+        """Record the hash (hex) of a screenshot."""
+        with self.lock:
+            self._load()
+            row = self.rows.get(key)
+            if row is None:
+                row = len(self.keys)
+                if row == len(self.hashes):
+                    self.hashes = np.concatenate((self.hashes, np.zeros(len(self.hashes), dtype=np.uint64)))
+                self.keys.append(key)
+                self.rows[key] = row
+            self.hashes[row] = int(value, 16)
+            self._changed()
+
+    def remove(self, key):
+        with self.lock:
+            self._load()
+            row = self.rows.pop(key, None)
+            if row is None:
+                return
+            last = len(self.keys) - 1
+            if row != last:
+                self.keys[row] = self.keys[last]
+                self.hashes[row] = self.hashes[last]
+                self.rows[self.keys[row]] = row
+            self.keys.pop()
+            self._changed()
+
+    def get(self, key):
+        """Hash (hex) of a screenshot, or None if it has none."""
+        with self.lock:
+            self._load()
+            row = self.rows.get(key)
+            return None if row is None else f"{int(self.hashes[row]):016x}"
+
+    def similar(self, key, max_distance=SIMILAR_MAX_DISTANCE, limit=50):
+        """
+        Screenshots within max_distance bits of key, closest first.
+
+        Returns:
+            [(key, distance)], or None when key has no hash
+        """
+        with self.lock:
+            self._load()
+            row = self.rows.get(key)
+            if row is None:
+                return None
+            distances = hamming(self.hashes[:len(self.keys)], self.hashes[row])
+            distances[row] = 255
+            matches = np.flatnonzero(distances <= max_distance)
+            order = matches[np.argsort(distances[matches], kind='stable')][:limit]
+            return [(self.keys[i], int(distances[i])) for i in order]
+
+    def clusters(self, max_distance=DUPLICATE_MAX_DISTANCE):
+        """
+        Groups of screenshots that are near-duplicates of each other (connected
+        through pairs within max_distance bits), largest group first.
+
+        Identical hashes are merged first and near_pairs() finds the close
+        distinct ones; the result is cached until the index next changes.
+        """
+        with self.lock:
+            self._load()
+            if max_distance in self.clusters_cache:
+                return self.clusters_cache[max_distance]
+            distinct, members = np.unique(self.hashes[:len(self.keys)], return_inverse=True)
+            parents = np.arange(len(distinct))
+
+            def find(i):
+                while parents[i] != i:
+                    parents[i] = parents[parents[i]]
+                    i = parents[i]
+                return i
+
+            for a, b in zip(*near_pairs(distinct, max_distance)):
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    parents[root_b] = root_a
+
+            groups = {}
+            for key, member in zip(self.keys, members):
+                groups.setdefault(find(member), []).append(key)
+            result = sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+            self.clusters_cache[max_distance] = result
+            return result
+
+    def __len__(self):
+        with self.lock:
+            self._load()
+            return len(self.keys)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_similarity_index(client, bucket, username):
+    """Return the shared SimilarityIndex for a user, creating it on first use."""
+    with _indexes_lock:
+        index = _indexes.get((bucket, username))
+        if index is None:
+            index = SimilarityIndex(client, bucket, username)
+            _indexes[(bucket, username)] = index
+        return index
+
+
+def flush_similarity_indexes():
+    """Write every index with pending changes; called on shutdown."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        if index.save_timer is not None:
+            index.flush()
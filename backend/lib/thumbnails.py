@@ -0,0 +1,59 @@
+import os
+import subprocess
+
+# Longest edge of gallery tiles, in pixels
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "320"))
+THUMBNAIL_QUALITY = 70
+# Thumbnails are always JPEG so their key can be derived from the media key alone
+THUMBNAIL_EXTENSION = 'jpg'
+THUMBNAIL_PREFIX = 'thumbnails'
+
+
+def thumbnail_key_for(key):
+    """
+    Map a media key to the key of its thumbnail under the parallel prefix.
+
+    e.g. "alice/recordings/recording_1.mkv" -> "alice/thumbnails/recordings/recording_1.jpg"
+         "alice/screenshot_1.webp"          -> "alice/thumbnails/screenshot_1.jpg"
+    """
+    username, _, rest = key.partition('/')
+    base = os.path.splitext(rest)[0]
+    return f"{username}/{THUMBNAIL_PREFIX}/{base}.{THUMBNAIL_EXTENSION}"
+
+
+def is_thumbnail_key(key):
+    parts = key.split('/')
+    return len(parts) > 2 and parts[1] == THUMBNAIL_PREFIX
+
+
+def extract_poster_frame(ffmpeg_path, video_path, output_path, seek_seconds=1.0, size=THUMBNAIL_SIZE):
+    """
+    Grab a single scaled frame from a video with one input-side seek.
+
+    Seeking before -i lets ffmpeg jump to the nearest keyframe instead of
+    decoding from the start, so the cost is independent of clip length.
+    Clips shorter than the seek point are retried from the first frame.
+
+    Returns:
+        output_path on success, None otherwise
+    """
+    scale = f"scale='if(gt(iw,ih),{size},-2)':'if(gt(iw,ih),-2,{size})'"
+    for seek in (seek_seconds, 0):
+        result = subprocess.run(
+            [ffmpeg_path,
+             '-hide_banner', '-loglevel', 'error', '-y',
+             '-ss', str(seek),
+             '-i', video_path,
+             '-frames:v', '1',
+             '-vf', scale,
+             '-q:v', '5',
+             output_path],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=30
+        )
+        if result.returncode == 0 and os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+            return output_path
+    print(f"Failed to extract poster frame from {video_path}: {result.stderr.decode(errors='ignore').strip()}")
+    return None
@@ -0,0 +1,118 @@
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+# Screenshot encodings selectable through SCREENSHOT_FORMAT (jpeg is also used for thumbnails).
+# Each maps to (Pillow format, file extension, extra save options).
+SCREENSHOT_FORMATS = {
+    'original': None,
+    'webp_lossless': ('WEBP', 'webp', {'lossless': True, 'method': 4}),
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'avif': ('AVIF', 'avif', {'speed': 8}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True}),
+}
+
+# Screenshots are stored as captured unless a format is chosen; any other format
+# routes screenshot uploads through the backend so they can be re-encoded
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "original").lower()
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "80"))
+# Longest edge in pixels; 0 keeps the captured resolution
+SCREENSHOT_MAX_DIMENSION = int(os.getenv("SCREENSHOT_MAX_DIMENSION", "0"))
+ENCODER_WORKERS = int(os.getenv("SCREENSHOT_ENCODER_WORKERS", "2"))
+
+
+def avif_supported():
+    """AVIF needs Pillow built with libavif (Pillow >= 11.2) or the pillow-avif-plugin package."""
+    if 'AVIF' in Image.SAVE:
+        return True
+    try:
+        import pillow_avif  # noqa: F401  (registers the AVIF plugin)
+        return 'AVIF' in Image.SAVE
+    except ImportError:
+        return False
+
+
+def transcoding_enabled(fmt=None):
+    fmt = fmt or SCREENSHOT_FORMAT
+    return SCREENSHOT_FORMATS.get(fmt) is not None
+
+
+def output_extension(fmt=None):
+    """Extension a screenshot will be stored with after transcoding, or None if kept as-is."""
+    fmt = (fmt or SCREENSHOT_FORMAT).lower()
+    if not transcoding_enabled(fmt):
+        return None
+    if fmt == 'avif' and not avif_supported():
+        fmt = 'webp'
+    return SCREENSHOT_FORMATS[fmt][1]
+
+
+def encode_image(data, fmt, quality, max_dimension):
+    """
+    Re-encode an image held in memory. Runs inside an encoder worker process.
+
+    Args:
+        data: the original image bytes
+        fmt: a key of SCREENSHOT_FORMATS
+        quality: 1-100 quality for lossy formats
+        max_dimension: longest edge in pixels, 0 to keep the original size
+
+    Returns:
+        (encoded bytes, file extension without the dot)
+    """
+    if fmt == 'avif' and not avif_supported():
+        print("AVIF encoder not available, falling back to WebP")
+        fmt = 'webp'
+    pil_format, extension, options = SCREENSHOT_FORMATS[fmt]
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        if max_dimension and max(image.size) > max_dimension:
+            image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if pil_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        save_options = dict(options)
+        if not save_options.get('lossless'):
+            save_options['quality'] = quality
+
+        output = io.BytesIO()
+        image.save(output, format=pil_format, **save_options)
+        return output.getvalue(), extension
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_encoder_pool():
+    """Lazily start the shared encoder process pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ENCODER_WORKERS)
+        return _pool
+
+
+def transcode_screenshot(data, fmt=None, quality=None, max_dimension=None):
+    """
+    Encode a screenshot in the worker pool using the configured (or given) settings.
+
+    The request thread only waits on the future; the encode itself runs in
+    another process, so it neither holds the GIL nor stalls other requests.
+
+    Returns:
+        (bytes, extension), or (data, None) when transcoding is disabled
+    """
+    fmt = (fmt or SCREENSHOT_FORMAT).lower()
+    if not transcoding_enabled(fmt):
+        return data, None
+    quality = SCREENSHOT_QUALITY if quality is None else quality
+    max_dimension = SCREENSHOT_MAX_DIMENSION if max_dimension is None else max_dimension
+    future = get_encoder_pool().submit(encode_image, data, fmt, quality, max_dimension)
+    return future.result()
@@ -0,0 +1,263 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Priority classes: lower runs first, and transfers yield to any active lower class
+PRIORITY_SCREENSHOT = 0
+PRIORITY_AUDIO = 1
+PRIORITY_RECORDING = 2
+
+# Global uplink cap in bytes/s (0 = unlimited) and the cap applied while a recording is live
+UPLOAD_MAX_BYTES_PER_SEC = int(os.getenv("UPLOAD_MAX_BYTES_PER_SEC", "0"))
+UPLOAD_RECORDING_BYTES_PER_SEC = int(os.getenv("UPLOAD_RECORDING_BYTES_PER_SEC", str(256 * 1024)))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "2"))
+# Workers for follow-up jobs that upload nothing themselves (hashes, waveforms)
+UPLOAD_TASK_WORKERS = int(os.getenv("UPLOAD_TASK_WORKERS", "2"))
+
+THROUGHPUT_WINDOW_SECONDS = 5.0
+# Progress of a running job is reported at most this often
+PROGRESS_INTERVAL_SECONDS = 0.5
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class TokenBucket:
+    """Byte-rate limiter whose rate is re-evaluated on every acquire."""
+
+    def __init__(self, rate_fn, burst_seconds=0.25):
+        self.rate_fn = rate_fn
+        self.burst_seconds = burst_seconds
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, n):
+        while True:
+            rate = self.rate_fn()
+            if rate <= 0:
+                return
+            with self.lock:
+                now = time.monotonic()
+                capacity = max(rate * self.burst_seconds, READ_BLOCK_SIZE)
+                self.tokens = min(capacity, self.tokens + (now - self.last) * rate)
+                self.last = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / rate
+            time.sleep(min(wait, 0.25))
+
+
+class ThrottledReader:
+    """
+    File-like wrapper that meters reads through the scheduler.
+
+    requests/http.client stream any object with read(), so wrapping the body
+    is enough to pace an upload without buffering it.
+    """
+
+    def __init__(self, scheduler, job, fileobj, size):
+        self.scheduler = scheduler
+        self.job = job
+        self.fileobj = fileobj
+        self.remaining = size
+
+    def __len__(self):
+        return self.remaining
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            # Read-to-end still goes through the limiter, one block at a time
+            return b''.join(iter(lambda: self.read(READ_BLOCK_SIZE), b''))
+        n = min(n, READ_BLOCK_SIZE)
+        self.scheduler._wait_for_turn(self.job['priority'])
+        self.scheduler.bucket.acquire(n)
+        if self.job['priority'] >= PRIORITY_RECORDING:
+            self.scheduler.bulk_bucket.acquire(n)
+        chunk = self.fileobj.read(n)
+        self.remaining -= len(chunk)
+        self.scheduler._record(self.job, len(chunk))
+        return chunk
+
+
+class UploadScheduler:
+    """
+    Background uploader with a global bandwidth cap and priority classes.
+
+    Jobs are callables taking a `wrap(fileobj, size)` function; whatever they
+    upload through a wrapped body is paced by a shared token bucket. Queued
+    jobs start in (priority, size) order, so small screenshots go before large
+    recordings, and a running low-priority transfer pauses while a
+    higher-priority one is active. Recordings run on their own worker so a long
+    upload can never occupy the workers that screenshots and audio wait on.
+    While `is_recording()` is true those recording uploads are also capped at
+    UPLOAD_RECORDING_BYTES_PER_SEC so they don't starve a live capture; the
+    screenshot and audio uploads a request is waiting on are not. Follow-up
+    jobs that upload nothing go through submit_task() and run on their own
+    workers, so they never queue behind a transfer.
+
+    If given, `on_progress(progress)` is called with {'name', 'state', 'sent',
+    'size'} when a job is queued, starts, finishes or fails (then with the
+    'error' too), and every PROGRESS_INTERVAL_SECONDS while it sends.
+    """
+
+    def __init__(self, is_recording=lambda: False, max_bytes_per_sec=UPLOAD_MAX_BYTES_PER_SEC,
+                 recording_bytes_per_sec=UPLOAD_RECORDING_BYTES_PER_SEC, workers=UPLOAD_WORKERS,
+                 on_progress=None):
+        self.is_recording = is_recording
+        self.on_progress = on_progress
+        self.max_bytes_per_sec = max_bytes_per_sec
+        self.recording_bytes_per_sec = recording_bytes_per_sec
+        self.bucket = TokenBucket(self.current_rate)
+        self.bulk_bucket = TokenBucket(self.bulk_rate)
+        self.tasks = ThreadPoolExecutor(max_workers=UPLOAD_TASK_WORKERS, thread_name_prefix='upload-task')
+        self.queue = queue.PriorityQueue()
+        self.bulk_queue = queue.PriorityQueue()
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.active = {}
+        self.active_priorities = Counter()
+        self.samples = deque()
+        self.total_bytes = 0
+        self.completed = 0
+        self.failed = 0
+        for i in range(workers):
+            threading.Thread(target=self._worker, args=(self.queue,), name=f"upload-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._worker, args=(self.bulk_queue,), name="upload-worker-bulk", daemon=True).start()
+
+    def current_rate(self):
+        """Bytes/s currently allowed for all uploads together (0 = unlimited)."""
+        return self.max_bytes_per_sec
+
+    def bulk_rate(self):
+        """Extra cap on recording uploads, in bytes/s (0 = none): only while a recording is live."""
+        return self.recording_bytes_per_sec if self.is_recording() else 0
+
+    def submit(self, name, priority, size, fn):
+        """
+        Queue an upload job.
+
+        Args:
+            name: label shown in stats (usually the S3 key)
+            priority: one of the PRIORITY_* classes
+            size: expected bytes, used to order jobs within a class
+            fn: callable(wrap) performing the upload; wrap(fileobj, size) returns a paced body
+
+        Returns:
+            Future resolving to fn's return value
+        """
+        future = Future()
+        job = {'name': name, 'priority': priority, 'size': size, 'sent': 0, 'reported': 0.0, 'fn': fn, 'future': future}
+        target = self.bulk_queue if priority >= PRIORITY_RECORDING else self.queue
+        target.put((priority, size, next(self.counter), job))
+        self._report(job, 'queued')
+        return future
+
+    def submit_task(self, name, fn):
+        """
+        Run fn() in the background for a job that uploads nothing through the
+        scheduler (hashing, waveforms). Failures are reported like upload failures.
+
+        Returns:
+            Future resolving to fn's return value
+        """
+        job = {'name': name, 'priority': None, 'size': 0, 'sent': 0}
+
+        def run_task():
+            try:
+                return fn()
+            except Exception as e:
+                print(f"Upload task {name} failed: {e}")
+                with self.lock:
+                    self.failed += 1
+                self._report(job, 'failed', error=str(e))
+                raise
+
+        return self.tasks.submit(run_task)
+
+    def run(self, name, priority, size, fn):
+        """Submit a job and block until it finishes (for request handlers that need the result)."""
+        return self.submit(name, priority, size, fn).result()
+
+    def _worker(self, jobs):
+        while True:
+            _, _, seq, job = jobs.get()
+            with self.lock:
+                self.active[seq] = job
+                self.active_priorities[job['priority']] += 1
+            self._report(job, 'started')
+            try:
+                result = job['fn'](lambda fileobj, size: ThrottledReader(self, job, fileobj, size))
+                with self.lock:
+                    self.completed += 1
+                self._report(job, 'done')
+                job['future'].set_result(result)
+            except Exception as e:
+                print(f"Upload job {job['name']} failed: {e}")
+                with self.lock:
+                    self.failed += 1
+                self._report(job, 'failed', error=str(e))
+                job['future'].set_exception(e)
+            finally:
+                with self.lock:
+                    del self.active[seq]
+                    self.active_priorities[job['priority']] -= 1
+                jobs.task_done()
+
+    def _wait_for_turn(self, priority):
+        while True:
+            with self.lock:
+                preempted = any(count > 0 for p, count in self.active_priorities.items() if p < priority)
+            if not preempted:
+                return
+            time.sleep(0.05)
+
+    def _record(self, job, n):
+        now = time.monotonic()
+        with self.lock:
+            job['sent'] += n
+            self.total_bytes += n
+            self.samples.append((now, n))
+            while self.samples and now - self.samples[0][0] > THROUGHPUT_WINDOW_SECONDS:
+                self.samples.popleft()
+            due = now - job['reported'] >= PROGRESS_INTERVAL_SECONDS
+            if due:
+                job['reported'] = now
+        if due:
+            self._report(job, 'progress')
+
+    def _report(self, job, state, error=None):
+        if self.on_progress is None:
+            return
+        progress = {'name': job['name'], 'state': state, 'sent': job['sent'], 'size': job['size']}
+        if error is not None:
+            progress['error'] = error
+        try:
+            self.on_progress(progress)
+        except Exception as e:
+            print(f"Upload progress callback failed for {job['name']}: {e}")
+
+    def stats(self):
+        """Snapshot of scheduler state for the metrics endpoint."""
+        now = time.monotonic()
+        with self.lock:
+            while self.samples and now - self.samples[0][0] > THROUGHPUT_WINDOW_SECONDS:
+                self.samples.popleft()
+            window_bytes = sum(n for _, n in self.samples)
+            return {
+                'throughput_bytes_per_sec': round(window_bytes / THROUGHPUT_WINDOW_SECONDS),
+                'rate_limit_bytes_per_sec': self.current_rate(),
+                'recording_rate_limit_bytes_per_sec': self.bulk_rate(),
+                'throttled_for_recording': self.is_recording(),
+                'queued': self.queue.qsize() + self.bulk_queue.qsize(),
+                'active': [
+                    {'name': job['name'], 'priority': job['priority'], 'sent': job['sent'], 'size': job['size']}
+                    for job in self.active.values()
+                ],
+                'completed': self.completed,
+                'failed': self.failed,
+                'total_bytes': self.total_bytes,
+            }
@@ -0,0 +1,78 @@
+from xml.sax.saxutils import escape
+
+# Content types accepted for direct-to-S3 uploads, keyed by file extension
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'flac': 'audio/flac',
+    'ogg': 'audio/ogg',
+}
+
+# Upper bounds on object size enforced by the POST policy itself
+MAX_UPLOAD_BYTES = {
+    'screenshot': 50 * 1024 * 1024,
+    'audio': 500 * 1024 * 1024,
+}
+
+# Extensions each upload kind is allowed to use (mirrors the multipart routes)
+ALLOWED_EXTENSIONS = {
+    'screenshot': ['png', 'jpg', 'jpeg'],
+    'audio': ['mp3', 'wav', 'flac', 'ogg'],
+}
+
+
+def build_tagging_xml(tags):
+    """Serialize a dict of tags into the XML document S3 expects in the
+    `tagging` form field of a POST upload."""
+    tag_xml = ''.join(
+        f"<Tag><Key>{escape(str(k))}</Key><Value>{escape(str(v))}</Value></Tag>"
+        for k, v in tags.items()
+    )
+    return f"<Tagging><TagSet>{tag_xml}</TagSet></Tagging>"
+
+
+def object_key_for(username, kind, filename):
+    """Return the S3 key a capture of the given kind is stored under.
+    Screenshots live directly under the user's prefix, audio under recordings/."""
+    if kind == 'audio':
+        return f"{username}/recordings/{filename}"
+    return f"{username}/{filename}"
+
+
+def presign_post(client, bucket, key, content_type, max_bytes, tags=None, checksum_sha256=None, expires=3600):
+    """
+    Generate a presigned POST that lets the renderer upload one object straight to S3.
+
+    The policy pins the key, the Content-Type and the tag set, and bounds the
+    object size, so the browser cannot write anything other than the capture
+    the backend agreed to. With checksum_sha256 (base64, as S3 expects it) S3
+    also rejects an upload whose bytes don't hash to that value.
+
+    Returns:
+        {"url": ..., "fields": {...}} as produced by boto3
+    """
+    fields = {'Content-Type': content_type}
+    conditions = [
+        {'Content-Type': content_type},
+        ['content-length-range', 1, max_bytes],
+    ]
+    if tags:
+        tagging = build_tagging_xml(tags)
+        fields['tagging'] = tagging
+        conditions.append({'tagging': tagging})
+    if checksum_sha256:
+        fields['x-amz-checksum-sha256'] = checksum_sha256
+        conditions.append({'x-amz-checksum-sha256': checksum_sha256})
+
+    return client.generate_presigned_post(
+        Bucket=bucket,
+        Key=key,
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=expires,
+    )
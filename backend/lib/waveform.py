@@ -0,0 +1,157 @@
+import os
+import struct
+
+import numpy as np
+import soundfile as sf
+
+# Peaks per level, finest first; the player picks the one closest to its width
+WAVEFORM_LEVELS = (2048, 512, 128)
+WAVEFORM_PREFIX = 'waveforms'
+WAVEFORM_EXTENSION = 'peaks'
+WAVEFORM_CONTENT_TYPE = 'application/octet-stream'
+# Frames decoded per read when the file cannot be memory-mapped
+WAVEFORM_CHUNK_FRAMES = 1 << 18
+
+# Sidecar layout (little-endian):
+#   magic "DDWF", uint16 version, uint16 level count, uint32 sample rate,
+#   uint64 frame count, uint32 bins per level, then for each level its bins
+#   as interleaved (min, max) int8 pairs scaled to [-127, 127]
+WAVEFORM_MAGIC = b'DDWF'
+WAVEFORM_VERSION = 1
+HEADER = struct.Struct('<4sHHIQ')
+
+
+def waveform_key_for(key):
+    """
+    Map a media key to the key of its peaks sidecar under the parallel prefix.
+
+    e.g. "alice/recordings/audio_1.flac" -> "alice/waveforms/recordings/audio_1.peaks"
+    """
+    username, _, rest = key.partition('/')
+    base = os.path.splitext(rest)[0]
+    return f"{username}/{WAVEFORM_PREFIX}/{base}.{WAVEFORM_EXTENSION}"
+
+
+def voiced_key_for(key):
+    """
+    Key of the voiced-regions timeline kept next to the peaks of trimmed audio.
+
+    e.g. "alice/recordings/audio_1.flac" -> "alice/waveforms/recordings/audio_1.voiced.json"
+    """
+    return os.path.splitext(waveform_key_for(key))[0] + '.voiced.json'
+
+
+def is_waveform_key(key):
+    parts = key.split('/')
+    return len(parts) > 2 and parts[1] == WAVEFORM_PREFIX
+
+
+def _wav_memmap(path, info):
+    """
+    Map the sample data of a PCM WAV file as a (frames, channels) array, or
+    return None if the file is not a layout that can be mapped directly.
+    """
+    dtypes = {'PCM_16': np.int16, 'PCM_32': np.int32, 'FLOAT': np.float32, 'DOUBLE': np.float64}
+    if info.format != 'WAV' or info.subtype not in dtypes:
+        return None
+    dtype = np.dtype(dtypes[info.subtype]).newbyteorder('<')
+    with open(path, 'rb') as f:
+        if f.read(12)[8:] != b'WAVE':
+            return None
+        # Walk the RIFF chunks to find where the samples start
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+            if chunk_id == b'data':
+                offset = f.tell()
+                break
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    frames = min(info.frames, (os.path.getsize(path) - offset) // (dtype.itemsize * info.channels))
+    if frames <= 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(frames, info.channels))
+
+
+def _chunks(source, info, chunk_frames):
+    """Yield (frames, channels) float blocks of the whole file, in order."""
+    mapped = _wav_memmap(source, info) if isinstance(source, str) else None
+    if mapped is not None:
+        # Integer samples are scaled to [-1, 1) so every format quantizes the same way
+        scale = 1.0 / -np.iinfo(mapped.dtype).min if mapped.dtype.kind == 'i' else 1.0
+        for start in range(0, len(mapped), chunk_frames):
+            yield mapped[start:start + chunk_frames].astype(np.float32) * scale
+        return
+    if not isinstance(source, str):
+        source.seek(0)
+    yield from sf.blocks(source, blocksize=chunk_frames, dtype='float32', always_2d=True)
+
+
+def compute_peaks(source, levels=WAVEFORM_LEVELS, chunk_frames=WAVEFORM_CHUNK_FRAMES):
+    """
+    Compute multi-resolution min/max peaks of an audio file in one pass.
+
+    The file is read a chunk at a time (memory-mapped for PCM WAV, decoded in
+    blocks otherwise), so memory stays bounded by the chunk size whatever the
+    length of the recording. Within a chunk the per-bin extremes are found
+    with a single np.minimum/maximum.reduceat over all channels; bins that
+    straddle two chunks are merged with the running values. Coarser levels
+    are reduced from the finest one rather than re-reading the audio.
+
+    Args:
+        source: path or seekable file object of any format soundfile reads
+        levels: bins per level, finest first
+
+    Returns:
+        (sample rate, frame count, [(mins, maxs) float32 arrays per level])
+    """
+    if not isinstance(source, str):
+        source.seek(0)
+    info = sf.info(source)
+    frames = info.frames
+    finest = max(1, min(levels[0], frames))
+    # Bin i covers frames [edges[i], edges[i + 1])
+    edges = np.linspace(0, frames, finest + 1).astype(np.int64)
+    mins = np.full(finest, np.inf, dtype=np.float32)
+    maxs = np.full(finest, -np.inf, dtype=np.float32)
+
+    position = 0
+    for block in _chunks(source, info, chunk_frames):
+        if not len(block):
+            continue
+        # Extremes across channels first, so the reduction runs over one row per frame
+        low = block.min(axis=1)
+        high = block.max(axis=1)
+        end = position + len(block)
+        # Decoders (MP3) can yield more frames than the header counts; those land in the last bin
+        first = min(np.searchsorted(edges, position, side='right') - 1, finest - 1)
+        last = min(np.searchsorted(edges, end - 1, side='right') - 1, finest - 1)
+        bins = np.arange(first, last + 1)
+        starts = np.maximum(edges[bins], position) - position
+        mins[bins] = np.minimum(mins[bins], np.minimum.reduceat(low, starts))
+        maxs[bins] = np.maximum(maxs[bins], np.maximum.reduceat(high, starts))
+        position = end
+
+    # Bins past a short read (truncated file) stay silent
+    np.nan_to_num(mins, copy=False, posinf=0.0)
+    np.nan_to_num(maxs, copy=False, neginf=0.0)
+
+    result = [(mins, maxs)]
+    for count in levels[1:]:
+        count = max(1, min(count, finest))
+        groups = np.unique(np.linspace(0, finest, count + 1).astype(np.int64)[:-1])
+        result.append((np.minimum.reduceat(mins, groups), np.maximum.reduceat(maxs, groups)))
+    return info.samplerate, max(frames, position), result
+
+
+def encode_peaks(samplerate, frames, levels):
+    """Pack the output of compute_peaks into the binary sidecar format."""
+    parts = [HEADER.pack(WAVEFORM_MAGIC, WAVEFORM_VERSION, len(levels), samplerate, frames)]
+    parts.append(np.array([len(mins) for mins, _ in levels], dtype='<u4').tobytes())
+    for mins, maxs in levels:
+        pairs = np.empty((len(mins), 2), dtype=np.int8)
+        np.clip(np.rint(mins * 127), -127, 127, out=pairs[:, 0], casting='unsafe')
+        np.clip(np.rint(maxs * 127), -127, 127, out=pairs[:, 1], casting='unsafe')
+        parts.append(pairs.tobytes())
+    return b''.join(parts)
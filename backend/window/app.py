@@ -1,19 +1,18 @@
-from flask import Flask, jsonify, request, send_from_directory, render_template
+from flask import Flask, Response, jsonify, redirect, request, send_file, send_from_directory, render_template
 import os
+import io
 import boto3
 import json
 import sys
 import signal
 from flask_cors import CORS  # You'll need to install flask-cors
-import subprocess
 import platform
+import multiprocessing
+import tempfile
+import threading
 from datetime import datetime, timedelta, timezone
-import numpy as np
+from urllib.parse import quote
 import requests
-import sounddevice as sd  # Used in AudioRecorderThread
-import soundfile as sf    # Used in AudioRecorderThread
-from PyQt5.QtCore import QDateTime  # For consistent date formatting
-import random
 from dotenv import load_dotenv
 
 load_dotenv(override=True)
@@ -21,6 +20,31 @@ load_dotenv(override=True)
 # Fix path to import from sibling directory
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from lib.uploads import ALLOWED_EXTENSIONS, CONTENT_TYPES, MAX_UPLOAD_BYTES, object_key_for, presign_post
+from lib.transcode import SCREENSHOT_FORMATS, get_encoder_pool, output_extension, transcode_screenshot, transcoding_enabled
+from lib.thumbnails import THUMBNAIL_QUALITY, THUMBNAIL_SIZE, extract_poster_frame, is_thumbnail_key, thumbnail_key_for
+from lib.upload_scheduler import PRIORITY_AUDIO, PRIORITY_RECORDING, PRIORITY_SCREENSHOT, UploadScheduler
+from lib.dedup import (CONTENT_REF_TAG, checksum_for, demote_reference, get_content_index, hash_file, hash_into_spool,
+                       promote_reference, put_reference, stored_sha256)
+from lib.screenshot_index import get_screenshot_index, is_screenshot_key
+from lib.replay import REPLAY_FPS, REPLAY_SECONDS, save_replay
+from lib.listeners import ListenerManager
+from lib.remux import remux_faststart
+from lib.waveform import WAVEFORM_CONTENT_TYPE, compute_peaks, encode_peaks, is_waveform_key, voiced_key_for, waveform_key_for
+from lib.silence import AUDIO_SILENCE_TRIM, trim_silence_file
+from lib.hls import HLS_CONTENT_TYPES, HLS_PREFIX, HLS_TAG, RECORDING_HLS, SignedPlaylistCache, delete_hls, hls_prefix_for, package_hls
+from lib.media_cache import MEDIA_CACHE_DIR, MediaCache
+from lib.hero import HERO_FORMAT, HERO_MAX_DIMENSION, HERO_QUALITY, hero_key_for, is_hero_key
+from lib.derivatives import (DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_BYTES, DERIVATIVE_PREFIX, DERIVATIVE_QUALITY,
+                             DERIVATIVE_SOURCE_EXTENSIONS, DERIVATIVES_S3, RenderCoalescer, derivative_key_for,
+                             derivative_prefix_for, is_derivative_key, normalize_format, normalize_width,
+                             render_derivative)
+from lib.similarity import (DUPLICATE_MAX_DISTANCE, PHASH_TAG, SIMILAR_MAX_DISTANCE, flush_similarity_indexes,
+                            get_similarity_index, perceptual_hash)
+from lib.search_index import SEARCH_FIELDS, flush_search_indexes, get_search_index, media_type_for
+from lib.events import EventBroker
+from lib.bulk_delete import BULK_DELETE_MAX_KEYS, RENDITION_ROOT_SCAN_MIN, delete_objects, list_prefixes
+
 try:
     # Try importing from server directory (sibling to window directory)
     from server.aws import S3
@@ -180,13 +204,573 @@ recorder_thread = None
 audio_recorder = None
 
 # recording_processes will map file UIDs
-# to processes recording to those files
+# to the ffmpeg listeners recording to those files
 # to manage multiple recordings and ensure 
-# we can stop the correct one on exit
+# we can stop the correct one on exit.
+# Entries are removed when the listener's process exits.
 recording_processes = {}
 
 # recording_metadata will store app_name and user_with for each active recording
 recording_metadata = {}
+
+# Spawns, pre-warms and reaps the ffmpeg SRT listeners behind screen recordings
+listener_manager = ListenerManager(FFMPEG_PATH, RECORDINGS_DIR, log=log_message)
+
+def is_recording_active():
+    return any(listener.alive() for listener in list(recording_processes.values()))
+
+# Change notifications pushed to the pages, so they can patch their state instead of relisting
+event_broker = EventBroker()
+
+def report_upload_progress(progress):
+    """Pass upload progress on to the pages; failures also go to the log, since
+    queued uploads (recordings) have no request left to return them to."""
+    if progress['state'] == 'failed':
+        log_message(f"Upload of {progress['name']} failed: {progress.get('error')}")
+    event_broker.publish('upload.progress', progress)
+
+# All backend-side uploads go through this scheduler, which caps bandwidth
+# and throttles itself while a screen recording is live
+upload_scheduler = UploadScheduler(
+    is_recording=is_recording_active,
+    on_progress=report_upload_progress
+)
+hls_playlists = SignedPlaylistCache(s3_client, BUCKET_NAME)
+# Local copies of media, so viewing something twice only downloads it once
+media_cache = MediaCache(MEDIA_CACHE_DIR or os.path.join(base_dir, "cache", "media"), log=log_message)
+# Resized images, rendered on first request and kept apart so they never evict originals
+derivative_cache = MediaCache(DERIVATIVE_CACHE_DIR or os.path.join(base_dir, "cache", "derivatives"),
+                              DERIVATIVE_CACHE_MAX_BYTES, log=log_message)
+derivative_renders = RenderCoalescer()
+
+def put_via_scheduler(wrap, object_name, fileobj, size, content_type=None):
+    """PUT a body to S3 through a presigned URL, paced by the upload scheduler.
+    Must be called from inside a scheduler job, which supplies `wrap`."""
+    params = {'Bucket': BUCKET_NAME, 'Key': object_name}
+    headers = {}
+    if content_type:
+        params['ContentType'] = content_type
+        headers['Content-Type'] = content_type
+    url = s3_client.generate_presigned_url('put_object', Params=params, ExpiresIn=3600)
+    response = requests.put(url, data=wrap(fileobj, size), headers=headers)
+    if response.status_code != 200:
+        raise Exception(f"Failed to upload {object_name}")
+    return url
+
+def dedupe_capture(object_name, digest, tags):
+    """If content with this hash is already stored for the user, write a tagged
+    pointer at object_name instead of the bytes and return the existing key.
+    Returns None when the content is new and must be uploaded."""
+    content_index = get_content_index(s3_client, BUCKET_NAME, get_default_username())
+    existing_key = content_index.lookup(digest)
+    if not existing_key:
+        return None
+    if existing_key != object_name:
+        put_reference(s3_client, BUCKET_NAME, object_name, existing_key, tags)
+        content_index.add_reference(digest, object_name)
+    log_message(f"Deduplicated {object_name} against {existing_key}")
+    return existing_key
+
+def cached_media_url(key):
+    """URL of the route that serves key from the local media cache."""
+    return f"/api/media/cached/{quote(key)}"
+
+def seed_local_media():
+    """Serve captures still on this machine from disk instead of downloading them again.
+
+    Local files are matched to the keys they are uploaded under, and only used
+    when they still hold the stored bytes: the same size as the object (trimmed
+    audio and re-encoded screenshots are stored under a different size or
+    extension) and the hash the deduplication index recorded for that key."""
+    username = get_default_username()
+    candidates = {}
+    for directory in (RECORDINGS_DIR, AUDIO_DIR, SCREENSHOTS_DIR):
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            extension = os.path.splitext(entry.name)[1][1:].lower()
+            if directory == SCREENSHOTS_DIR:
+                if entry.name.startswith('screenshot_'):
+                    candidates[f"{username}/{entry.name}"] = entry.path
+            elif extension in ('mp4', 'mkv', 'mov') or extension in ALLOWED_EXTENSIONS['audio']:
+                candidates[f"{username}/recordings/{entry.name}"] = entry.path
+    if not candidates:
+        return
+
+    sizes = {}
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=f"{username}/"):
+        for item in page.get('Contents', []):
+            if item['Key'] in candidates:
+                sizes[item['Key']] = item['Size']
+    digests = get_content_index(s3_client, BUCKET_NAME, username).digests()
+
+    seeded = 0
+    for key, path in candidates.items():
+        if key not in digests or sizes.get(key) != os.path.getsize(path):
+            continue
+        if hash_file(path) != digests[key]:
+            continue
+        media_cache.seed(key, path)
+        seeded += 1
+    log_message(f"Serving {seeded} of {len(candidates)} local captures from disk")
+
+def index_screenshot(object_name, content_key=None):
+    """Add a just-stored screenshot (or dedup pointer to content_key) to the time index."""
+    username = get_default_username()
+    if is_screenshot_key(object_name, username):
+        get_screenshot_index(s3_client, BUCKET_NAME, username).add(object_name, content_key)
+
+# Per-user index files kept next to the session file ({username}/HASHES_{username}.json, ...)
+INDEX_FILE_PREFIXES = ('HASHES_', 'PHASHES_', 'SEARCH_')
+
+def is_index_key(key):
+    parts = key.split('/')
+    return len(parts) == 2 and parts[1].startswith(INDEX_FILE_PREFIXES) and parts[1].endswith('.json')
+
+def is_media_key(key):
+    """Captures, as opposed to derivatives, index files and profile pictures."""
+    if key.count('/') < 1 or os.path.basename(key).startswith('profile.') or is_index_key(key):
+        return False
+    if is_thumbnail_key(key) or is_waveform_key(key) or is_hero_key(key) or is_derivative_key(key):
+        return False
+    return media_type_for(key) != 'unknown'
+
+def search_index():
+    return get_search_index(s3_client, BUCKET_NAME, get_default_username(), is_media_key)
+
+def index_media(object_name, tags):
+    """Add a just-stored capture (tags as written to S3) to the metadata search index
+    and tell the open pages about it."""
+    try:
+        search_index().add(object_name, tags)
+    except Exception as e:
+        log_message(f"Warning: Could not add {object_name} to the search index: {e}")
+    publish_media('media.added', object_name, tags)
+
+def existing_derived_keys(content_key):
+    """The thumbnail, waveform and voiced-regions keys of a capture that exist in S3."""
+    existing = set()
+    for key_for in derived_keys_for(content_key):
+        if key_for not in (thumbnail_key_for, waveform_key_for, voiced_key_for):
+            continue
+        try:
+            s3_client.head_object(Bucket=BUCKET_NAME, Key=key_for(content_key))
+            existing.add(key_for(content_key))
+        except Exception:
+            pass
+    return existing
+
+def publish_media(event, object_name, tags):
+    """Tell the open pages about a capture, as the /api/media_aws item it now lists as."""
+    try:
+        content_key = tags.get(CONTENT_REF_TAG) or object_name
+        item = media_item_for(
+            object_name,
+            datetime.now(timezone.utc),
+            tags,
+            get_user_id_from_username(object_name.split('/', 1)[0]),
+            existing_derived_keys(content_key)
+        )
+        event_broker.publish(event, item)
+    except Exception as e:
+        log_message(f"Warning: Could not publish {event} for {object_name}: {e}")
+
+def media_updated(object_name):
+    """A derivative of a capture landed after it was announced; send the item again."""
+    try:
+        response = s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=object_name)
+        publish_media('media.updated', object_name, {tag['Key']: tag['Value'] for tag in response.get('TagSet', [])})
+    except Exception as e:
+        log_message(f"Warning: Could not publish media.updated for {object_name}: {e}")
+
+def sessions_changed(s3, event, **details):
+    """The session file was written: re-read it for search, and push the new
+    current session (what /api/session/latest returns) to the open pages."""
+    search_index().sessions_changed()
+    try:
+        event_broker.publish(event, dict(details, session=s3.get_latest_session()))
+    except Exception as e:
+        log_message(f"Warning: Could not publish {event}: {e}")
+
+def index_phash(object_name, phash):
+    """Add a screenshot's perceptual hash to the similarity index."""
+    if phash:
+        get_similarity_index(s3_client, BUCKET_NAME, get_default_username()).add(object_name, phash)
+
+def index_duplicate_phash(object_name, existing_key):
+    """A deduplicated screenshot looks exactly like the one holding its bytes."""
+    if is_screenshot_key(object_name, get_default_username()):
+        index_phash(object_name, get_similarity_index(s3_client, BUCKET_NAME, get_default_username()).get(existing_key))
+
+def hash_remote_screenshot(object_name):
+    """Perceptual hash for a screenshot uploaded straight to S3: read it back once,
+    hash it in the encoder pool, then index and tag it."""
+    phash = get_encoder_pool().submit(perceptual_hash, read_media(object_name)).result()
+    index_phash(object_name, phash)
+    response = s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=object_name)
+    tag_set = [tag for tag in response.get('TagSet', []) if tag['Key'] != PHASH_TAG]
+    tag_set.append({'Key': PHASH_TAG, 'Value': phash})
+    s3_client.put_object_tagging(Bucket=BUCKET_NAME, Key=object_name, Tagging={'TagSet': tag_set})
+    log_message(f"Stored perceptual hash for {object_name}")
+
+def upload_thumbnail(media_key, body):
+    """Store a JPEG thumbnail for media_key under the parallel thumbnails/ prefix.
+    Thumbnails never change for a given key, so they are cacheable forever."""
+    thumb_key = thumbnail_key_for(media_key)
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=thumb_key,
+        Body=body,
+        ContentType='image/jpeg',
+        CacheControl='max-age=31536000, immutable'
+    )
+    search_index().add_thumbnail(thumb_key)
+    return thumb_key
+
+def derived_keys_for(media_key):
+    """Key functions for the derivatives a capture of this type can have."""
+    if media_key.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS['audio']:
+        return (waveform_key_for, voiced_key_for)
+    if is_screenshot_key(media_key, media_key.split('/', 1)[0]):
+        return (thumbnail_key_for, hero_key_for)
+    return (thumbnail_key_for,)
+
+def upload_waveform(media_key, source):
+    """Compute min/max peaks for an audio capture and store them under the parallel
+    waveforms/ prefix, so the player can draw the waveform without the audio."""
+    samplerate, frames, levels = compute_peaks(source)
+    waveform_key = waveform_key_for(media_key)
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=waveform_key,
+        Body=encode_peaks(samplerate, frames, levels),
+        ContentType=WAVEFORM_CONTENT_TYPE,
+        CacheControl='max-age=31536000, immutable'
+    )
+    return waveform_key
+
+def upload_remote_waveform(media_key):
+    """Peaks for audio that was uploaded straight to S3: fetch it once into a
+    temporary file (so WAV can be memory-mapped) and compute from there."""
+    suffix = os.path.splitext(media_key)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        local_path = f.name
+        s3_client.download_fileobj(BUCKET_NAME, media_key, f)
+    try:
+        upload_waveform(media_key, local_path)
+        log_message(f"Stored waveform peaks for {media_key}")
+    finally:
+        os.remove(local_path)
+    media_updated(media_key)
+
+def trim_audio_upload(spool, filename):
+    """Compress long silences of an uploaded audio capture into a temporary file.
+    Returns (path, voiced timeline), or (None, None) when there was nothing to trim
+    or the format cannot be rewritten; the caller removes the file."""
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(filename)[1], delete=False) as f:
+        trimmed_path = f.name
+    try:
+        timeline = trim_silence_file(spool, trimmed_path)
+    except Exception as e:
+        log_message(f"Warning: Could not trim silence from {filename}: {e}")
+        timeline = None
+    if not timeline or timeline['stored_seconds'] >= timeline['source_seconds']:
+        os.remove(trimmed_path)
+        return None, None
+    log_message(f"Trimmed {filename} from {timeline['source_seconds']}s to {timeline['stored_seconds']}s")
+    return trimmed_path, timeline
+
+def upload_voiced_regions(media_key, timeline):
+    """Store the voiced-regions timeline of trimmed audio next to its waveform."""
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=voiced_key_for(media_key),
+        Body=json.dumps(timeline),
+        ContentType='application/json',
+        CacheControl='max-age=31536000, immutable'
+    )
+
+def derivative_url(key, width, version=None):
+    """URL of the /api/media/derivative rendition of an image."""
+    url = f"/api/media/derivative?key={quote(key)}&w={width}"
+    return f"{url}&v={version}" if version else url
+
+def avatar_url_for(object_name, etag):
+    """Resized profile picture; the ETag versions it, since the key is reused on every upload."""
+    return derivative_url(object_name, 256, etag.strip('"'))
+
+def read_media(key):
+    """Bytes of a media object, read from the local cache when it holds a copy."""
+    path = media_cache.get(key)
+    if path:
+        with open(path, 'rb') as f:
+            return f.read()
+    return s3_client.get_object(Bucket=BUCKET_NAME, Key=key)['Body'].read()
+
+hero_lock = threading.Lock()
+
+def ensure_hero_rendition(content_key):
+    """Key of the display-sized rendition of a screenshot, rendering it the first time.
+    Renditions are stored in S3 and kept in the local media cache, so each screenshot
+    is scaled and compressed at most once."""
+    hero_key = hero_key_for(content_key)
+    with hero_lock:
+        if media_cache.get(hero_key):
+            return hero_key
+        try:
+            stored = s3_client.get_object(Bucket=BUCKET_NAME, Key=hero_key)
+            media_cache.put_bytes(hero_key, stored['Body'].read())
+            return hero_key
+        except s3_client.exceptions.NoSuchKey:
+            pass
+
+        original = read_media(content_key)
+        body, extension = transcode_screenshot(original, fmt=HERO_FORMAT, quality=HERO_QUALITY,
+                                               max_dimension=HERO_MAX_DIMENSION)
+        s3_client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=hero_key,
+            Body=body,
+            ContentType=CONTENT_TYPES.get(extension, 'application/octet-stream'),
+            CacheControl='max-age=31536000, immutable'
+        )
+        media_cache.put_bytes(hero_key, body)
+        log_message(f"Rendered hero image for {content_key} ({len(original)} -> {len(body)} bytes)")
+    return hero_key
+
+def keep_derivative(derived_key, body):
+    """Cache a rendered image; a copy that can't be kept is only logged, the bytes are still served."""
+    try:
+        derivative_cache.put_bytes(derived_key, body)
+    except Exception as e:
+        log_message(f"Warning: Could not cache derivative {derived_key}: {e}")
+
+def ensure_derivative(key, width, fmt, version=None):
+    """Local path of an image resized to width and encoded as fmt, rendering it on first use
+    (or its bytes in a BytesIO, when the cache could not keep the copy).
+    Concurrent requests for the same derivative share a single render."""
+    derived_key = derivative_key_for(key, width, fmt, version)
+    path = derivative_cache.get(derived_key)
+    if path:
+        return path
+
+    def render():
+        """Returns the cached path, or the rendered bytes."""
+        # A render that finished while this request was arriving already did the work
+        path = derivative_cache.get(derived_key)
+        if path:
+            return path
+        if DERIVATIVES_S3:
+            try:
+                body = s3_client.get_object(Bucket=BUCKET_NAME, Key=derived_key)['Body'].read()
+                keep_derivative(derived_key, body)
+                return body
+            except s3_client.exceptions.NoSuchKey:
+                pass
+        original = read_media(key)
+        body = get_encoder_pool().submit(render_derivative, original, width, fmt, DERIVATIVE_QUALITY).result()
+        keep_derivative(derived_key, body)
+        if DERIVATIVES_S3:
+            try:
+                s3_client.put_object(
+                    Bucket=BUCKET_NAME,
+                    Key=derived_key,
+                    Body=body,
+                    ContentType=CONTENT_TYPES.get(SCREENSHOT_FORMATS[fmt][1], 'application/octet-stream'),
+                    CacheControl='max-age=31536000, immutable'
+                )
+            except Exception as e:
+                log_message(f"Warning: Could not store derivative {derived_key}: {e}")
+        return body
+
+    result = derivative_renders.run(derived_key, render)
+    # The cache may have failed to store the copy or evicted it already; the
+    # rendered bytes are still at hand then
+    path = derivative_cache.get(derived_key)
+    if path:
+        return path
+    if isinstance(result, bytes):
+        return io.BytesIO(result)
+    raise RuntimeError(f"Derivative {derived_key} was evicted before it could be served")
+
+def delete_derivatives(media_key):
+    """Drop every rendered size of an image, locally and (when stored there) in S3."""
+    prefix = derivative_prefix_for(media_key)
+    derivative_cache.discard_prefix(prefix)
+    if not DERIVATIVES_S3:
+        return
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        objects = [{'Key': item['Key']} for item in page.get('Contents', [])]
+        if objects:
+            s3_client.delete_objects(Bucket=BUCKET_NAME, Delete={'Objects': objects})
+
+def promote_content(file_key, promoted_key, remaining_refs):
+    """Deduplicated pointers outlive the capture holding their bytes: move the
+    bytes, and the derivatives made from them, into one of the pointers."""
+    move_content(file_key, promoted_key, remaining_refs)
+    content_moved(file_key, promoted_key)
+
+def move_content(file_key, promoted_key, remaining_refs):
+    """The S3 side of promote_content(); must run while file_key still exists."""
+    promote_reference(s3_client, BUCKET_NAME, file_key, promoted_key, remaining_refs)
+    # Derivatives follow the bytes; a capture only has the ones for its type
+    for derived_for in derived_keys_for(file_key):
+        try:
+            s3_client.copy_object(
+                Bucket=BUCKET_NAME,
+                Key=derived_for(promoted_key),
+                CopySource={'Bucket': BUCKET_NAME, 'Key': derived_for(file_key)}
+            )
+        except s3_client.exceptions.ClientError as e:
+            # Not every capture has every derivative yet; anything else is a lost copy
+            if e.response.get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+                log_message(f"Warning: Could not copy {derived_for(file_key)} to {derived_for(promoted_key)}: {e}")
+
+def content_moved(file_key, promoted_key):
+    """The local side of promote_content(): pointers to file_key now resolve to promoted_key."""
+    get_screenshot_index(s3_client, BUCKET_NAME, get_default_username()).forget_content(file_key)
+    search_index().repoint(file_key, promoted_key)
+
+def restore_content(file_key, promoted_key, remaining_refs):
+    """Undo move_content() for an original that could not be deleted after all,
+    so its bytes and derivatives are not left stored twice."""
+    demote_reference(s3_client, BUCKET_NAME, file_key, promoted_key, remaining_refs)
+    copies = [derived_for(promoted_key) for derived_for in derived_keys_for(file_key)]
+    for key, error in delete_objects(s3_client, BUCKET_NAME, copies).items():
+        if error:
+            log_message(f"Warning: Could not delete {key}: {error}")
+
+def delete_renditions(file_key):
+    """Drop the prefix-based renditions of a capture: resized copies and, for recordings, HLS."""
+    try:
+        delete_derivatives(file_key)
+    except Exception as e:
+        log_message(f"Warning: Could not delete resized copies of {file_key}: {e}")
+    # Recordings may also have an HLS rendition under their own prefix
+    if media_type_for(file_key) == 'video':
+        try:
+            delete_hls(s3_client, BUCKET_NAME, file_key)
+            hls_playlists.invalidate(file_key)
+        except Exception as e:
+            log_message(f"Warning: Could not delete HLS rendition for {file_key}: {e}")
+
+def forget_media(file_key):
+    """A capture was deleted from S3: drop it from the local indexes and caches
+    and tell the open pages."""
+    username = get_default_username()
+    get_screenshot_index(s3_client, BUCKET_NAME, username).remove(file_key)
+    get_similarity_index(s3_client, BUCKET_NAME, username).remove(file_key)
+    search_index().remove(file_key)
+    media_cache.discard(file_key)
+    for derived_for in derived_keys_for(file_key):
+        media_cache.discard(derived_for(file_key))
+    event_broker.publish('media.removed', {"s3_key": file_key})
+
+def bulk_delete_media(keys):
+    """Delete many captures in one pass.
+
+    Pointers and unshared captures go first. Originals still referenced by a
+    surviving pointer go second, each after its bytes were copied into that
+    pointer; a copy whose original then fails to delete is undone. The content
+    index is updated (with one save) only for what was actually deleted, and
+    so are the local indexes and caches. Deletes go out in DeleteObjects
+    batches of 1000 sent concurrently.
+
+    Returns: {key: None if deleted, else the error message}
+    """
+    keys = list(dict.fromkeys(keys))
+    content_index = get_content_index(s3_client, BUCKET_NAME, get_default_username())
+    try:
+        originals = content_index.originals(keys)
+    except Exception as e:
+        log_message(f"Warning: Could not read content index for bulk delete: {e}")
+        originals = set()
+
+    # Pointers first, so an original is never gone while one of them is left
+    results = delete_objects(s3_client, BUCKET_NAME, [key for key in keys if key not in originals])
+    deleted = [key for key, error in results.items() if error is None]
+
+    originals = [key for key in keys if key in originals]
+    try:
+        promotions = content_index.plan_removal(originals + deleted) if originals else []
+    except Exception as e:
+        log_message(f"Warning: Could not read content index for bulk delete: {e}")
+        promotions = []
+        results.update(dict.fromkeys(originals, f"Could not read content index: {e}"))
+        originals = []
+    moved = []
+    for file_key, promoted_key, remaining_refs in promotions:
+        try:
+            move_content(file_key, promoted_key, remaining_refs)
+            moved.append((file_key, promoted_key, remaining_refs))
+        except Exception as e:
+            log_message(f"Warning: Could not move content of {file_key} to {promoted_key}: {e}")
+            results[file_key] = f"Could not move content to {promoted_key}: {e}"
+    results.update(delete_objects(s3_client, BUCKET_NAME, [key for key in originals if key not in results]))
+    for file_key, promoted_key, remaining_refs in moved:
+        if results[file_key] is None:
+            content_moved(file_key, promoted_key)
+            continue
+        try:
+            restore_content(file_key, promoted_key, remaining_refs)
+        except Exception as e:
+            log_message(f"Warning: Could not restore {promoted_key} as a pointer to {file_key}: {e}")
+
+    outcome = {key: results.get(key) for key in keys}
+    deleted = [key for key in keys if outcome[key] is None]
+    try:
+        content_index.remove_many(deleted)
+    except Exception as e:
+        log_message(f"Warning: Could not update content index for bulk delete: {e}")
+
+    # Thumbnails, waveforms and timelines are derivatives; drop them with the media
+    derived_keys = [derived_for(key) for key in deleted for derived_for in derived_keys_for(key)]
+    for derived_key, error in delete_objects(s3_client, BUCKET_NAME, derived_keys).items():
+        if error:
+            log_message(f"Warning: Could not delete {derived_key}: {error}")
+    try:
+        delete_rendition_prefixes(deleted)
+    except Exception as e:
+        log_message(f"Warning: Could not delete renditions for bulk delete: {e}")
+    for key in deleted:
+        derivative_cache.discard_prefix(derivative_prefix_for(key))
+        if media_type_for(key) == 'video':
+            hls_playlists.invalidate(key)
+        forget_media(key)
+    return outcome
+
+def delete_rendition_prefixes(deleted):
+    """Delete the HLS renditions and S3-stored resized copies of many captures.
+
+    Each capture's rendition prefix is listed on its own, several at a time,
+    so the cost follows what is deleted rather than the size of the library.
+    From RENDITION_ROOT_SCAN_MIN captures on, one listing of the user's
+    rendition root is used instead. Everything found goes out in
+    DeleteObjects batches."""
+    username = get_default_username()
+    roots = {}
+    videos = [key for key in deleted if media_type_for(key) == 'video']
+    if videos:
+        roots[f"{HLS_PREFIX}/{username}/"] = {hls_prefix_for(key) for key in videos}
+    if DERIVATIVES_S3 and deleted:
+        roots[f"{username}/{DERIVATIVE_PREFIX}/"] = {derivative_prefix_for(key) for key in deleted}
+
+    doomed = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for root, prefixes in roots.items():
+        if len(prefixes) < RENDITION_ROOT_SCAN_MIN:
+            doomed.extend(list_prefixes(s3_client, BUCKET_NAME, prefixes))
+            continue
+        for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=root):
+            for item in page.get('Contents', []):
+                if item['Key'].rsplit('/', 1)[0] + '/' in prefixes:
+                    doomed.append(item['Key'])
+    for key, error in delete_objects(s3_client, BUCKET_NAME, doomed).items():
+        if error:
+            log_message(f"Warning: Could not delete {key}: {error}")
+
 # Define a cleanup function to run when the app closes
 def graceful_exit(signum, frame):
     print("Received stop signal. Cleaning up...")
@@ -205,22 +789,30 @@ def graceful_exit(signum, frame):
         
     # 2. Stop Audio Recording if active
     global audio_recorder
-    if audio_recorder and audio_recorder.get('recording', False):
+    if audio_recorder and getattr(audio_recorder, 'recording', False):
         print("Stopping active audio recording...")
         try:
-            # Stop recording
-            audio_recorder['recording'] = False
-            sd.sleep(200)  # Wait for recording to finalize
-            
-            # Save the audio file
-            if audio_recorder['frames']:
-                now = QDateTime.currentDateTime().toString('yyyyMMdd_hhmmss')
-                audio_path = os.path.join(AUDIO_DIR, f'audio_recording_{now}.wav')
-                sf.write(audio_path, np.concatenate(audio_recorder['frames']), audio_recorder['samplerate'])
-                print(f"Audio recording saved to {audio_path}")
+            # The recorder streams to disk as it goes; stop() drains the
+            # last buffered block and closes the file before returning
+            audio_recorder.stop()
+            if audio_recorder.audio_path:
+                print(f"Audio recording saved to {audio_recorder.audio_path}")
         except Exception as e:
             print(f"Error stopping audio recording: {e}")
     
+    # 3. Write back index changes that are still waiting to be saved
+    try:
+        flush_similarity_indexes()
+        flush_search_indexes()
+    except Exception as e:
+        print(f"Error saving indexes: {e}")
+
+    # 4. Finalize screen recordings and shut down idle ffmpeg listeners
+    try:
+        listener_manager.shutdown()
+    except Exception as e:
+        print(f"Error stopping ffmpeg listeners: {e}")
+
     print("Cleanup done. Exiting.")
     sys.exit(0)
 
@@ -228,10 +820,161 @@ def graceful_exit(signum, frame):
 signal.signal(signal.SIGTERM, graceful_exit)  # Handle kill() from Electron
 signal.signal(signal.SIGINT, graceful_exit)   # Handle Ctrl+C
 
+def seed_local_media_in_background():
+    # Hashing the local captures can take a while, so startup doesn't wait for it
+    try:
+        seed_local_media()
+    except Exception as e:
+        log_message(f"Warning: Could not seed media cache: {e}")
+
+threading.Thread(target=seed_local_media_in_background, name="seed-media", daemon=True).start()
+# Build the search index while the window opens instead of on the first search or upload
+search_index().start_loading()
+
 @app.route('/api/test', methods=['GET'])
 def test_endpoint():
     return jsonify({"message": "API is working!"})
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Runtime metrics for the backend (upload scheduler, ffmpeg listeners and media cache)."""
+    return jsonify({
+        "uploads": upload_scheduler.stats(),
+        "listeners": listener_manager.stats(),
+        "media_cache": media_cache.stats(),
+        "derivatives": dict(derivative_cache.stats(), coalesced=derivative_renders.coalesced),
+        "events": event_broker.stats()
+    })
+
+@app.route('/api/events')
+def stream_events():
+    """Server-sent events describing changes, so pages patch their state instead of relisting.
+
+    Events (data is JSON):
+      - media.added: a new capture, shaped like an /api/media_aws item
+      - media.updated: the same item again, once a derivative made after the
+        upload (e.g. the waveform of a direct upload) is available
+      - media.removed: { "s3_key" }
+      - media.retagged: { "s3_key", "metadata" }
+      - session.started, session.updated, session.ended, session.deleted:
+        { "session": what /api/session/latest now returns, ... }
+      - upload.progress: { "name", "state", "sent", "size" } (+ "error" when state is "failed")
+      - resync: events were missed; refetch everything
+
+    Reconnecting clients send Last-Event-ID (EventSource does this itself) and
+    receive what they missed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    return Response(
+        event_broker.stream(last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def media_item_for(key, last_modified, s3_metadata, owner_user_id, derived_keys, media_id=None):
+    """
+    One /api/media_aws item (also the payload of media.added/media.updated events).
+
+    Args:
+        key: S3 key of the capture
+        last_modified: datetime it was stored
+        s3_metadata: its tags
+        owner_user_id: integer id of the user whose prefix holds it
+        derived_keys: thumbnail, waveform and voiced-regions keys that exist
+        media_id: position in a listing, when there is one
+    """
+    # Extract filename and extension
+    filename = os.path.basename(key)
+    file_extension = os.path.splitext(filename)[1][1:].lower()
+
+    # Extract session_id from S3 path
+    # Format: username/session_id/filename
+    parts = key.split('/')
+    session_id = parts[1] if len(parts) > 2 else None
+
+    # Determine media type
+    media_type = "unknown"
+    if file_extension in ['mp4', 'mov', 'mkv']:
+        media_type = "video"
+    elif file_extension in ['mp3', 'wav', 'flac', 'ogg']:
+        media_type = "audio"
+    elif file_extension in ['jpg', 'jpeg', 'png', 'webp', 'avif']:
+        media_type = "screenshot"
+
+    s3_metadata = dict(s3_metadata)
+    # Deduplicated captures are pointers; sign the object holding the bytes
+    content_key = s3_metadata.get(CONTENT_REF_TAG, key)
+
+    # Served through the local cache; the presigned URL is what fills it
+    media_url = cached_media_url(content_key)
+    remote_url = s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': BUCKET_NAME, 'Key': content_key},
+        ExpiresIn=3600
+    )
+
+    # Segmented rendition, served as a playlist whose segment URLs are presigned
+    hls_url = None
+    if s3_metadata.pop(HLS_TAG, None):
+        hls_url = f"/api/hls/playlist?key={quote(content_key)}"
+
+    # Small derivative for grid tiles, when one has been generated
+    thumbnail_url = None
+    thumb_key = thumbnail_key_for(content_key)
+    if thumb_key in derived_keys:
+        thumbnail_url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': thumb_key},
+            ExpiresIn=3600
+        )
+
+    # Precomputed peaks, so audio tiles can draw without downloading the audio
+    waveform_url = None
+    waveform_key = waveform_key_for(content_key)
+    if waveform_key in derived_keys:
+        waveform_url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': waveform_key},
+            ExpiresIn=3600
+        )
+
+    # Where the voiced audio sits in time, for captures whose silences were trimmed
+    voiced_regions_url = None
+    voiced_key = voiced_key_for(content_key)
+    if voiced_key in derived_keys:
+        voiced_regions_url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': voiced_key},
+            ExpiresIn=3600
+        )
+
+    # Transform into media data type format
+    media_item = {
+        "media_id": media_id,
+        "type": media_type,
+        "media_url": media_url,
+        "remote_url": remote_url,
+        "thumbnail_url": thumbnail_url,
+        "hls_url": hls_url,
+        "waveform_url": waveform_url,
+        "voiced_regions_url": voiced_regions_url,
+        "timestamp": last_modified.isoformat(),
+        "owner_user_id": owner_user_id,
+        "session_id": session_id,
+        "app_name": session_id if session_id else "app1",  # Use session_id if available, else fallback
+        "s3_key": key,  # Add the actual S3 key for deletion
+        "content_key": content_key  # Key holding the bytes, for resized copies
+    }
+
+    # Apply custom metadata from S3 object headers
+    # S3 metadata will override the defaults
+    media_item.update(s3_metadata)
+    return media_item
+
 @app.route('/api/media_aws', methods=['GET'])
 def get_media_aws():
     try:
@@ -246,41 +989,25 @@ def get_media_aws():
         if 'Contents' not in response:
             return jsonify([])
 
+        # Thumbnails, waveforms and image renditions share the user's prefix; index them instead of listing them as media.
+        # The deduplication, similarity and search index files are skipped too
+        derived_keys = {item['Key'] for item in response['Contents']
+                        if is_thumbnail_key(item['Key']) or is_waveform_key(item['Key'])}
+
         media_list = []
         for idx, item in enumerate(response['Contents'], 1):
-            # Extract filename and extension
-            filename = os.path.basename(item['Key'])
-            file_extension = os.path.splitext(filename)[1][1:].lower()
-
-            # Extract username and session_id from S3 path
-            # Format: username/session_id/filename
-            parts = item['Key'].split('/')
-            s3_username = parts[0]
-            session_id = parts[1] if len(parts) > 2 else None
+            if (is_thumbnail_key(item['Key']) or is_waveform_key(item['Key']) or is_hero_key(item['Key'])
+                    or is_derivative_key(item['Key']) or is_index_key(item['Key'])):
+                continue
 
-            # Convert S3 username to integer user_id
+            # Extract username from S3 path and convert it to an integer user_id
+            s3_username = item['Key'].split('/')[0]
             owner_user_id = get_user_id_from_username(s3_username)
             if owner_user_id is None:
                 # Fallback: if user not found, skip this item
                 print(f"Warning: User '{s3_username}' not found in user.json")
                 continue
 
-            # Determine media type
-            media_type = "unknown"
-            if file_extension in ['mp4', 'mov', 'mkv']:
-                media_type = "video"
-            elif file_extension in ['mp3', 'wav']:
-                media_type = "audio"
-            elif file_extension in ['jpg', 'jpeg', 'png']:
-                media_type = "screenshot"
-
-            # Generate presigned URL
-            media_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': item['Key']},
-                ExpiresIn=3600
-            )
-
             # Get custom metadata from S3 object tags
             try:
                 tag_response = s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=item['Key'])
@@ -289,22 +1016,7 @@ def get_media_aws():
                 print(f"Warning: Could not retrieve tags for {item['Key']}: {e}")
                 s3_metadata = {}
 
-            # Transform into media data type format
-            media_item = {
-                "media_id": idx,
-                "type": media_type,
-                "media_url": media_url,
-                "timestamp": item['LastModified'].isoformat(),
-                "owner_user_id": owner_user_id,
-                "session_id": session_id,
-                "app_name": session_id if session_id else "app1",  # Use session_id if available, else fallback
-                "s3_key": item['Key']  # Add the actual S3 key for deletion
-            }
-
-            # Apply custom metadata from S3 object headers
-            # S3 metadata will override the defaults
-            media_item.update(s3_metadata)
-
+            media_item = media_item_for(item['Key'], item['LastModified'], s3_metadata, owner_user_id, derived_keys, idx)
             media_list.append(media_item)
 
         # Apply filters if provided
@@ -319,6 +1031,202 @@ def get_media_aws():
         print(f"Error in get_media_aws: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/media/similar', methods=['GET'])
+def get_similar_media():
+    """Screenshots that look like the given one, closest first.
+
+    Query parameters:
+      - key: S3 key of a screenshot
+      - max_distance (optional): how many of the 64 hash bits may differ
+      - limit (optional): most results to return (default 50)
+    """
+    key = request.args.get('key')
+    if not key:
+        return jsonify({"error": "key is required"}), 400
+    try:
+        max_distance = int(request.args.get('max_distance', SIMILAR_MAX_DISTANCE))
+        limit = int(request.args.get('limit', 50))
+        username = get_default_username()
+        matches = get_similarity_index(s3_client, BUCKET_NAME, username).similar(key, max_distance, limit)
+        if matches is None:
+            return jsonify({"error": "No perceptual hash for this screenshot"}), 404
+        screenshots = get_screenshot_index(s3_client, BUCKET_NAME, username)
+        results = []
+        for match_key, distance in matches:
+            content_key = screenshots.content_key(match_key)
+            results.append({
+                "s3_key": match_key,
+                "content_key": content_key,
+                "media_url": cached_media_url(content_key),
+                "distance": distance
+            })
+        return jsonify(results)
+    except Exception as e:
+        print(f"Error in get_similar_media: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/media/duplicates', methods=['GET'])
+def get_duplicate_clusters():
+    """Groups of near-duplicate screenshots, largest first, for cleaning up the library."""
+    try:
+        max_distance = int(request.args.get('max_distance', DUPLICATE_MAX_DISTANCE))
+        index = get_similarity_index(s3_client, BUCKET_NAME, get_default_username())
+        clusters = index.clusters(max_distance)
+        return jsonify({
+            "screenshots": len(index),
+            "duplicates": sum(len(cluster) - 1 for cluster in clusters),
+            "clusters": [{"size": len(cluster), "keys": cluster} for cluster in clusters]
+        })
+    except Exception as e:
+        print(f"Error in get_duplicate_clusters: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+def search_media():
+    """Search the current user's captures by metadata, newest first.
+
+    Query parameters (each may repeat or hold comma-separated terms):
+      - app, with, type, session, date: terms of one field are OR-ed, fields are AND-ed;
+        '-term' excludes, 'term*' matches by prefix; session terms are start timestamps
+      - from, to (optional): inclusive YYYY-MM-DD date range
+      - offset, limit (optional): page of the results (limit defaults to 50, at most 500)
+
+    Returns: { "total": ..., "offset": ..., "next_offset": ... or null, "items": [...] }
+    """
+    try:
+        filters = {}
+        for field in SEARCH_FIELDS:
+            terms = [term for value in request.args.getlist(field) for term in value.split(',') if term.strip()]
+            if terms:
+                filters[field] = terms
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', 50))
+        total, items = search_index().search(filters, request.args.get('from'), request.args.get('to'), offset, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in search_media: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    for item in items:
+        item['media_url'] = cached_media_url(item['content_key'])
+    next_offset = offset + len(items)
+    return jsonify({
+        "total": total,
+        "offset": offset,
+        "next_offset": next_offset if next_offset < total else None,
+        "items": items
+    })
+
+@app.route('/api/search/facets', methods=['GET'])
+def search_facets():
+    """Values of one search field with how many captures have each (e.g. ?field=with)."""
+    field = request.args.get('field', 'app')
+    if field not in SEARCH_FIELDS:
+        return jsonify({"error": f"Unknown field: {field}"}), 400
+    try:
+        return jsonify(search_index().facets(field))
+    except Exception as e:
+        print(f"Error in search_facets: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+# Width the timeline renders a bucket's representative screenshot at
+TIMELINE_TILE_WIDTH = 256
+
+@app.route('/api/timeline', methods=['GET'])
+def get_timeline():
+    """Day or hour buckets of the current user's history, newest first.
+
+    Buckets only summarize their captures (counts per type, a representative
+    thumbnail, the sessions overlapping them); /api/timeline/bucket lists the
+    captures themselves when a bucket is expanded.
+
+    Query parameters:
+      - granularity (optional): 'day' (default) or 'hour'
+      - cursor (optional): next_cursor of the previous page
+      - from, to (optional): inclusive YYYY-MM-DD date range
+      - limit (optional): buckets per page (defaults to 30, at most 200)
+
+    Returns: { "buckets": [...], "next_cursor": ... or null }
+    """
+    try:
+        buckets, next_cursor = search_index().timeline(
+            request.args.get('granularity', 'day'),
+            request.args.get('cursor'),
+            request.args.get('from'),
+            request.args.get('to'),
+            int(request.args.get('limit', 30))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_timeline: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    for bucket in buckets:
+        # thumbnail_key is only set when the thumbnail exists; screenshots that
+        # predate thumbnails or skipped them (direct uploads) are rendered at tile size
+        if bucket['thumbnail_key']:
+            bucket['thumbnail_url'] = cached_media_url(bucket['thumbnail_key'])
+        elif bucket['representative_type'] == 'screenshot':
+            bucket['thumbnail_url'] = derivative_url(bucket['representative_key'], TIMELINE_TILE_WIDTH)
+        else:
+            bucket['thumbnail_url'] = None
+    response = jsonify({"buckets": buckets, "next_cursor": next_cursor})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/timeline/bucket', methods=['GET'])
+def get_timeline_bucket():
+    """Captures of one timeline bucket (?bucket=YYYY-MM-DD or YYYY-MM-DDTHH), newest first.
+
+    Query parameters:
+      - bucket: the bucket's id from /api/timeline
+      - offset, limit (optional): page of the captures (limit defaults to 50, at most 500)
+
+    Returns: { "total": ..., "offset": ..., "next_offset": ... or null, "items": [...] }
+    """
+    bucket = request.args.get('bucket')
+    if not bucket:
+        return jsonify({"error": "bucket is required"}), 400
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = int(request.args.get('limit', 50))
+        total, items = search_index().bucket_items(bucket, offset, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in get_timeline_bucket: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+    for item in items:
+        item['media_url'] = cached_media_url(item['content_key'])
+        if item['thumbnail_key']:
+            item['thumbnail_url'] = cached_media_url(item['thumbnail_key'])
+    next_offset = offset + len(items)
+    return jsonify({
+        "total": total,
+        "offset": offset,
+        "next_offset": next_offset if next_offset < total else None,
+        "items": items
+    })
+
+@app.route('/api/hls/playlist', methods=['GET'])
+def get_hls_playlist():
+    """HLS playlist for a recording, with every segment URL presigned."""
+    key = request.args.get('key')
+    if not key:
+        return jsonify({"error": "key is required"}), 400
+    try:
+        playlist = hls_playlists.get(key)
+    except s3_client.exceptions.NoSuchKey:
+        return jsonify({"error": "No HLS rendition for this recording"}), 404
+    except Exception as e:
+        print(f"Error in get_hls_playlist: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    # Signed URLs stay valid for at least half their lifetime, so a short cache is safe
+    return Response(playlist, mimetype=HLS_CONTENT_TYPES['.m3u8'], headers={'Cache-Control': 'private, max-age=600'})
+
 @app.route('/api/generate-presigned-url', methods=['POST'])
 def generate_presigned_url():
     try:
@@ -340,27 +1248,146 @@ def generate_presigned_url():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/latest-screenshot', methods=['GET'])
-def latest_screenshot():
-    """Returns the URL for the latest screenshot"""
-    try:
-        username = get_default_username()
-        # List all objects under USERNAME prefix to find any screenshots
-        prefix = username + "/screenshot_"
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
+@app.route('/api/upload/presign', methods=['POST'])
+def presign_upload():
+    """Issue a presigned POST so the renderer can upload a capture straight to S3.
 
-        if 'Contents' in response:
-            # Find all screenshot files (recursively from any session folder)
-            screenshot_files = [file for file in response['Contents'] if 'screenshot_' in file['Key']]
+    Request body:
+      - file_name: name of the captured file (e.g. screenshot_123.png)
+      - kind: 'screenshot' or 'audio'
+      - app_name, user_with: session metadata stored as object tags
+      - sha256 (optional): content hash used to skip uploading duplicates
+
+    Returns: { "url": ..., "fields": {...}, "key": ... }
+             or { "duplicate": true, "key": ..., "url": ... } when the content already exists
+             or { "transcode": true } when screenshots must go through /api/screenshot
+    """
+    try:
+        data = request.json or {}
+        file_name = data.get('file_name', '')
+        kind = data.get('kind', 'screenshot')
+
+        if kind not in ALLOWED_EXTENSIONS:
+            return jsonify({"error": f"Unsupported upload kind: {kind}"}), 400
+        if not file_name or '/' in file_name or '\\' in file_name or '.' not in file_name:
+            return jsonify({"error": "Invalid file_name"}), 400
+        extension = file_name.rsplit('.', 1)[1].lower()
+        if extension not in ALLOWED_EXTENSIONS[kind]:
+            return jsonify({"error": "Invalid file type"}), 400
+
+        # Screenshots are re-encoded before storage, which needs the bytes in the backend
+        if kind == 'screenshot' and transcoding_enabled():
+            return jsonify({"transcode": True}), 200
+
+        object_name = object_key_for(get_default_username(), kind, file_name)
+        tags = {
+            'app_name': data.get('app_name', ''),
+            'user_with': data.get('user_with', '')
+        }
 
-            if screenshot_files:
-                latest_file = sorted(screenshot_files, key=lambda x: x['LastModified'], reverse=True)[0]['Key']
-                screenshot_url = s3_client.generate_presigned_url(
+        # The renderer hashes the capture it already holds in memory; skip the upload on a match
+        digest = data.get('sha256')
+        if digest:
+            existing_key = dedupe_capture(object_name, digest, tags)
+            if existing_key:
+                index_screenshot(object_name, existing_key)
+                index_duplicate_phash(object_name, existing_key)
+                index_media(object_name, {**tags, CONTENT_REF_TAG: existing_key})
+                media_url = s3_client.generate_presigned_url(
                     'get_object',
-                    Params={'Bucket': BUCKET_NAME, 'Key': latest_file},
+                    Params={'Bucket': BUCKET_NAME, 'Key': existing_key},
                     ExpiresIn=3600
                 )
-                return jsonify({"screenshot_url": screenshot_url})
+                return jsonify({"duplicate": True, "key": object_name, "url": media_url}), 200
+
+        # S3 checks the bytes against the hash the renderer claimed, so the
+        # index never records a hash the stored object doesn't have
+        post = presign_post(
+            s3_client,
+            BUCKET_NAME,
+            object_name,
+            CONTENT_TYPES[extension],
+            MAX_UPLOAD_BYTES[kind],
+            tags=tags,
+            checksum_sha256=checksum_for(digest) if digest else None
+        )
+
+        return jsonify({"url": post['url'], "fields": post['fields'], "key": object_name}), 200
+    except Exception as e:
+        print(f"Error in presign_upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/upload/complete', methods=['POST'])
+def complete_upload():
+    """Called by the renderer once a direct-to-S3 upload has finished.
+
+    Request body:
+      - key: the S3 key returned by /api/upload/presign
+      - sha256 (optional): asks for the capture to be recorded in the deduplication
+        index; the hash recorded is the one S3 verified (or the backend computed)
+
+    Returns: { "status": "success", "url": <presigned GET url> }
+    """
+    try:
+        data = request.json or {}
+        object_name = data.get('key')
+        if not object_name:
+            return jsonify({"error": "key is required"}), 400
+        if not object_name.startswith(f"{get_default_username()}/"):
+            return jsonify({"error": "key is outside the current user's prefix"}), 403
+
+        # Make sure the object actually landed before anything refers to it
+        try:
+            s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)
+        except Exception:
+            return jsonify({"error": "Uploaded object not found"}), 404
+
+        if data.get('sha256'):
+            # Never trust the renderer's hash: a wrong one would turn later
+            # uploads into pointers to unrelated content
+            try:
+                digest = stored_sha256(s3_client, BUCKET_NAME, object_name)
+                if digest != data['sha256']:
+                    log_message(f"Warning: {object_name} does not match the hash the renderer sent")
+                get_content_index(s3_client, BUCKET_NAME, get_default_username()).add_original(digest, object_name)
+            except Exception as e:
+                log_message(f"Warning: Could not hash {object_name} for deduplication: {e}")
+        index_screenshot(object_name)
+        try:
+            # The tags came with the presigned POST
+            tag_response = s3_client.get_object_tagging(Bucket=BUCKET_NAME, Key=object_name)
+            index_media(object_name, {tag['Key']: tag['Value'] for tag in tag_response.get('TagSet', [])})
+        except Exception as e:
+            log_message(f"Warning: Could not read tags of {object_name}: {e}")
+
+        media_url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': object_name},
+            ExpiresIn=3600
+        )
+        log_message(f"Direct upload completed for {object_name}")
+
+        # Audio never passed through the backend, so derive its waveform in the background
+        if object_name.rsplit('.', 1)[-1].lower() in ALLOWED_EXTENSIONS['audio']:
+            upload_scheduler.submit_task(waveform_key_for(object_name), lambda: upload_remote_waveform(object_name))
+        # Likewise the perceptual hash of a screenshot
+        elif is_screenshot_key(object_name, get_default_username()):
+            upload_scheduler.submit_task(f"{object_name}#{PHASH_TAG}", lambda: hash_remote_screenshot(object_name))
+
+        return jsonify({"status": "success", "url": media_url}), 200
+    except Exception as e:
+        print(f"Error in complete_upload: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/latest-screenshot', methods=['GET'])
+def latest_screenshot():
+    """Returns the URL for the latest screenshot"""
+    try:
+        # The index tracks the newest key, so this never lists S3
+        entry = get_screenshot_index(s3_client, BUCKET_NAME, get_default_username()).latest()
+        if entry:
+            _, content_key = entry
+            return jsonify({"screenshot_url": cached_media_url(content_key)})
 
         return jsonify({"screenshot_url": None})
     except Exception as e:
@@ -374,48 +1401,117 @@ def get_random_screenshot_by_days(days):
         # Calculate the date from approximately X days ago
         # Make sure to use timezone-aware datetime
         target_date = datetime.now(timezone.utc) - timedelta(days=days)
-        
-        # For exact date matching (commented out for now)
-        # Extract just the date part (year, month, day) for comparison
-        # target_date_only = target_date.date()
-        
-        username = get_default_username()
-        prefix = username + "/screenshot_"
-        response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=prefix)
-        
-        if 'Contents' in response:
-            print(f"Found content in S3 bucket")
-            # Filter files to only include those from X days ago or longer
-            files = [file for file in response['Contents'] 
-                    if file['Key'].startswith(prefix) and 
-                    file['LastModified'] <= target_date]
-            
-            # For exact date matching (commented out for now)
-            # files = [file for file in response['Contents'] 
-            #         if file['Key'].startswith(prefix) and 
-            #         file['LastModified'].date() == target_date_only]
-            
-            print(f"Found {len(files)} screenshots from {days} days ago or older")
-            if files:
-                # Randomly select one file from the filtered list
-                random_file = random.choice(files)['Key']
-                screenshot_url = s3_client.generate_presigned_url(
-                    'get_object',
-                    Params={'Bucket': BUCKET_NAME, 'Key': random_file},
-                    ExpiresIn=3600
-                )
-                return jsonify({"screenshot_url": screenshot_url})
-        
+
+        # Screenshots are indexed by time, so "X days ago or older" is a bisection
+        index = get_screenshot_index(s3_client, BUCKET_NAME, get_default_username())
+        entry = index.random_before(target_date.timestamp())
+        if entry:
+            _, content_key = entry
+            return jsonify({"screenshot_url": cached_media_url(content_key)})
+
         return jsonify({"screenshot_url": None})
     except Exception as e:
         print(f"Error in get_random_screenshot_by_days: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/hero-image', methods=['GET'])
+def get_hero_image():
+    """Returns the URL of the home page hero: a display-sized rendition of the latest screenshot"""
+    try:
+        entry = get_screenshot_index(s3_client, BUCKET_NAME, get_default_username()).latest()
+        if not entry:
+            return jsonify({"hero_image_url": None})
+        key, content_key = entry
+        hero_key = ensure_hero_rendition(content_key)
+        return jsonify({"hero_image_url": f"/api/hero-image/{quote(hero_key)}", "source_key": key})
+    except Exception as e:
+        print(f"Error in get_hero_image: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/hero-image/<path:hero_key>')
+def get_hero_rendition(hero_key):
+    """Serves a hero rendition. Its key names the screenshot it was made from, so it never changes."""
+    if not is_hero_key(hero_key):
+        return jsonify({"error": "Not a hero image"}), 404
+    try:
+        path = media_cache.get(hero_key)
+        if not path:
+            # Evicted locally; renditions are small, so fetch it back before answering
+            try:
+                stored = s3_client.get_object(Bucket=BUCKET_NAME, Key=hero_key)
+            except s3_client.exceptions.NoSuchKey:
+                return jsonify({"error": "Hero image not found"}), 404
+            media_cache.put_bytes(hero_key, stored['Body'].read())
+            path = media_cache.get(hero_key)
+        response = send_file(path, mimetype=CONTENT_TYPES.get(hero_key.rsplit('.', 1)[-1].lower()),
+                             conditional=True, max_age=31536000)
+        response.cache_control.immutable = True
+        return response
+    except Exception as e:
+        print(f"Error in get_hero_rendition: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/media/derivative', methods=['GET'])
+def get_media_derivative():
+    """Serves an image resized for display, rendered on first request.
+
+    Query parameters:
+      - key: S3 key of the image
+      - w: width in pixels, rounded up to one of the configured widths
+      - format: webp (default), jpeg or avif
+      - v (optional): version of the source, for images that are overwritten in place
+    """
+    key = request.args.get('key')
+    if not key or key.rsplit('.', 1)[-1].lower() not in DERIVATIVE_SOURCE_EXTENSIONS:
+        return jsonify({"error": "key must name an image"}), 400
+    version = request.args.get('v')
+    # ETags of objects uploaded in parts end in -<part count>
+    if version and not version.replace('-', '').isalnum():
+        return jsonify({"error": "Invalid version"}), 400
+    try:
+        width = normalize_width(int(request.args.get('w', '480')))
+        fmt = normalize_format(request.args.get('format'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        path = ensure_derivative(key, width, fmt, version)
+    except s3_client.exceptions.NoSuchKey:
+        return jsonify({"error": "Image not found"}), 404
+    except Exception as e:
+        print(f"Error in get_media_derivative: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    response = send_file(path, mimetype=CONTENT_TYPES.get(SCREENSHOT_FORMATS[fmt][1]), conditional=True,
+                         max_age=31536000)
+    response.cache_control.immutable = True
+    return response
+
 @app.route('/api/screenshots/<filename>')
 def get_screenshot(filename):
     """Serves the screenshot file."""
     return send_from_directory(SCREENSHOTS_DIR, filename)
 
+@app.route('/api/media/cached/<path:key>')
+def get_cached_media(key):
+    """Serves any media object from the local cache, with Range support for seeking.
+    On a miss the caller is redirected to S3 while a copy is fetched in the background."""
+    try:
+        path = media_cache.get(key)
+        if path:
+            # Typed by the file actually served: a seeded screenshot may still be the original format
+            return send_file(path, mimetype=CONTENT_TYPES.get(path.rsplit('.', 1)[-1].lower()),
+                             conditional=True, max_age=86400)
+        media_cache.fill(key, lambda f: s3_client.download_fileobj(BUCKET_NAME, key, f))
+        url = s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': BUCKET_NAME, 'Key': key},
+            ExpiresIn=3600
+        )
+        return redirect(url, code=302)
+    except Exception as e:
+        print(f"Error in get_cached_media: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/screenshot', methods=['POST'])
 def upload_screenshot():
     if 'file' not in request.files:
@@ -431,32 +1527,76 @@ def upload_screenshot():
         
         # Generate presigned URL for upload
         current_username = get_default_username()
-        object_name = f"{current_username}/{file.filename}"
-        url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={'Bucket': BUCKET_NAME, 'Key': object_name},
-            ExpiresIn=3600
+        filename = file.filename
+        extension = output_extension()
+        if extension:
+            filename = f"{os.path.splitext(filename)[0]}.{extension}"
+        object_name = f"{current_username}/{filename}"
+
+        # Hash while spooling the upload so duplicates never leave the machine
+        digest, spool, _ = hash_into_spool(file.stream)
+        existing_key = dedupe_capture(object_name, digest, {'app_name': app_name, 'user_with': user_with})
+        if existing_key:
+            index_screenshot(object_name, existing_key)
+            index_duplicate_phash(object_name, existing_key)
+            index_media(object_name, {'app_name': app_name, 'user_with': user_with, CONTENT_REF_TAG: existing_key})
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': BUCKET_NAME, 'Key': existing_key},
+                ExpiresIn=3600
+            )
+            return jsonify({'status': 'success', 'url': url, 'duplicate_of': existing_key})
+
+        # Re-encode in the worker pool (no-op when SCREENSHOT_FORMAT=original)
+        with spool:
+            original = spool.read()
+        # The perceptual hash is computed from the original, alongside the re-encode
+        phash_future = get_encoder_pool().submit(perceptual_hash, original)
+        body, _ = transcode_screenshot(original)
+        content_type = CONTENT_TYPES.get(object_name.rsplit('.', 1)[1].lower(), 'application/octet-stream')
+
+        # Upload to S3 (screenshots are the highest upload priority)
+        url = upload_scheduler.run(
+            object_name,
+            PRIORITY_SCREENSHOT,
+            len(body),
+            lambda wrap: put_via_scheduler(wrap, object_name, io.BytesIO(body), len(body), content_type)
         )
+        get_content_index(s3_client, BUCKET_NAME, current_username).add_original(digest, object_name)
+        index_screenshot(object_name)
+        try:
+            media_cache.put_bytes(object_name, body)
+        except Exception as e:
+            log_message(f"Warning: Could not cache {object_name}: {e}")
 
-        # Upload to S3
-        response = requests.put(url, data=file)
-        if response.status_code != 200:
-            raise Exception("Failed to upload screenshot")
+        # Grid tiles load this instead of the full-size image
+        try:
+            thumbnail, _ = transcode_screenshot(original, fmt='jpeg', quality=THUMBNAIL_QUALITY, max_dimension=THUMBNAIL_SIZE)
+            upload_thumbnail(object_name, thumbnail)
+        except Exception as e:
+            log_message(f"Warning: Could not create screenshot thumbnail: {e}")
         
+        tag_set = [
+            {'Key': 'app_name', 'Value': app_name},
+            {'Key': 'user_with', 'Value': user_with}
+        ]
+        try:
+            phash = phash_future.result()
+            index_phash(object_name, phash)
+            tag_set.append({'Key': PHASH_TAG, 'Value': phash})
+        except Exception as e:
+            log_message(f"Warning: Could not hash screenshot: {e}")
+
         # Tag the object with metadata
         try:
             s3_client.put_object_tagging(
                 Bucket=BUCKET_NAME,
                 Key=object_name,
-                Tagging={
-                    'TagSet': [
-                        {'Key': 'app_name', 'Value': app_name},
-                        {'Key': 'user_with', 'Value': user_with}
-                    ]
-                }
+                Tagging={'TagSet': tag_set}
             )
         except Exception as e:
             log_message(f"Warning: Could not tag screenshot object: {e}")
+        index_media(object_name, {tag['Key']: tag['Value'] for tag in tag_set})
         
         return jsonify({
             'status': 'success',
@@ -477,51 +1617,25 @@ def start_screen_recording():
         app_name = data.get('app_name', '')
         user_with = data.get('user_with', '')
 
-        port = random.randint(40000, 50000)
-        url = f"srt://127.0.0.1:{port}"
-
-        file_uid = datetime.now().strftime(f"{port}%Y%m%d_%H%M%S")
-        filename = f"recording_{file_uid}.mkv"
-        ffmpeg_output = os.path.normpath(os.path.join(RECORDINGS_DIR, filename))
-        
-        log_message(f"Output file path: {ffmpeg_output}")
-        log_message(f"FFmpeg path: {FFMPEG_PATH}")
-        log_message(f"FFmpeg exists: {os.path.exists(FFMPEG_PATH)}")
-        
-        # Start FFmpeg process
-        ffmpeg_process = subprocess.Popen(
-            [FFMPEG_PATH, 
-             '-probesize', '10M',
-             '-flags', 'low_delay',
-             '-i', url + '?mode=listener',
-             '-map', '0:v',   # Map video first
-             '-map', '0:a?',   # Map audio second
-             '-c:v', 'copy',  # Then specify video codec
-             '-c:a', 'copy',  # Then specify audio codec
-             ffmpeg_output],
-            stdin=subprocess.PIPE
-        )
-        recording_processes[file_uid] = ffmpeg_process
+        # Normally a pre-warmed listener that is already waiting on a free port
+        try:
+            listener = listener_manager.acquire()
+        except RuntimeError as e:
+            log_message(str(e))
+            return jsonify({'error': 'FFmpeg failed to start'}), 500
+
+        file_uid = datetime.now().strftime(f"{listener.port}%Y%m%d_%H%M%S")
+        recording_processes[file_uid] = listener
         # Store metadata for this recording
         recording_metadata[file_uid] = {
             'app_name': app_name,
             'user_with': user_with
         }
+        listener_manager.watch(listener, lambda finished: finish_recording(file_uid, finished))
 
-        log_message(f"Started ffmpeg with PID {ffmpeg_process.pid} for screen recording.")
-        
-        # Check if process started successfully
-        try:
-            ffmpeg_process.wait(timeout=0.5)
-            # Process ended immediately - something went wrong
-            del recording_processes[file_uid]
-            del recording_metadata[file_uid]
-            return jsonify({'error': f'FFmpeg failed to start'}), 500
-        except subprocess.TimeoutExpired:
-            # Process is still running - good!
-            log_message("FFmpeg process is running")
+        log_message(f"Recording {file_uid} using ffmpeg PID {listener.process.pid} on {listener.url}")
 
-        return jsonify({'status': 'ffmpeg available', 'url': url + '?mode=caller', 'uid': file_uid}), 200
+        return jsonify({'status': 'ffmpeg available', 'url': listener.url + '?mode=caller', 'uid': file_uid}), 200
         
     except Exception as e:
         log_message(f"Recording start error: {str(e)}")
@@ -533,7 +1647,7 @@ def start_screen_recording():
 def recording_status(file_uid):
     try:
         global recording_processes
-        if file_uid in recording_processes and recording_processes[file_uid].poll() is None:
+        if file_uid in recording_processes and recording_processes[file_uid].alive():
             return jsonify({'recording': True}), 200
         else:
             return jsonify({'recording': False}), 200
@@ -541,98 +1655,299 @@ def recording_status(file_uid):
         print(f"Recording status error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def upload_hls(wrap, media_path, media_key):
+    """Package a recording as HLS and upload it under its hls/ prefix. Runs inside an upload job."""
+    prefix = hls_prefix_for(media_key)
+    with tempfile.TemporaryDirectory() as workdir:
+        files = package_hls(FFMPEG_PATH, media_path, workdir)
+        if not files:
+            return False
+        for name in files:
+            path = os.path.join(workdir, name)
+            with open(path, 'rb') as f:
+                put_via_scheduler(wrap, prefix + name, f, os.path.getsize(path),
+                                  HLS_CONTENT_TYPES.get(os.path.splitext(name)[1]))
+    log_message(f"Uploaded HLS rendition of {media_key} ({len(files) - 1} files)")
+    return True
+
+def upload_recording(wrap, ffmpeg_output, object_name, app_name, user_with, thumbnail_path):
+    """Upload a finished recording and its thumbnail. Runs as an upload scheduler job."""
+    # Identical recordings become a pointer to the stored copy
+    digest = hash_file(ffmpeg_output)
+    existing_key = dedupe_capture(object_name, digest, {'app_name': app_name, 'user_with': user_with})
+    if existing_key:
+        media_cache.seed(existing_key, ffmpeg_output)
+        index_media(object_name, {'app_name': app_name, 'user_with': user_with, CONTENT_REF_TAG: existing_key})
+        return existing_key
+
+    # A proper type lets the browser stream the fast-start MP4 with range requests
+    content_type = 'video/mp4' if ffmpeg_output.endswith('.mp4') else None
+    with open(ffmpeg_output, 'rb') as f:
+        put_via_scheduler(wrap, object_name, f, os.path.getsize(ffmpeg_output), content_type)
+    get_content_index(s3_client, BUCKET_NAME, get_default_username()).add_original(digest, object_name)
+    media_cache.seed(object_name, ffmpeg_output)
+    log_message("Recording uploaded successfully.")
+
+    if thumbnail_path:
+        try:
+            with open(thumbnail_path, 'rb') as f:
+                upload_thumbnail(object_name, f)
+        except Exception as e:
+            log_message(f"Warning: Could not upload recording thumbnail: {e}")
+
+    tag_set = [
+        {'Key': 'app_name', 'Value': app_name},
+        {'Key': 'user_with', 'Value': user_with}
+    ]
+
+    # Optional segmented rendition for streaming; the MP4 stays the download and fallback
+    if RECORDING_HLS:
+        try:
+            if upload_hls(wrap, ffmpeg_output, object_name):
+                tag_set.append({'Key': HLS_TAG, 'Value': '1'})
+        except Exception as e:
+            log_message(f"Warning: Could not upload HLS rendition: {e}")
+
+    # Tag the object with metadata
+    try:
+        s3_client.put_object_tagging(
+            Bucket=BUCKET_NAME,
+            Key=object_name,
+            Tagging={'TagSet': tag_set}
+        )
+        log_message(f"Tagged recording with app_name={app_name}, user_with={user_with}")
+    except Exception as e:
+        log_message(f"Warning: Could not tag recording object: {e}")
+    index_media(object_name, {tag['Key']: tag['Value'] for tag in tag_set})
+    return object_name
+
+def finish_recording(file_uid, listener):
+    """
+    Exit handler for a recording's ffmpeg listener, run on the manager's reader thread.
+
+    Drops the recording's bookkeeping, then moves whatever was captured to its
+    final name and queues the upload. Also covers streams that ended without
+    a stop request, so nothing is left behind in recording_processes.
+    """
+    recording_processes.pop(file_uid, None)
+    metadata = recording_metadata.pop(file_uid, {})
+    log_message(f"FFmpeg for recording {file_uid} exited with code {listener.process.returncode}.")
+
+    if not os.path.exists(listener.output_path) or os.path.getsize(listener.output_path) == 0:
+        log_message(f"Recording {file_uid} produced no output: {listener.last_error()}")
+        return
+
+    filename = f"recording_{file_uid}.mkv"
+    ffmpeg_output = os.path.normpath(os.path.join(RECORDINGS_DIR, filename))
+    os.replace(listener.output_path, ffmpeg_output)
+
+    # Upload a fast-start MP4 so playback and seeking don't depend on file size;
+    # keep the .mkv if the streams can't be copied into MP4
+    try:
+        mp4_output = remux_faststart(FFMPEG_PATH, ffmpeg_output)
+    except Exception as e:
+        mp4_output = None
+        log_message(f"Warning: Could not remux recording to MP4: {e}")
+    if mp4_output:
+        os.remove(ffmpeg_output)
+        ffmpeg_output = mp4_output
+        filename = os.path.basename(mp4_output)
+    object_name = f"{get_default_username()}/recordings/{filename}"
+
+    # Poster frame for the gallery, taken with a single ffmpeg seek
+    thumbnail_path = None
+    try:
+        thumbnail_path = extract_poster_frame(
+            FFMPEG_PATH,
+            ffmpeg_output,
+            os.path.join(THUMBNAILS_DIR, f"recording_{file_uid}.jpg")
+        )
+    except Exception as e:
+        log_message(f"Warning: Could not create recording thumbnail: {e}")
+
+    # Upload in the background at the lowest priority so it yields to
+    # screenshots and to any recording the user starts next
+    upload_scheduler.submit(
+        object_name,
+        PRIORITY_RECORDING,
+        os.path.getsize(ffmpeg_output),
+        lambda wrap: upload_recording(
+            wrap,
+            ffmpeg_output,
+            object_name,
+            metadata.get('app_name', ''),
+            metadata.get('user_with', ''),
+            thumbnail_path
+        )
+    )
+
 @app.route('/api/recording/stop/<file_uid>', methods=['POST'])
 def stop_screen_recording(file_uid):
+    """Stops a screen recording and returns at once; the upload is queued.
+
+    The response keeps its earlier fields, but 'video_url' (and the thumbnail
+    fields) are now always null: the recording is not in S3 yet when this
+    returns. Its key and URLs arrive with the media.added event once the
+    upload finishes, and a failed upload is reported as an upload.progress
+    event with state "failed".
+    """
     try:
         global recording_processes
-        global recording_metadata
 
         # Check if recording is in progress
-        if file_uid not in recording_processes:
+        listener = recording_processes.get(file_uid)
+        if listener is None:
             return jsonify({'error': 'No active recording'}), 400
 
-        ffmpeg_process = recording_processes[file_uid]
+        # Sends 'q' (or terminates a listener nobody connected to) and returns at
+        # once; finish_recording uploads the file after ffmpeg has finalized it
+        listener_manager.stop(listener)
+        log_message("Stopping ffmpeg for screen recording.")
 
-        # Send 'q' to FFmpeg stdin to gracefully stop
-        try:
-            ffmpeg_process.communicate(input=b'q', timeout=5)
-            log_message("Sent 'q' to ffmpeg stdin to stop recording.")
-        except:
-            log_message("Failed to send 'q' to ffmpeg stdin, attempting to terminate.")
-            ffmpeg_process.terminate()
-        
-        del recording_processes[file_uid]
-        log_message("Stopped ffmpeg for screen recording.")
+        return jsonify({
+            'status': 'stopped',
+            'upload': 'queued',
+            'video_url': None,
+            'thumbnail_path': None,
+            'thumbnail_url': None
+        })
+    except Exception as e:
+        print(f"Recording stop error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
 
-        filename = f"recording_{file_uid}.mkv"
-        ffmpeg_output = os.path.normpath(os.path.join(RECORDINGS_DIR, filename))
-        video_url = None
+# Serializes replay start/stop so two quick requests can't both start a recorder
+replay_lock = threading.Lock()
+
+def replay_active():
+    # replay_seconds is set in the constructor and isRunning() as soon as start()
+    # returns, so a replay counts as active before its thread gets going
+    return recorder_thread is not None and bool(getattr(recorder_thread, 'replay_seconds', 0)) \
+        and recorder_thread.isRunning()
+
+@app.route('/api/replay/start', methods=['POST'])
+def start_replay():
+    """Start capturing into the in-memory replay buffer (video, plus audio when a device exists)."""
+    try:
+        global recorder_thread
+        global audio_recorder
 
-        # Upload the recording to S3
+        from lib.recording import RecorderThread
+        from lib.audio import AudioRecorderThread
+
+        data = request.json or {}
         try:
-            object_name = f"{get_default_username()}/recordings/{filename}"
-            url = s3_client.generate_presigned_url(
-                'put_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': object_name},
-                ExpiresIn=3600
-            )
-            
-            with open(ffmpeg_output, 'rb') as f:
-                response = requests.put(url, data=f)
-                if response.status_code != 200:
-                    raise Exception("Failed to upload recording")
-            video_url = s3_client.generate_presigned_url(
-                'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': object_name},
-                ExpiresIn=3600
-            )
-            log_message("Recording uploaded successfully.")
-            
-            # Tag the object with metadata
+            seconds = int(data.get('seconds', REPLAY_SECONDS))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'seconds must be an integer'}), 400
+        if seconds < 1:
+            # 0 would make the recorders fall back to writing ordinary files
+            return jsonify({'error': 'seconds must be at least 1'}), 400
+        seconds = min(seconds, REPLAY_SECONDS)
+        ffmpeg_path = FFMPEG_PATH if os.path.exists(FFMPEG_PATH) else None
+
+        with replay_lock:
+            if replay_active():
+                return jsonify({'status': 'running', 'stats': recorder_thread.stats()}), 200
+
+            recorder_thread = RecorderThread(fps=REPLAY_FPS, replay_seconds=seconds, ffmpeg_path=ffmpeg_path)
+            recorder_thread.start()
             try:
-                metadata = recording_metadata.get(file_uid, {})
-                app_name = metadata.get('app_name', '')
-                user_with = metadata.get('user_with', '')
-                
-                s3_client.put_object_tagging(
-                    Bucket=BUCKET_NAME,
-                    Key=object_name,
-                    Tagging={
-                        'TagSet': [
-                            {'Key': 'app_name', 'Value': app_name},
-                            {'Key': 'user_with', 'Value': user_with}
-                        ]
-                    }
-                )
-                log_message(f"Tagged recording with app_name={app_name}, user_with={user_with}")
+                audio_recorder = AudioRecorderThread(replay_seconds=seconds)
+                audio_recorder.start()
             except Exception as e:
-                log_message(f"Warning: Could not tag recording object: {e}")
-            
-            # Clean up metadata
-            if file_uid in recording_metadata:
-                del recording_metadata[file_uid]
+                audio_recorder = None
+                log_message(f"Replay running without audio: {e}")
+
+        return jsonify({'status': 'started', 'seconds': seconds, 'audio': audio_recorder is not None}), 200
+    except Exception as e:
+        log_message(f"Replay start error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/replay/status', methods=['GET'])
+def replay_status():
+    if not replay_active():
+        return jsonify({'running': False}), 200
+    return jsonify({'running': True, 'stats': recorder_thread.stats()}), 200
+
+@app.route('/api/replay/save', methods=['POST'])
+def save_replay_clip():
+    """Dump the current replay window to a recording and queue it for upload."""
+    try:
+        if not replay_active():
+            return jsonify({'error': 'Replay buffer is not running'}), 400
+
+        data = request.json or {}
+        seconds = data.get('seconds')
+        app_name = data.get('app_name', '')
+        user_with = data.get('user_with', '')
+
+        file_uid = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename = f"replay_{file_uid}.mp4"
+        output_path = os.path.normpath(os.path.join(RECORDINGS_DIR, filename))
+        if recorder_thread.replay is None:
+            return jsonify({'error': 'Replay buffer is empty'}), 409
+        history = audio_recorder.history if audio_recorder is not None else None
+        if not save_replay(recorder_thread.ffmpeg_path, recorder_thread.replay.ring, output_path,
+                           history, int(seconds) if seconds else None):
+            return jsonify({'error': 'Replay buffer is empty'}), 409
+        log_message(f"Replay saved to {output_path}")
+
+        thumbnail_path = None
+        try:
+            thumbnail_path = extract_poster_frame(
+                recorder_thread.ffmpeg_path,
+                output_path,
+                os.path.join(THUMBNAILS_DIR, f"replay_{file_uid}.jpg")
+            )
         except Exception as e:
-            log_message(f"Error uploading recording: {e}")
-            return jsonify({'error': f"Failed to upload recording: {str(e)}"}), 500
+            log_message(f"Warning: Could not create replay thumbnail: {e}")
+
+        object_name = f"{get_default_username()}/recordings/{filename}"
+        upload_scheduler.submit(
+            object_name,
+            PRIORITY_RECORDING,
+            os.path.getsize(output_path),
+            lambda wrap: upload_recording(wrap, output_path, object_name, app_name, user_with, thumbnail_path)
+        )
 
-        # Return paths
         return jsonify({
-            'status': 'stopped',
-            'video_url': video_url,
-            'thumbnail_path': "not implemented"
-        })
+            'status': 'saved',
+            'upload': 'queued',
+            'path': output_path,
+            'key': object_name,
+            'thumbnail_path': thumbnail_path
+        }), 200
     except Exception as e:
-        print(f"Recording stop error: {str(e)}")
+        log_message(f"Replay save error: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/replay/stop', methods=['POST'])
+def stop_replay():
+    try:
+        global recorder_thread
+        global audio_recorder
+        with replay_lock:
+            if recorder_thread is not None and getattr(recorder_thread, 'replay_seconds', 0):
+                recorder_thread.stop()
+                recorder_thread = None
+            if audio_recorder is not None and audio_recorder.replay_seconds:
+                audio_recorder.stop()
+                audio_recorder = None
+        return jsonify({'status': 'stopped'}), 200
+    except Exception as e:
+        log_message(f"Replay stop error: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/audio/upload', methods=['POST'])
 def upload_audio_recording():
     if 'file' not in request.files:
         return jsonify({'error': 'No file part in the request'}), 400
     file = request.files['file']
-    if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in ['mp3', 'wav', 'flac']:
+    if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in ALLOWED_EXTENSIONS['audio']:
         return jsonify({'error': 'Invalid file type'}), 400
     
     try:
@@ -642,31 +1957,71 @@ def upload_audio_recording():
         
         # Generate presigned URL for upload
         object_name = f"{get_default_username()}/recordings/{file.filename}"
-        url = s3_client.generate_presigned_url(
-            'put_object',
-            Params={'Bucket': BUCKET_NAME, 'Key': object_name},
-            ExpiresIn=3600
-        )
+
+        # Hash while spooling the upload so duplicates never leave the machine
+        digest, spool, size = hash_into_spool(file.stream)
+        existing_key = dedupe_capture(object_name, digest, {'app_name': app_name, 'user_with': user_with})
+        if existing_key:
+            index_media(object_name, {'app_name': app_name, 'user_with': user_with, CONTENT_REF_TAG: existing_key})
+            url = s3_client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': BUCKET_NAME, 'Key': existing_key},
+                ExpiresIn=3600
+            )
+            return jsonify({'status': 'success', 'url': url, 'duplicate_of': existing_key})
+
+        # Long silences are compressed before upload; the hash above is of the original,
+        # so a repeated upload of the same capture is still recognized
+        trimmed_path, timeline = trim_audio_upload(spool, file.filename) if AUDIO_SILENCE_TRIM else (None, None)
 
         # Upload to S3
-        response = requests.put(url, data=file)
-        if response.status_code != 200:
-            raise Exception("Failed to upload audio recording")
-        
+        try:
+            with spool:
+                body = open(trimmed_path, 'rb') if trimmed_path else spool
+                body_size = os.path.getsize(trimmed_path) if trimmed_path else size
+                with body:
+                    url = upload_scheduler.run(
+                        object_name,
+                        PRIORITY_AUDIO,
+                        body_size,
+                        lambda wrap: put_via_scheduler(wrap, object_name, body, body_size)
+                    )
+                    try:
+                        media_cache.put_file(object_name, body)
+                    except Exception as e:
+                        log_message(f"Warning: Could not cache {object_name}: {e}")
+                    # Peaks come from the local copy, so the audio is never read back
+                    # from S3; this runs before `with body` closes the spool
+                    try:
+                        upload_waveform(object_name, trimmed_path or spool)
+                    except Exception as e:
+                        log_message(f"Warning: Could not create audio waveform: {e}")
+        finally:
+            if trimmed_path:
+                os.remove(trimmed_path)
+        get_content_index(s3_client, BUCKET_NAME, get_default_username()).add_original(digest, object_name)
+
+        tag_set = [
+            {'Key': 'app_name', 'Value': app_name},
+            {'Key': 'user_with', 'Value': user_with}
+        ]
+        if timeline:
+            tag_set.append({'Key': 'trimmed_seconds', 'Value': str(round(timeline['source_seconds'] - timeline['stored_seconds'], 2))})
+            try:
+                upload_voiced_regions(object_name, timeline)
+            except Exception as e:
+                log_message(f"Warning: Could not store voiced regions: {e}")
+
         # Tag the object with metadata
         try:
             s3_client.put_object_tagging(
                 Bucket=BUCKET_NAME,
                 Key=object_name,
-                Tagging={
-                    'TagSet': [
-                        {'Key': 'app_name', 'Value': app_name},
-                        {'Key': 'user_with', 'Value': user_with}
-                    ]
-                }
+                Tagging={'TagSet': tag_set}
             )
         except Exception as e:
             log_message(f"Warning: Could not tag audio object: {e}")
+        index_media(object_name, {tag['Key']: tag['Value'] for tag in tag_set})
         
         return jsonify({
             'status': 'success',
@@ -741,6 +2096,7 @@ def create_session():
         
         if not success:
             return jsonify({"error": "Failed to create session in S3"}), 500
+        sessions_changed(s3, 'session.started')
         
         return jsonify({
             "status": "success",
@@ -769,6 +2125,7 @@ def update_session():
         
         if not success:
             return jsonify({"error": "Failed to update session in S3"}), 500
+        sessions_changed(s3, 'session.updated', session_id=session_id)
         
         return jsonify({
             "status": "success",
@@ -810,6 +2167,7 @@ def end_session():
         
         if not success:
             return jsonify({"error": "Failed to end session in S3"}), 500
+        sessions_changed(s3, 'session.ended')
         
         return jsonify({"status": "success"})
         
@@ -836,12 +2194,19 @@ def list_sessions():
 
 @app.route('/api/session/delete', methods=['POST'])
 def delete_session():
+    """Delete a session. With "delete_media": true its captures (those made
+    during the session) are deleted too, and the response carries bulk delete results."""
     try:
         data = request.json
         start_timestamp = data.get('start_timestamp')
         
         if not start_timestamp:
             return jsonify({"error": "start_timestamp is required"}), 400
+
+        # Look the captures up while the session still exists
+        media_keys = search_index().keys({'session': [start_timestamp]}) if data.get('delete_media') else []
+        if len(media_keys) > BULK_DELETE_MAX_KEYS:
+            return jsonify({"error": f"Session has {len(media_keys)} captures; delete at most {BULK_DELETE_MAX_KEYS} at once"}), 400
         
         # Import aws.py's S3 class and delete the session
         from server.aws import S3
@@ -850,6 +2215,10 @@ def delete_session():
         
         if not success:
             return jsonify({"error": "Session not found or could not be deleted"}), 404
+        sessions_changed(s3, 'session.deleted', start_timestamp=start_timestamp)
+
+        if data.get('delete_media'):
+            return jsonify(dict(bulk_delete_summary(bulk_delete_media(media_keys)), status="success"))
         
         return jsonify({"status": "success"})
         
@@ -857,6 +2226,60 @@ def delete_session():
         print(f"Error deleting session: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+def bulk_delete_summary(outcome):
+    return {
+        "deleted": sum(1 for error in outcome.values() if error is None),
+        "failed": sum(1 for error in outcome.values() if error is not None),
+        "results": [
+            {"key": key, "status": "deleted"} if error is None else {"key": key, "status": "error", "error": error}
+            for key, error in outcome.items()
+        ]
+    }
+
+@app.route('/api/media/bulk-delete', methods=['POST'])
+def bulk_delete():
+    """Delete many of the current user's captures at once.
+
+    Request body, one of:
+      - keys: list of capture keys (s3_key of /api/media_aws items)
+      - session_id: start_timestamp of a session; deletes the captures made during it
+      - from, to: inclusive YYYY-MM-DD date range (may be combined with session_id)
+
+    Returns: { "deleted": n, "failed": n, "results": [{ "key", "status", "error"? }] }
+    """
+    try:
+        data = request.get_json() or {}
+        username = get_default_username()
+        invalid = {}
+        if data.get('keys') is not None:
+            if not isinstance(data['keys'], list):
+                return jsonify({"error": "keys must be a list"}), 400
+            keys = []
+            for key in data['keys']:
+                # Only captures of this user; derivatives and index files go with their capture
+                if isinstance(key, str) and key.startswith(f"{username}/") and is_media_key(key):
+                    keys.append(key)
+                else:
+                    invalid[str(key)] = "Not a capture of the current user"
+        elif data.get('session_id') or data.get('from') or data.get('to'):
+            filters = {'session': [data['session_id']]} if data.get('session_id') else {}
+            keys = search_index().keys(filters, data.get('from'), data.get('to'))
+        else:
+            return jsonify({"error": "keys, session_id or from/to is required"}), 400
+
+        if len(keys) > BULK_DELETE_MAX_KEYS:
+            return jsonify({"error": f"{len(keys)} captures selected; delete at most {BULK_DELETE_MAX_KEYS} at once"}), 400
+
+        outcome = bulk_delete_media(keys)
+        outcome.update(invalid)
+        return jsonify(bulk_delete_summary(outcome))
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Error in bulk_delete: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/media/delete', methods=['DELETE', 'POST'])
 def delete_media():
     try:
@@ -871,6 +2294,24 @@ def delete_media():
         if not file_key:
             return jsonify({"error": "file_key is required"}), 400
         
+        # Keep deduplicated pointers alive: move the bytes into one of them first
+        try:
+            content_index = get_content_index(s3_client, BUCKET_NAME, get_default_username())
+            promoted_key, remaining_refs = content_index.remove(file_key)
+            if promoted_key:
+                promote_content(file_key, promoted_key, remaining_refs)
+        except Exception as e:
+            log_message(f"Warning: Could not update content index for {file_key}: {e}")
+
+        # Thumbnails, waveforms and timelines are derivatives; drop them with the media
+        for derived_key in (derived_for(file_key) for derived_for in derived_keys_for(file_key)):
+            try:
+                s3_client.delete_object(Bucket=BUCKET_NAME, Key=derived_key)
+                media_cache.discard(derived_key)
+            except Exception as e:
+                log_message(f"Warning: Could not delete {derived_key}: {e}")
+        delete_renditions(file_key)
+
         # Import aws.py's S3 class and delete the file
         from server.aws import S3
         s3 = S3()
@@ -878,6 +2319,8 @@ def delete_media():
         
         if not success:
             return jsonify({"error": "Failed to delete file from S3"}), 500
+
+        forget_media(file_key)
         
         return jsonify({"status": "success"})
         
@@ -908,6 +2351,9 @@ def update_media_metadata():
         
         if not success:
             return jsonify({"error": "Failed to update media metadata"}), 500
+
+        search_index().update(s3_key, trimmed_metadata)
+        event_broker.publish('media.retagged', {"s3_key": s3_key, "metadata": trimmed_metadata})
         
         return jsonify({"status": "success"})
         
@@ -981,14 +2427,17 @@ def upload_profile_pic():
             ]
             if delete_keys:
                 s3_client.delete_objects(Bucket=BUCKET_NAME, Delete={'Objects': delete_keys})
+            for obj in existing_files['Contents']:
+                media_cache.discard(obj['Key'])
 
         new_url = s3_client.generate_presigned_url(
             'get_object',
             Params={'Bucket': BUCKET_NAME, 'Key': object_name},
             ExpiresIn=3600
         )
+        etag = s3_client.head_object(Bucket=BUCKET_NAME, Key=object_name)['ETag']
         
-        return jsonify({"message": "Success", "url": new_url}), 200
+        return jsonify({"message": "Success", "url": new_url, "avatar_url": avatar_url_for(object_name, etag)}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
@@ -1010,6 +2459,7 @@ def get_profile_pic():
 
         # Get the Key of the first (most relevant) match
         object_name = response['Contents'][0]['Key']
+        etag = response['Contents'][0]['ETag']
 
         # 4. Generate the presigned URL for the found file
         profile_pic_url = s3_client.generate_presigned_url(
@@ -1018,7 +2468,7 @@ def get_profile_pic():
             ExpiresIn=3600
         )
 
-        return jsonify({"url": profile_pic_url}), 200
+        return jsonify({"url": profile_pic_url, "avatar_url": avatar_url_for(object_name, etag)}), 200
 
     except Exception as e:
         # Standard error response if S3 connection fails
@@ -1220,6 +2670,11 @@ def files_page():
         return "Error", 500
 
 if __name__ == '__main__':
+    # Required for the screenshot encoder process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     # Ensure user.json is present when the app starts
     ensure_user_json_exists()
+    # With the reloader on, only the serving child keeps an ffmpeg listener warm
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        listener_manager.start()
     app.run(debug=True, port=5001, host='0.0.0.0')
\ No newline at end of file
@@ -2,6 +2,8 @@ import React, { useState, useRef, useEffect } from 'react';
 import { Mic, Video, Camera, X, Minus, Maximize, Minimize, BarChart2 } from 'lucide-react';
 import { BrowserRouter as Router, Routes, Route, Link } from 'react-router-dom';
 import FFMpeg from './FFMpeg';
+import { UploadSentError, uploadDirect, uploadViaBackend } from './S3Upload';
+import { subscribeEvents } from './events.js';
 const { ipcRenderer } = window.require('electron');
 
 const INACTIVE = "inactive";
@@ -38,6 +40,45 @@ function App() {
     const [screenRecordingState, setScreenRecordingState] = useState(INACTIVE);
     const screenRecordingUID = useRef(null);
     const [isMaximized, setIsMaximized] = useState(false);
+    const latestSession = useRef(null);
+
+    // Current session, pushed by the backend when it changes instead of fetched before every capture
+    useEffect(() => {
+        let pushed = false;
+        const fetchLatestSession = () => {
+            fetch('/api/session/latest')
+                .then((response) => (response.ok ? response.json() : null))
+                .then((session) => {
+                    if (!pushed) latestSession.current = session;
+                })
+                .catch((err) => console.log('Could not fetch session metadata:', err));
+        };
+        const updateSession = (data) => {
+            pushed = true;
+            latestSession.current = data.session;
+        };
+
+        fetchLatestSession();
+        return subscribeEvents({
+            'session.started': updateSession,
+            'session.updated': updateSession,
+            'session.ended': updateSession,
+            'session.deleted': updateSession,
+            // Recordings upload after the stop request has returned, so failures only arrive here
+            'upload.progress': (data) => {
+                if (data.state === 'failed') console.error(`Upload of ${data.name} failed:`, data.error);
+            },
+            resync: () => {
+                pushed = false;
+                fetchLatestSession();
+            }
+        });
+    }, []);
+
+    const currentSessionMetadata = () => ({
+        app_name: latestSession.current?.app_name || '',
+        user_with: latestSession.current?.user_with || ''
+    });
 
     // Add effect to listen for main window open/close events
     useEffect(() => {
@@ -93,34 +134,24 @@ function App() {
 
     const handleScreenshot = async () => {
         setScreenshotState(LOADING);
-        // Fetch current session metadata
-        let sessionMetadata = {};
-        try {
-            const sessionResponse = await fetch('/api/session/latest');
-            if (sessionResponse.ok) {
-                const sessionData = await sessionResponse.json();
-                sessionMetadata = {
-                    app_name: sessionData.app_name || '',
-                    user_with: sessionData.user_with || ''
-                };
-                console.log('Fetched session metadata:', sessionMetadata);
-            }
-        } catch (err) {
-            console.log('Could not fetch session metadata:', err);
-        }
+        const sessionMetadata = currentSessionMetadata();
 
         FFMpeg.takeScreenshot().then(async (screenshot) => {
             setScreenshotState(INACTIVE);
-            const formData = new FormData();
-            formData.append('enctype', 'multipart/form-data');
-            formData.append('file', screenshot);
-            formData.append('app_name', sessionMetadata.app_name || '');
-            formData.append('user_with', sessionMetadata.user_with || '');
+            try {
+                await uploadDirect(screenshot, 'screenshot', sessionMetadata);
+                console.log('Screenshot uploaded successfully');
+                return;
+            } catch (err) {
+                if (err instanceof UploadSentError) {
+                    // The bytes were already sent; a fallback upload would duplicate them
+                    console.error('Screenshot upload error:', err);
+                    return;
+                }
+                console.log('Direct screenshot upload failed, falling back to backend:', err);
+            }
 
-            await fetch('/api/screenshot', {
-                method: 'POST',
-                body: formData,
-            }).then((response) => {
+            await uploadViaBackend(screenshot, '/api/screenshot', sessionMetadata).then((response) => {
                 if (response.ok) {
                     console.log('Screenshot uploaded successfully');
                 } else {
@@ -140,31 +171,11 @@ function App() {
         try {
             setScreenRecordingState(LOADING);
             if (screenRecordingState === INACTIVE) {
-                // Fetch current session metadata
-                fetch('/api/session/latest')
-                    .then((sessionResponse) => {
-                        if (sessionResponse.ok) {
-                            return sessionResponse.json();
-                        }
-                        return {};
-                    })
-                    .catch((err) => {
-                        console.log('Could not fetch session metadata:', err);
-                        return {};
-                    })
-                    .then((sessionData) => {
-                        const sessionMetadata = {
-                            app_name: sessionData.app_name || '',
-                            user_with: sessionData.user_with || ''
-                        };
-                        console.log('Fetched session metadata:', sessionMetadata);
-                        
-                        return fetch('/api/recording/start', {
-                            method: 'POST',
-                            headers: { 'Content-Type': 'application/json' },
-                            body: JSON.stringify(sessionMetadata)
-                        });
-                    })
+                fetch('/api/recording/start', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(currentSessionMetadata())
+                })
                     .then(async (response) => {
                         if (!response.ok) {
                             throw new Error('Failed to start recording on backend');
@@ -212,21 +223,7 @@ function App() {
         try {
             setAudioRecordingState(LOADING);
             if (audioRecordingState === INACTIVE) {
-                // Fetch current session metadata
-                try {
-                    const sessionResponse = await fetch('/api/session/latest');
-                    if (sessionResponse.ok) {
-                        const sessionData = await sessionResponse.json();
-                        audioSessionMetadata.current = {
-                            app_name: sessionData.app_name || '',
-                            user_with: sessionData.user_with || ''
-                        };
-                        console.log('Fetched session metadata:', audioSessionMetadata.current);
-                    }
-                } catch (err) {
-                    console.log('Could not fetch session metadata:', err);
-                    audioSessionMetadata.current = {};
-                }
+                audioSessionMetadata.current = currentSessionMetadata();
 
                 const audioDeviceName = localStorage.getItem('audioDeviceName');
                 console.log('Using audio device:', audioDeviceName);
@@ -240,20 +237,21 @@ function App() {
             } else if (audioRecordingState === ACTIVE) {
                 FFMpeg.stopAudioRecording().then((audio_file) => {
                     console.log('Audio recording stopped');
-                    const formData = new FormData();
-                    formData.append('enctype', 'multipart/form-data');
-                    formData.append('file', audio_file);
-                    formData.append('app_name', audioSessionMetadata.current.app_name || '');
-                    formData.append('user_with', audioSessionMetadata.current.user_with || '');
-                    fetch('/api/audio/upload', {
-                        method: 'POST',
-                        body: formData,
-                    }).then((response) => {
-                        if (response.ok) {
-                            console.log('Audio file uploaded successfully');
-                        } else {
-                            console.error('Audio file upload failed');
+                    const metadata = audioSessionMetadata.current;
+                    uploadDirect(audio_file, 'audio', metadata).then(() => {
+                        console.log('Audio file uploaded successfully');
+                    }).catch((directErr) => {
+                        if (directErr instanceof UploadSentError) {
+                            throw directErr;
                         }
+                        console.log('Direct audio upload failed, falling back to backend:', directErr);
+                        return uploadViaBackend(audio_file, '/api/audio/upload', metadata).then((response) => {
+                            if (response.ok) {
+                                console.log('Audio file uploaded successfully');
+                            } else {
+                                console.error('Audio file upload failed');
+                            }
+                        });
                     }).catch((err) => {
                         console.error('Audio file upload error:', err);
                     });
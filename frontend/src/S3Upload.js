@@ -0,0 +1,107 @@
+/**
+ * Helpers for uploading captures straight from the renderer to S3.
+ * The backend only signs the upload policy and is notified once the
+ * upload has completed, so the file bytes never pass through Flask.
+ */
+
+// Backend multipart routes for each upload kind
+const BACKEND_ROUTES = {
+    screenshot: '/api/screenshot',
+    audio: '/api/audio/upload'
+};
+
+/**
+ * Thrown when an upload failed after its bytes already reached S3 or the
+ * backend. Retrying through the other route could store the capture twice.
+ */
+export class UploadSentError extends Error {}
+
+/**
+ * Computes the SHA-256 of a file as a hex string.
+ * @param {File} file - The file to hash.
+ * @returns {Promise<string>} The hex digest.
+ */
+async function hashFile(file) {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+        .map((b) => b.toString(16).padStart(2, '0'))
+        .join('');
+}
+
+/**
+ * Uploads a capture directly to S3 using a presigned POST.
+ * @param {File} file - The captured file.
+ * @param {string} kind - 'screenshot' or 'audio'.
+ * @param {{app_name?: string, user_with?: string}} metadata - Session metadata stored as tags.
+ * @returns {Promise<{key: string, url: string}>} The S3 key and a presigned GET url.
+ */
+export async function uploadDirect(file, kind, metadata = {}) {
+    const sha256 = await hashFile(file);
+    const presignResponse = await fetch('/api/upload/presign', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+            file_name: file.name,
+            kind,
+            sha256,
+            app_name: metadata.app_name || '',
+            user_with: metadata.user_with || ''
+        })
+    });
+    if (!presignResponse.ok) {
+        throw new Error(`Could not presign ${kind} upload`);
+    }
+    const presigned = await presignResponse.json();
+    // The backend re-encodes this kind of capture, so it has to receive the bytes
+    if (presigned.transcode) {
+        const response = await uploadViaBackend(file, BACKEND_ROUTES[kind], metadata);
+        if (!response.ok) {
+            throw new UploadSentError(`Backend rejected ${kind} upload`);
+        }
+        const { url } = await response.json();
+        return { key: null, url };
+    }
+    // Identical content is already stored; the backend wrote a pointer instead
+    if (presigned.duplicate) {
+        return { key: presigned.key, url: presigned.url };
+    }
+    const { url, fields, key } = presigned;
+
+    // Policy fields must come before the file in the form body
+    const formData = new FormData();
+    Object.entries(fields).forEach(([name, value]) => formData.append(name, value));
+    formData.append('file', file);
+
+    const uploadResponse = await fetch(url, { method: 'POST', body: formData });
+    if (!uploadResponse.ok) {
+        throw new Error(`S3 rejected ${kind} upload with status ${uploadResponse.status}`);
+    }
+
+    const completeResponse = await fetch('/api/upload/complete', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ key, sha256 })
+    });
+    if (!completeResponse.ok) {
+        throw new UploadSentError(`Backend could not confirm ${kind} upload`);
+    }
+    const { url: mediaUrl } = await completeResponse.json();
+    return { key, url: mediaUrl };
+}
+
+/**
+ * Uploads a capture through the backend multipart route.
+ * Used as a fallback when the direct upload is not possible (e.g. missing bucket CORS).
+ * @param {File} file - The captured file.
+ * @param {string} route - The backend route, e.g. '/api/screenshot'.
+ * @param {{app_name?: string, user_with?: string}} metadata - Session metadata stored as tags.
+ * @returns {Promise<Response>} The backend response.
+ */
+export async function uploadViaBackend(file, route, metadata = {}) {
+    const formData = new FormData();
+    formData.append('enctype', 'multipart/form-data');
+    formData.append('file', file);
+    formData.append('app_name', metadata.app_name || '');
+    formData.append('user_with', metadata.user_with || '');
+    return fetch(route, { method: 'POST', body: formData });
+}
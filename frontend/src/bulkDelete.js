@@ -0,0 +1,36 @@
+/**
+ * Deletes many captures with a few /api/media/bulk-delete requests instead
+ * of one /api/media/delete call per item.
+ */
+
+// Largest number of keys the backend accepts in one request
+const BULK_DELETE_MAX_KEYS = 10000;
+
+async function postBulkDelete(body) {
+    const response = await fetch('/api/media/bulk-delete', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Server error: ${response.status}`);
+    }
+    return data;
+}
+
+/**
+ * Returns { deleted: [keys], failed: [{ key, error }] }.
+ */
+export async function bulkDeleteMedia(keys) {
+    const deleted = [];
+    const failed = [];
+    for (let i = 0; i < keys.length; i += BULK_DELETE_MAX_KEYS) {
+        const data = await postBulkDelete({ keys: keys.slice(i, i + BULK_DELETE_MAX_KEYS) });
+        data.results.forEach(result => {
+            if (result.status === 'deleted') deleted.push(result.key);
+            else failed.push({ key: result.key, error: result.error });
+        });
+    }
+    return { deleted, failed };
+}
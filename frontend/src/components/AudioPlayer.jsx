@@ -1,8 +1,52 @@
-import { useRef, useState, useMemo } from 'react';
+import { useRef, useState, useMemo, useEffect } from 'react';
 import { Play, Pause, Volume2, VolumeX, Download } from 'lucide-react';
 
-export default function AudioPlayer({ src }) {
+// Bars drawn from the peaks sidecar
+const PEAK_BARS = 96;
+
+/**
+ * Parses a waveform peaks sidecar (see backend/lib/waveform.py).
+ * @param {ArrayBuffer} buffer - The sidecar bytes.
+ * @returns {{duration: number, levels: Int8Array[]}} Interleaved (min, max) pairs per level, finest first.
+ */
+function parsePeaks(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'DDWF') throw new Error('Not a waveform sidecar');
+    const levelCount = view.getUint16(6, true);
+    const sampleRate = view.getUint32(8, true);
+    const frames = Number(view.getBigUint64(12, true));
+    let offset = 20 + levelCount * 4;
+    const levels = [];
+    for (let i = 0; i < levelCount; i++) {
+        const bins = view.getUint32(20 + i * 4, true);
+        levels.push(new Int8Array(buffer, offset, bins * 2));
+        offset += bins * 2;
+    }
+    return { duration: frames / sampleRate, levels };
+}
+
+/**
+ * Reduces the coarsest level that still has enough bins to `count` bars.
+ * @returns {number[]} Bar heights between 0 and 1.
+ */
+function peaksToBars(levels, count) {
+    const level = [...levels].reverse().find((l) => l.length / 2 >= count) || levels[0];
+    const bins = level.length / 2;
+    return Array.from({ length: Math.min(count, bins) }, (_, i) => {
+        const start = Math.floor((i * bins) / count);
+        const end = Math.max(start + 1, Math.floor(((i + 1) * bins) / count));
+        let peak = 0;
+        for (let b = start; b < end; b++) {
+            peak = Math.max(peak, -level[b * 2], level[b * 2 + 1]);
+        }
+        return Math.max(peak / 127, 0.04);
+    });
+}
+
+export default function AudioPlayer({ src, waveform = null }) {
     const audioRef = useRef(null);
+    const [peaks, setPeaks] = useState(null);
     
     const [isPlaying, setIsPlaying] = useState(false);
     const [progress, setProgress] = useState(0);
@@ -23,6 +67,26 @@ export default function AudioPlayer({ src }) {
         }
     };
 
+    // The sidecar is a few KB; the audio itself is only fetched once playback starts
+    useEffect(() => {
+        setPeaks(null);
+        if (!waveform) return;
+        let cancelled = false;
+        fetch(waveform)
+            .then((response) => {
+                if (!response.ok) throw new Error(`Waveform request failed with status ${response.status}`);
+                return response.arrayBuffer();
+            })
+            .then((buffer) => {
+                if (cancelled) return;
+                const parsed = parsePeaks(buffer);
+                setPeaks(peaksToBars(parsed.levels, PEAK_BARS));
+                setDuration((current) => current || parsed.duration);
+            })
+            .catch((err) => console.log('Could not load waveform:', err));
+        return () => { cancelled = true; };
+    }, [waveform]);
+
     const togglePlay = () => {
         if (audioRef.current) {
             if (isPlaying) audioRef.current.pause();
@@ -54,6 +118,19 @@ export default function AudioPlayer({ src }) {
         }
     };
 
+    // Clicking the waveform seeks; before the audio has loaded the sidecar's duration is used
+    const handleWaveformClick = (e) => {
+        const audio = audioRef.current;
+        if (!audio || !peaks) return;
+        const rect = e.currentTarget.getBoundingClientRect();
+        const fraction = Math.min(Math.max((e.clientX - rect.left) / rect.width, 0), 1);
+        const total = audio.duration || duration;
+        if (!total) return;
+        audio.currentTime = fraction * total;
+        setCurrentTime(fraction * total);
+        setProgress(fraction * 100);
+    };
+
     const toggleMute = () => {
         if (audioRef.current) {
             audioRef.current.muted = !isMuted;
@@ -102,12 +179,30 @@ export default function AudioPlayer({ src }) {
             <audio
                 ref={audioRef}
                 src={src}
+                preload={waveform ? 'none' : 'metadata'}
                 onLoadedMetadata={handleLoadedMetadata}
                 onTimeUpdate={handleTimeUpdate}
                 onEnded={() => setIsPlaying(false)}
             />
 
-            {/* Top: Fake Waveform */}
+            {/* Top: Waveform from precomputed peaks, played part highlighted */}
+            {peaks ? (
+            <div
+                className="flex-1 w-full bg-gray-100 rounded mb-3 overflow-hidden border border-gray-200 relative cursor-pointer"
+                onClick={handleWaveformClick}
+            >
+                <div className="absolute inset-0 flex items-center gap-px px-1">
+                    {peaks.map((height, i) => (
+                        <div
+                            key={i}
+                            className={`flex-1 rounded-full ${(i / peaks.length) * 100 < progress ? 'bg-teal-500' : 'bg-teal-200'}`}
+                            style={{ height: `${height * 90}%` }}
+                        />
+                    ))}
+                </div>
+            </div>
+            ) : (
+            /* Fallback: Fake Waveform */
             <div className="flex-1 w-full bg-gray-100 rounded mb-3 overflow-hidden border border-gray-200 relative">
                 <div className="absolute inset-0 flex items-center justify-center gap-1">
                     {bars.map((bar, i) => (
@@ -126,6 +221,7 @@ export default function AudioPlayer({ src }) {
                     ))}
                 </div>
             </div>
+            )}
 
             {/* Bottom: Controls */}
             <div className="flex flex-col gap-2">
@@ -17,7 +17,8 @@ function ProfilePicture() {
             .then(res => res.json())
             .then(data => {
                 if (data.url) {
-                    setProfilePic(data.url);
+                    // Avatar-sized copy when the backend offers one; the original otherwise
+                    setProfilePic(data.avatar_url ? `${API_BASE_URL}${data.avatar_url}` : data.url);
                     // Don't set imageLoaded true yet, wait for the onLoad event
                 }
             })
@@ -57,9 +58,14 @@ function ProfilePicture() {
 
             if (response.ok && data.url) {
                 console.log("Upload success, new URL:", data.url);
-                // Append a timestamp to force the browser to treat it as a new image
-                const timestampedUrl = `${data.url}${data.url.includes('?') ? '&' : '?'}t=${Date.now()}`;
-                setProfilePic(timestampedUrl);
+                if (data.avatar_url) {
+                    // Versioned by the backend, so it is already a new URL for the new image
+                    setProfilePic(`${API_BASE_URL}${data.avatar_url}`);
+                } else {
+                    // Append a timestamp to force the browser to treat it as a new image
+                    const timestampedUrl = `${data.url}${data.url.includes('?') ? '&' : '?'}t=${Date.now()}`;
+                    setProfilePic(timestampedUrl);
+                }
 
                 // Toast Success Pop up
                 toast.success('Profile updated!', {
@@ -1,16 +1,94 @@
-import React from 'react';
-import { Gamepad2, Trash2 } from 'lucide-react';
+import React, { useState, useEffect } from 'react';
+import { Gamepad2, Trash2, Image, Film, Mic, ChevronDown, ChevronUp } from 'lucide-react';
+import { fetchBucketItems } from '../timeline.js';
+import { tileUrl } from '../derivatives.js';
+
+function bucketLabel(bucket) {
+    // Buckets are local calendar days ("2024-05-01") or hours ("2024-05-01T14")
+    const [day, hour] = bucket.split('T');
+    const [year, month, date] = day.split('-').map(Number);
+    const label = new Date(year, month - 1, date).toLocaleDateString();
+    return hour === undefined ? label : `${label} ${hour}:00`;
+}
+
+function BucketItems({ bucket }) {
+    const [items, setItems] = useState([]);
+    const [nextOffset, setNextOffset] = useState(0);
+    const [loading, setLoading] = useState(false);
+
+    const loadMore = async () => {
+        try {
+            setLoading(true);
+            const data = await fetchBucketItems(bucket, nextOffset);
+            setItems(previous => [...previous, ...data.items]);
+            setNextOffset(data.next_offset);
+        } catch (error) {
+            console.error('Error fetching timeline bucket:', error);
+        } finally {
+            setLoading(false);
+        }
+    };
+
+    // Load the first page when the bucket is opened
+    useEffect(() => {
+        loadMore();
+    }, [bucket]);
+
+    return (
+        <div className="mt-3">
+            <div className="grid grid-cols-4 gap-2">
+                {items.map((item) => (
+                    <a key={item.s3_key} href={item.media_url} target="_blank" rel="noreferrer" title={item.app_name}>
+                        {item.type === 'audio' ? (
+                            <div className="w-full h-20 rounded bg-purple-50 flex items-center justify-center">
+                                <Mic size={20} className="text-purple-500" />
+                            </div>
+                        ) : item.type === 'video' && !item.thumbnail_url ? (
+                            <div className="w-full h-20 rounded bg-teal-50 flex items-center justify-center">
+                                <Film size={20} className="text-teal-500" />
+                            </div>
+                        ) : (
+                            <img
+                                src={tileUrl(item)}
+                                alt={item.app_name || item.type}
+                                className="w-full h-20 object-cover rounded"
+                                loading="lazy"
+                            />
+                        )}
+                    </a>
+                ))}
+            </div>
+            {loading && <div className="text-sm text-gray-500 mt-2">Loading...</div>}
+            {!loading && nextOffset !== null && (
+                <button onClick={loadMore} className="text-sm text-teal-600 hover:text-teal-800 mt-2">
+                    Show more
+                </button>
+            )}
+        </div>
+    );
+}
+
+function Timeline({ buckets, onDeleteEvent, hasMore, onLoadMore, loadingMore }) {
+    const [expanded, setExpanded] = useState(new Set());
+
+    const toggleBucket = (bucket) => {
+        setExpanded(previous => {
+            const next = new Set(previous);
+            if (next.has(bucket)) next.delete(bucket);
+            else next.add(bucket);
+            return next;
+        });
+    };
 
-function Timeline({ events, onDeleteEvent }) {
     return (
         <div className="w-full max-w-4xl mx-auto p-6">
             <div className="relative">
                 {/* Vertical line */}
                 <div className="absolute left-4 top-0 bottom-0 w-0.5 bg-teal-200"></div>
 
-                {/* Timeline items */}
-                {events.map((event, index) => (
-                    <div key={index} className="relative mb-8 last:mb-0">
+                {/* Timeline buckets */}
+                {buckets.map((bucket) => (
+                    <div key={bucket.bucket} className="relative mb-8 last:mb-0">
                         {/* Dot */}
                         <div className="absolute left-0 w-8 h-8 rounded-full bg-teal-500 border-4 border-white flex items-center justify-center">
                             <Gamepad2 size={14} className="text-white" />
@@ -20,27 +98,77 @@ function Timeline({ events, onDeleteEvent }) {
                         <div className="ml-12">
                             <div className="bg-white rounded-lg shadow-sm border border-teal-100 p-4">
                                 <div className="flex items-center justify-between">
-                                    <span className="text-gray-600"> {event.title}</span>
-                                    <div className="flex items-center gap-2">
-                                        <span className="text-sm text-gray-500">{event.date}</span>
-                                        {onDeleteEvent && (
-                                            <button
-                                                onClick={() => onDeleteEvent(event)}
-                                                className="text-red-500 hover:text-red-700 hover:bg-red-50 p-1 rounded transition-colors"
-                                                title="Delete event"
-                                            >
-                                                <Trash2 size={16} />
-                                            </button>
+                                    <span className="font-medium text-gray-700">{bucketLabel(bucket.bucket)}</span>
+                                    <div className="flex items-center gap-3 text-sm text-gray-500">
+                                        {bucket.counts.screenshot > 0 && (
+                                            <span className="flex items-center gap-1"><Image size={14} /> {bucket.counts.screenshot}</span>
+                                        )}
+                                        {bucket.counts.video > 0 && (
+                                            <span className="flex items-center gap-1"><Film size={14} /> {bucket.counts.video}</span>
+                                        )}
+                                        {bucket.counts.audio > 0 && (
+                                            <span className="flex items-center gap-1"><Mic size={14} /> {bucket.counts.audio}</span>
                                         )}
                                     </div>
                                 </div>
+
+                                {bucket.events.map((event) => (
+                                    <div key={event.id} className="flex items-center justify-between mt-2">
+                                        <span className="text-gray-600"> {event.title}</span>
+                                        <div className="flex items-center gap-2">
+                                            <span className="text-sm text-gray-500">{event.date}</span>
+                                            {onDeleteEvent && (
+                                                <button
+                                                    onClick={() => onDeleteEvent(event)}
+                                                    className="text-red-500 hover:text-red-700 hover:bg-red-50 p-1 rounded transition-colors"
+                                                    title="Delete event"
+                                                >
+                                                    <Trash2 size={16} />
+                                                </button>
+                                            )}
+                                        </div>
+                                    </div>
+                                ))}
+
+                                {bucket.count > 0 && (
+                                    <div className="mt-3">
+                                        {bucket.thumbnail_url && !expanded.has(bucket.bucket) && (
+                                            <img
+                                                src={bucket.thumbnail_url}
+                                                alt={bucketLabel(bucket.bucket)}
+                                                className="w-32 h-20 object-cover rounded mb-2"
+                                                loading="lazy"
+                                            />
+                                        )}
+                                        <button
+                                            onClick={() => toggleBucket(bucket.bucket)}
+                                            className="flex items-center gap-1 text-sm text-teal-600 hover:text-teal-800"
+                                        >
+                                            {expanded.has(bucket.bucket) ? <ChevronUp size={16} /> : <ChevronDown size={16} />}
+                                            {expanded.has(bucket.bucket) ? 'Hide captures' : `Show ${bucket.count} captures`}
+                                        </button>
+                                        {expanded.has(bucket.bucket) && <BucketItems bucket={bucket.bucket} />}
+                                    </div>
+                                )}
                             </div>
                         </div>
                     </div>
                 ))}
             </div>
+
+            {hasMore && (
+                <div className="text-center mt-6">
+                    <button
+                        onClick={onLoadMore}
+                        disabled={loadingMore}
+                        className="px-4 py-2 text-sm text-teal-700 border border-teal-200 rounded hover:bg-teal-50 disabled:opacity-50"
+                    >
+                        {loadingMore ? 'Loading...' : 'Load earlier activity'}
+                    </button>
+                </div>
+            )}
         </div>
     );
 }
 
-export default Timeline;
\ No newline at end of file
+export default Timeline;
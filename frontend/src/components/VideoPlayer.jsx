@@ -9,8 +9,10 @@ const formatTime = (timeInSeconds) => {
     return `${minutes}:${seconds.toString().padStart(2, '0')}`;
 };
 
-export default function VideoPlayer({ src }) {
+export default function VideoPlayer({ src, poster = null, hlsSrc = null }) {
     const videoRef = useRef(null);
+    // While true the <video> is fed from the HLS playlist instead of the MP4
+    const [useHls, setUseHls] = useState(Boolean(hlsSrc));
     
     const [isPlaying, setIsPlaying] = useState(false);
     const [progress, setProgress] = useState(0);
@@ -137,6 +139,50 @@ export default function VideoPlayer({ src }) {
         return () => window.removeEventListener('keydown', handleKeyDown);
     }, [isExpanded]);
 
+    // Attach the HLS rendition: natively where supported (Safari), otherwise via hls.js.
+    // Falls back to the MP4 if neither works or the stream fails.
+    useEffect(() => {
+        const video = videoRef.current;
+        setUseHls(Boolean(hlsSrc));
+        if (!hlsSrc || !video) return;
+
+        if (video.canPlayType('application/vnd.apple.mpegurl')) {
+            video.src = hlsSrc;
+            return;
+        }
+
+        let hls = null;
+        let cancelled = false;
+        const startLoad = () => hls && hls.startLoad();
+        import('hls.js')
+            .then(({ default: Hls }) => {
+                if (cancelled) return;
+                if (!Hls.isSupported()) {
+                    setUseHls(false);
+                    return;
+                }
+                // Same as preload="none": with a poster, fetch nothing until play
+                hls = new Hls({ autoStartLoad: !poster });
+                hls.on(Hls.Events.ERROR, (event, data) => {
+                    if (data.fatal) {
+                        hls.destroy();
+                        hls = null;
+                        setUseHls(false);
+                    }
+                });
+                hls.loadSource(hlsSrc);
+                hls.attachMedia(video);
+                video.addEventListener('play', startLoad, { once: true });
+            })
+            .catch(() => setUseHls(false));
+
+        return () => {
+            cancelled = true;
+            video.removeEventListener('play', startLoad);
+            if (hls) hls.destroy();
+        };
+    }, [hlsSrc, poster]);
+
     // Prevent background scrolling when in fullscreen
     useEffect(() => {
         if (isExpanded) document.body.style.overflow = 'hidden';
@@ -161,12 +207,15 @@ export default function VideoPlayer({ src }) {
             
             <div className={innerWrapperClasses}>
                 
+                {/* With a poster frame there is nothing to show until play, so don't fetch the clip yet */}
                 <video
                     ref={videoRef}
                     className={isExpanded ? "w-full max-w-5xl h-auto max-h-[85vh] object-contain" : "w-full h-auto"}
                     onTimeUpdate={handleTimeUpdate}
                     onLoadedMetadata={handleLoadedMetadata}
-                    src={src}
+                    src={useHls ? undefined : src}
+                    poster={poster || undefined}
+                    preload={poster ? 'none' : 'metadata'}
                 />
 
                 {/* Top-Left Timestamp */}
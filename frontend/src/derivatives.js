@@ -0,0 +1,24 @@
+/**
+ * URLs of resized copies of stored images. The backend renders each size
+ * once and caches it, so views only download the pixels they display.
+ */
+
+// Widths (in CSS pixels, doubled for high-DPI screens) used by the views
+export const DERIVATIVE_WIDTHS = {
+    tile: 480,
+    cover: 640,
+    lightbox: 1920,
+};
+
+export function derivativeUrl(key, width, format = 'webp') {
+    const params = new URLSearchParams({ key, w: String(width), format });
+    return `/api/media/derivative?${params}`;
+}
+
+/**
+ * Image for a grid tile: the thumbnail stored with the capture when it has
+ * one, otherwise a tile-sized copy rendered from the original.
+ */
+export function tileUrl(item) {
+    return item.thumbnail_url || derivativeUrl(item.content_key, DERIVATIVE_WIDTHS.tile);
+}
@@ -0,0 +1,54 @@
+/**
+ * Change events pushed by the backend over /api/events. One EventSource is
+ * shared by every subscriber and closed when the last one leaves; the browser
+ * reconnects on its own and the backend replays what was missed. A source
+ * opened again later resumes after the last event seen.
+ */
+
+const EVENT_TYPES = [
+    'media.added',
+    'media.updated',
+    'media.removed',
+    'media.retagged',
+    'session.started',
+    'session.updated',
+    'session.ended',
+    'session.deleted',
+    'upload.progress',
+    'resync',
+];
+
+const handlers = new Map(EVENT_TYPES.map(type => [type, new Set()]));
+let source = null;
+let lastEventId = null;
+
+function open() {
+    const query = lastEventId ? `?last_event_id=${encodeURIComponent(lastEventId)}` : '';
+    source = new EventSource(`/api/events${query}`);
+    EVENT_TYPES.forEach(type => {
+        source.addEventListener(type, (message) => {
+            if (message.lastEventId) lastEventId = message.lastEventId;
+            const data = JSON.parse(message.data);
+            handlers.get(type).forEach(handler => handler(data));
+        });
+    });
+}
+
+/**
+ * Call handlers[type](data) for each event of the given types.
+ * Returns a function that unsubscribes them.
+ */
+export function subscribeEvents(subscriptions) {
+    const entries = Object.entries(subscriptions).filter(([type]) => handlers.has(type));
+    entries.forEach(([type, handler]) => handlers.get(type).add(handler));
+    if (!source) open();
+
+    return () => {
+        entries.forEach(([type, handler]) => handlers.get(type).delete(handler));
+        const listening = [...handlers.values()].some(set => set.size > 0);
+        if (!listening && source) {
+            source.close();
+            source = null;
+        }
+    };
+}
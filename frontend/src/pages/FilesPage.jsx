@@ -3,6 +3,9 @@ import { ChevronDown, X } from 'lucide-react';
 import { UserContext } from '../context/UserContext.jsx';
 import VideoPlayer from '../components/VideoPlayer.jsx';
 import AudioPlayer from '../components/AudioPlayer.jsx';
+import { DERIVATIVE_WIDTHS, derivativeUrl, tileUrl } from '../derivatives.js';
+import { subscribeEvents } from '../events.js';
+import { bulkDeleteMedia } from '../bulkDelete.js';
 
 function FilesPage() {
     const [mediaList, setMediaList] = useState([]);
@@ -26,6 +29,7 @@ function FilesPage() {
     const [userFilter, setUserFilter] = useState(new Set());
     const [gameFilter, setGameFilter] = useState(new Set());
     const [dateRange, setDateRange] = useState({ startDate: '', endDate: '' });
+    const [selectedKeys, setSelectedKeys] = useState(new Set());
     const [dateRangeInfo, setDateRangeInfo] = useState({ min: '', max: '' });
     const [showAddUserModal, setShowAddUserModal] = useState(false);
     const [newUsername, setNewUsername] = useState('');
@@ -37,16 +41,40 @@ function FilesPage() {
     useEffect(() => {
         fetchUsers();
         // initial media load will be handled by users/userFilter effect
+    }, []);
 
-        // Refetch data when page becomes visible (user navigates back)
-        const handleVisibilityChange = () => {
-            if (document.visibilityState === 'visible') {
-                fetchMedia();
-            }
+    // The event subscription below stays open across filter changes, so it
+    // reads the current filter and fetchMedia through refs
+    const userFilterRef = useRef(userFilter);
+    userFilterRef.current = userFilter;
+    const fetchMediaRef = useRef(null);
+
+    // Patch the list from backend change events instead of refetching it
+    useEffect(() => {
+        const showsOwner = (ownerUserId) => {
+            const current = userFilterRef.current;
+            return current.size === 0 || current.has('all') || current.has(String(ownerUserId));
         };
 
-        document.addEventListener('visibilitychange', handleVisibilityChange);
-        return () => document.removeEventListener('visibilitychange', handleVisibilityChange);
+        return subscribeEvents({
+            'media.added': (item) => {
+                if (!showsOwner(item.owner_user_id)) return;
+                setMediaList(previous => [item, ...previous.filter(m => m.s3_key !== item.s3_key)]);
+                if (item.app_name) {
+                    setGames(previous => (previous.includes(item.app_name) ? previous : [...previous, item.app_name]));
+                }
+            },
+            'media.updated': (item) => {
+                setMediaList(previous => previous.map(m => (m.s3_key === item.s3_key ? { ...m, ...item, media_id: m.media_id } : m)));
+            },
+            'media.removed': ({ s3_key }) => {
+                setMediaList(previous => previous.filter(m => m.s3_key !== s3_key));
+            },
+            'media.retagged': ({ s3_key, metadata }) => {
+                setMediaList(previous => previous.map(m => (m.s3_key === s3_key ? { ...m, ...metadata } : m)));
+            },
+            resync: () => fetchMediaRef.current && fetchMediaRef.current()
+        });
     }, []);
 
     // Close dropdowns when clicking outside
@@ -239,6 +267,7 @@ function FilesPage() {
           setLoading(false);
       }
   };
+    fetchMediaRef.current = fetchMedia;
 
     const handleFilterChange = (filterType) => {
         setFilter(filterType);
@@ -260,6 +289,37 @@ function FilesPage() {
         }
     };
 
+    const toggleSelected = (s3Key) => {
+        setSelectedKeys(previous => {
+            const next = new Set(previous);
+            if (next.has(s3Key)) next.delete(s3Key);
+            else next.add(s3Key);
+            return next;
+        });
+    };
+
+    const handleDeleteSelected = async () => {
+        const keys = [...selectedKeys];
+        if (!window.confirm(`Delete ${keys.length} selected files?`)) return;
+
+        try {
+            const { deleted, failed } = await bulkDeleteMedia(keys);
+            const gone = new Set(deleted);
+            setMediaList(previous => previous.filter(m => !gone.has(m.s3_key)));
+            setSelectedKeys(new Set(failed.map(f => f.key)));
+
+            if (failed.length > 0) {
+                console.error('Some files could not be deleted:', failed);
+                alert(`Deleted ${deleted.length} files; ${failed.length} could not be deleted`);
+            } else {
+                alert(`Deleted ${deleted.length} files`);
+            }
+        } catch (error) {
+            console.error('Error deleting media:', error);
+            alert('Error deleting files: ' + error.message);
+        }
+    };
+
     const handleDeleteMedia = async (item) => {
         if (!window.confirm(`Delete this ${item.type}?`)) return;
 
@@ -441,7 +501,7 @@ function FilesPage() {
                 return (
                     <div className="h-full flex flex-col">
                         <div className={`${mediaClass} rounded overflow-hidden shadow-sm p-4 flex-grow flex justify-center items-center`}>
-                            <VideoPlayer src={item.media_url} />
+                            <VideoPlayer src={item.media_url} poster={item.thumbnail_url} hlsSrc={item.hls_url} />
                         </div>
                         <div className="mt-2">
                             {renderEditableField('App', item.app_name, item, 'app_name', isOwned)}
@@ -453,7 +513,7 @@ function FilesPage() {
                 return (
                     <div className="h-full flex flex-col">
                         <div className={`${mediaClass} rounded overflow-hidden shadow-sm p-4 flex-grow flex justify-center items-center`}>
-                            <AudioPlayer src={item.media_url} />
+                            <AudioPlayer src={item.media_url} waveform={item.waveform_url} />
                         </div>
                         <div className="mt-2">
                             {renderEditableField('App', item.app_name, item, 'app_name', isOwned)}
@@ -466,10 +526,10 @@ function FilesPage() {
                     <div className="h-full flex flex-col">
                         <div className={`${mediaClass} rounded overflow-hidden shadow-sm p-4 flex-grow flex justify-center items-center`}>
                             <img 
-                                src={item.media_url} 
+                                src={tileUrl(item)} 
                                 alt="Screenshot" 
                                 className="w-full rounded cursor-pointer hover:opacity-90 transition-opacity"
-                                onClick={() => enlargeImage(item.media_url)}
+                                onClick={() => enlargeImage(derivativeUrl(item.content_key, DERIVATIVE_WIDTHS.lightbox))}
                             />
                         </div>
                         <div className="mt-2">
@@ -659,6 +719,31 @@ function FilesPage() {
                     </div>
                 {/* Media Grid */}
                     <div className="w-full mt-6">
+                        {filteredMedia.some(item => item.owner_user_id === 0) && (
+                            <div className="flex items-center gap-3 text-sm">
+                                <button
+                                    onClick={() => setSelectedKeys(new Set(
+                                        filteredMedia.filter(item => item.owner_user_id === 0).map(item => item.s3_key)
+                                    ))}
+                                    className="text-teal-600 hover:text-teal-800"
+                                >
+                                    Select all shown
+                                </button>
+                                {selectedKeys.size > 0 && (
+                                    <>
+                                        <button onClick={() => setSelectedKeys(new Set())} className="text-gray-500 hover:text-gray-700">
+                                            Clear selection
+                                        </button>
+                                        <button
+                                            onClick={handleDeleteSelected}
+                                            className="px-3 py-1 text-red-600 border border-red-200 rounded hover:bg-red-50 transition-colors"
+                                        >
+                                            Delete {selectedKeys.size} selected
+                                        </button>
+                                    </>
+                                )}
+                            </div>
+                        )}
                         {loading ? (
                             <div className="text-gray-500">Loading media...</div>
                         ) : error ? (
@@ -677,6 +762,17 @@ function FilesPage() {
                                                     🔒
                                                 </div>
                                             )}
+                                            {isOwned && (
+                                                <input
+                                                    type="checkbox"
+                                                    checked={selectedKeys.has(item.s3_key)}
+                                                    onChange={() => toggleSelected(item.s3_key)}
+                                                    className={`absolute top-2 left-2 w-4 h-4 accent-teal-500 transition-opacity ${
+                                                        selectedKeys.size > 0 ? 'opacity-100' : 'opacity-0 group-hover:opacity-100'
+                                                    }`}
+                                                    title="Select for deletion"
+                                                />
+                                            )}
                                             <button
                                                 onClick={() => handleDeleteMedia(item)}
                                                 disabled={!isOwned}
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { ChevronLeft } from 'lucide-react';
 import VideoPlayer from '../components/VideoPlayer.jsx';
+import { DERIVATIVE_WIDTHS, derivativeUrl, tileUrl } from '../derivatives.js';
 
 function FriendsPage() {
   const [friends, setFriends] = useState([]);
@@ -117,7 +118,7 @@ function FriendsPage() {
               <div className="h-40 overflow-hidden bg-purple-50">
                 {screenshotMedia ? (
                   <img 
-                    src={screenshotMedia.media_url} 
+                    src={derivativeUrl(screenshotMedia.content_key, DERIVATIVE_WIDTHS.cover)} 
                     alt={friendUsername} 
                     className="w-full h-full object-cover"
                   />
@@ -218,9 +219,9 @@ function FriendsPage() {
                   className={`${mediaClass} rounded overflow-hidden shadow-sm`}
                 >
                   <div className="h-40 overflow-hidden bg-purple-50 cursor-pointer hover:opacity-80 transition-opacity"
-                    onClick={() => enlargeImage(item.media_url)}>
+                    onClick={() => enlargeImage(derivativeUrl(item.content_key, DERIVATIVE_WIDTHS.lightbox))}>
                     <img 
-                      src={item.media_url} 
+                      src={tileUrl(item)} 
                       alt="" 
                       className="w-full h-full object-cover"
                     />
@@ -238,7 +239,7 @@ function FriendsPage() {
                   className={`${mediaClass} rounded overflow-hidden shadow-sm`}
                 >
                   <div className="h-40 overflow-hidden bg-pink-50">
-                    <VideoPlayer src={item.media_url} />
+                    <VideoPlayer src={item.media_url} poster={item.thumbnail_url} hlsSrc={item.hls_url} />
                   </div>
                   <div className="p-4">
                     <div className="text-sm text-gray-700 font-medium mb-1">Video</div>
@@ -3,6 +3,9 @@ import { ChevronLeft, X } from 'lucide-react';
 import { UserContext } from '../context/UserContext.jsx';
 import VideoPlayer from '../components/VideoPlayer.jsx';
 import AudioPlayer from '../components/AudioPlayer.jsx';
+import { DERIVATIVE_WIDTHS, derivativeUrl, tileUrl } from '../derivatives.js';
+import { subscribeEvents } from '../events.js';
+import { bulkDeleteMedia } from '../bulkDelete.js';
 
 function GamesPage() {
   const [mediaData, setMediaData] = useState([]);
@@ -19,15 +22,23 @@ function GamesPage() {
   useEffect(() => {
     fetchMediaData();
 
-    // Refetch data when page becomes visible (user navigates back)
-    const handleVisibilityChange = () => {
-      if (document.visibilityState === 'visible') {
-        fetchMediaData();
-      }
-    };
-
-    document.addEventListener('visibilitychange', handleVisibilityChange);
-    return () => document.removeEventListener('visibilitychange', handleVisibilityChange);
+    // Patch the list from backend change events instead of refetching it
+    return subscribeEvents({
+      'media.added': (item) => {
+        if (!item.s3_key.startsWith(`${currentUsername}/`)) return;
+        setMediaData(previous => [...previous.filter(m => m.s3_key !== item.s3_key), item]);
+      },
+      'media.updated': (item) => {
+        setMediaData(previous => previous.map(m => (m.s3_key === item.s3_key ? { ...m, ...item, media_id: m.media_id } : m)));
+      },
+      'media.removed': ({ s3_key }) => {
+        setMediaData(previous => previous.filter(m => m.s3_key !== s3_key));
+      },
+      'media.retagged': ({ s3_key, metadata }) => {
+        setMediaData(previous => previous.map(m => (m.s3_key === s3_key ? { ...m, ...metadata } : m)));
+      },
+      resync: () => fetchMediaData()
+    });
   }, []);
 
   const fetchMediaData = async () => {
@@ -254,7 +265,7 @@ function GamesPage() {
               <div className="h-40 overflow-hidden bg-blue-50">
                 {screenshotMedia ? (
                   <img 
-                    src={screenshotMedia.media_url} 
+                    src={derivativeUrl(screenshotMedia.content_key, DERIVATIVE_WIDTHS.cover)} 
                     alt={game.name} 
                     className="w-full h-full object-cover"
                   />
@@ -278,6 +289,28 @@ function GamesPage() {
     );
   };
 
+  const handleDeleteGameMedia = async () => {
+    const keys = selectedGame.media.map(m => m.s3_key).filter(Boolean);
+    if (!window.confirm(`Delete all ${keys.length} files of ${selectedGame.name}?`)) return;
+
+    try {
+      const { deleted, failed } = await bulkDeleteMedia(keys);
+      const gone = new Set(deleted);
+      setSelectedGame({ ...selectedGame, media: selectedGame.media.filter(m => !gone.has(m.s3_key)) });
+      setMediaData(previous => previous.filter(m => !gone.has(m.s3_key)));
+
+      if (failed.length > 0) {
+        console.error('Some files could not be deleted:', failed);
+        alert(`Deleted ${deleted.length} files; ${failed.length} could not be deleted`);
+      } else {
+        alert(`Deleted ${deleted.length} files`);
+      }
+    } catch (error) {
+      console.error('Error deleting media:', error);
+      alert('Error deleting files: ' + error.message);
+    }
+  };
+
   const handleDeleteMedia = async (item) => {
     if (!window.confirm(`Delete this ${item.type}?`)) return;
 
@@ -342,7 +375,17 @@ function GamesPage() {
           </button>
         </div>
         
-        <h3 className="text-xl font-semibold text-gray-700 mb-4">{selectedGame.name}</h3>
+        <div className="flex justify-between items-center mb-4">
+          <h3 className="text-xl font-semibold text-gray-700">{selectedGame.name}</h3>
+          {selectedGame.media.length > 0 && (
+            <button
+              onClick={handleDeleteGameMedia}
+              className="px-3 py-1 text-sm text-red-600 border border-red-200 rounded hover:bg-red-50 transition-colors"
+            >
+              Delete all
+            </button>
+          )}
+        </div>
         
         <div className="grid grid-cols-1 md:grid-cols-3 gap-6">
           {sortedMedia.map(item => {
@@ -375,10 +418,10 @@ function GamesPage() {
                 >
                   <div className="p-4">
                     <img 
-                      src={item.media_url} 
+                      src={tileUrl(item)} 
                       alt="Screenshot" 
                       className="w-full rounded cursor-pointer hover:opacity-90 transition-opacity" 
-                      onClick={() => enlargeImage(item.media_url)}
+                      onClick={() => enlargeImage(derivativeUrl(item.content_key, DERIVATIVE_WIDTHS.lightbox))}
                     />
                     <div className="mt-2">
                       {renderEditableField('App', item.app_name, item, 'app_name')}
@@ -401,7 +444,7 @@ function GamesPage() {
                   className={`${mediaClass} rounded overflow-hidden shadow-sm relative group`}
                 >
                   <div className="p-4">
-                    <VideoPlayer src={item.media_url} />
+                    <VideoPlayer src={item.media_url} poster={item.thumbnail_url} hlsSrc={item.hls_url} />
                     <div className="mt-2">
                       {renderEditableField('App', item.app_name, item, 'app_name')}
                       <div className="text-xs text-gray-500 mt-1">{date}</div>
@@ -423,7 +466,7 @@ function GamesPage() {
                   className={`${mediaClass} rounded overflow-hidden shadow-sm relative group`}
                 >
                   <div className="p-4">
-                    <AudioPlayer src={item.media_url} />
+                    <AudioPlayer src={item.media_url} waveform={item.waveform_url} />
                     <div className="mt-2">
                       {renderEditableField('App', item.app_name, item, 'app_name')}
                       <div className="text-xs text-gray-500 mt-1">{date}</div>
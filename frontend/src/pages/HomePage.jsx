@@ -3,6 +3,7 @@ import { useNavigate } from 'react-router-dom';
 import { Plus, ChevronLeft } from 'lucide-react';
 import HeroImage from '../components/HeroImage';
 import Timeline from '../components/Timeline';
+import { fetchTimeline, withoutSession } from '../timeline.js';
 import { UserContext } from '../context/UserContext.jsx';
 
 function HomePage() {
@@ -17,6 +18,8 @@ function HomePage() {
     const [modalImage, setModalImage] = useState('');
     const [gameEvents, setGameEvents] = useState([]);
     const [loadingTimeline, setLoadingTimeline] = useState(true);
+    const [timelineCursor, setTimelineCursor] = useState(null);
+    const [loadingMoreTimeline, setLoadingMoreTimeline] = useState(false);
     const [showSessionModal, setShowSessionModal] = useState(false);
     const [appName, setAppName] = useState('');
     const [selectedFriends, setSelectedFriends] = useState(new Set());
@@ -27,6 +30,7 @@ function HomePage() {
     const [modalKey, setModalKey] = useState(0);
     const [notification, setNotification] = useState({ message: '', type: '', visible: false });
     const [deleteConfirmation, setDeleteConfirmation] = useState({ visible: false, event: null });
+    const [deleteSessionMedia, setDeleteSessionMedia] = useState(false);
     const navigate = useNavigate();
     const currentUsername = useContext(UserContext).username || 'User';
     const notificationTimeoutRef = useRef(null);
@@ -97,29 +101,10 @@ function HomePage() {
     const fetchGameSessions = async () => {
         try {
             setLoadingTimeline(true);
-            const response = await fetch('/api/sessions/list');
-            const sessions = await response.json();
-
-            // Format sessions for timeline display
-            const timeline = sessions.map((session, index) => {
-                const startDate = new Date(session.start_timestamp);
-                const userDisplay = session.user_with === '0' || !session.user_with ? 'myself' : session.user_with;
-                return {
-                    id: index,
-                    title: `Played ${session.app_name || 'Session'} with ${userDisplay}`,
-                    date: startDate.toLocaleDateString(),
-                    timestamp: startDate,
-                    app_name: session.app_name,
-                    user_with: session.user_with,
-                    status: session.status,
-                    start_timestamp: session.start_timestamp,
-                    end_timestamp: session.end_timestamp
-                };
-            })
-            // Sort by start_timestamp descending (newest first)
-            .sort((a, b) => b.timestamp - a.timestamp);
-
-            setGameEvents(timeline);
+            // Newest day buckets of sessions and captures; earlier ones load on demand
+            const { buckets, nextCursor } = await fetchTimeline();
+            setGameEvents(buckets);
+            setTimelineCursor(nextCursor);
         } catch (error) {
             console.error('Error fetching game sessions:', error);
         } finally {
@@ -127,6 +112,19 @@ function HomePage() {
         }
     };
 
+    const fetchEarlierActivity = async () => {
+        try {
+            setLoadingMoreTimeline(true);
+            const { buckets, nextCursor } = await fetchTimeline(timelineCursor);
+            setGameEvents(previous => [...previous, ...buckets]);
+            setTimelineCursor(nextCursor);
+        } catch (error) {
+            console.error('Error fetching earlier activity:', error);
+        } finally {
+            setLoadingMoreTimeline(false);
+        }
+    };
+
     const handleTimeframeClick = (timeframe) => {
         setSelectedTimeframe(timeframe);
     };
@@ -514,18 +512,25 @@ function HomePage() {
                             'Content-Type': 'application/json',
                         },
                         body: JSON.stringify({
-                            start_timestamp: deleteConfirmation.event.start_timestamp
+                            start_timestamp: deleteConfirmation.event.start_timestamp,
+                            delete_media: deleteSessionMedia
                         })
                     });
 
+                    const data = await response.json();
                     if (!response.ok) {
-                        const data = await response.json();
                         throw new Error(data.error || 'Failed to delete session');
                     }
 
-                    const updatedEvents = gameEvents.filter(e => e.start_timestamp !== deleteConfirmation.event.start_timestamp);
-                    setGameEvents(updatedEvents);
-                    showNotification('Session deleted', 'success');
+                    if (deleteSessionMedia) {
+                        // Bucket counts changed along with the session
+                        setDeleteSessionMedia(false);
+                        fetchGameSessions();
+                        showNotification(`Session and ${data.deleted} captures deleted`, data.failed > 0 ? 'error' : 'success');
+                    } else {
+                        setGameEvents(withoutSession(gameEvents, deleteConfirmation.event.start_timestamp));
+                        showNotification('Session deleted', 'success');
+                    }
                 } catch (error) {
                     console.error('Error deleting session:', error);
                     showNotification('Error: ' + error.message, 'error');
@@ -555,6 +560,7 @@ function HomePage() {
 
         const handleCancel = () => {
             setDeleteConfirmation({ visible: false, event: null });
+            setDeleteSessionMedia(false);
         };
 
         const isEndAction = deleteConfirmation.actionType === 'end';
@@ -578,6 +584,17 @@ function HomePage() {
 
                     <div className="px-6 py-6">
                         <p className="text-gray-700 mb-6">{message}</p>
+                        {!isEndAction && (
+                            <label className="flex items-center gap-2 text-sm text-gray-600 mb-6">
+                                <input
+                                    type="checkbox"
+                                    checked={deleteSessionMedia}
+                                    onChange={(e) => setDeleteSessionMedia(e.target.checked)}
+                                    className="accent-red-500"
+                                />
+                                Also delete the captures made during this session
+                            </label>
+                        )}
                         <div className="flex gap-3 justify-end">
                             <button
                                 onClick={handleCancel}
@@ -779,7 +796,13 @@ function HomePage() {
                         </div>
                     </div>
                 ) : (
-                    <Timeline events={gameEvents} onDeleteEvent={handleDeleteTimelineEvent} />
+                    <Timeline
+                        buckets={gameEvents}
+                        onDeleteEvent={handleDeleteTimelineEvent}
+                        hasMore={timelineCursor !== null}
+                        onLoadMore={fetchEarlierActivity}
+                        loadingMore={loadingMoreTimeline}
+                    />
                 )}
             </div>
         </div>
@@ -1,6 +1,7 @@
 import React, { useState, useEffect, useContext } from 'react';
 import { BarChart2 } from 'lucide-react';
 import Timeline from '../components/Timeline';
+import { fetchTimeline } from '../timeline.js';
 import { UserContext } from '../context/UserContext.jsx';
 
 function StatsPage() {
@@ -15,6 +16,8 @@ function StatsPage() {
     const [loadingStats, setLoadingStats] = useState(true);
     const [gameEvents, setGameEvents] = useState([]);
     const [loadingTimeline, setLoadingTimeline] = useState(true);
+    const [timelineCursor, setTimelineCursor] = useState(null);
+    const [loadingMoreTimeline, setLoadingMoreTimeline] = useState(false);
 
     useEffect(() => {
         if (currentUsername !== 'User') {
@@ -47,29 +50,10 @@ function StatsPage() {
     const fetchGameSessions = async () => {
         try {
             setLoadingTimeline(true);
-            const response = await fetch('/api/sessions/list');
-            const sessions = await response.json();
-
-            // Format sessions for timeline display
-            const timeline = sessions.map((session, index) => {
-                const startDate = new Date(session.start_timestamp);
-                const userDisplay = session.user_with === '0' || !session.user_with ? 'myself' : session.user_with;
-                return {
-                    id: index,
-                    title: `Played ${session.app_name || 'Session'} with ${userDisplay}`,
-                    date: startDate.toLocaleDateString(),
-                    timestamp: startDate,
-                    app_name: session.app_name,
-                    user_with: session.user_with,
-                    status: session.status,
-                    start_timestamp: session.start_timestamp,
-                    end_timestamp: session.end_timestamp
-                };
-            })
-            // Sort by start_timestamp descending (newest first)
-            .sort((a, b) => b.timestamp - a.timestamp);
-
-            setGameEvents(timeline);
+            // Newest day buckets of sessions and captures; earlier ones load on demand
+            const { buckets, nextCursor } = await fetchTimeline();
+            setGameEvents(buckets);
+            setTimelineCursor(nextCursor);
         } catch (error) {
             console.error('Error fetching game sessions:', error);
         } finally {
@@ -77,6 +61,19 @@ function StatsPage() {
         }
     };
 
+    const fetchEarlierActivity = async () => {
+        try {
+            setLoadingMoreTimeline(true);
+            const { buckets, nextCursor } = await fetchTimeline(timelineCursor);
+            setGameEvents(previous => [...previous, ...buckets]);
+            setTimelineCursor(nextCursor);
+        } catch (error) {
+            console.error('Error fetching earlier activity:', error);
+        } finally {
+            setLoadingMoreTimeline(false);
+        }
+    };
+
     const renderStatsSummary = () => {
         if (loadingStats) {
             return (
@@ -133,7 +130,12 @@ function StatsPage() {
                         </div>
                     </div>
                 ) : (
-                    <Timeline events={gameEvents} />
+                    <Timeline
+                        buckets={gameEvents}
+                        hasMore={timelineCursor !== null}
+                        onLoadMore={fetchEarlierActivity}
+                        loadingMore={loadingMoreTimeline}
+                    />
                 )}
             </div>
         </div>
@@ -0,0 +1,59 @@
+/**
+ * Pages of the server-side timeline. Buckets only carry counts, a thumbnail
+ * and their sessions; the captures of a bucket are fetched when it is opened.
+ */
+
+export const TIMELINE_PAGE_SIZE = 30;
+
+function formatSession(session) {
+    const startDate = new Date(session.start_timestamp);
+    const userDisplay = session.user_with === '0' || !session.user_with ? 'myself' : session.user_with;
+    return {
+        id: session.start_timestamp,
+        title: `Played ${session.app_name || 'Session'} with ${userDisplay}`,
+        date: startDate.toLocaleDateString(),
+        timestamp: startDate,
+        app_name: session.app_name,
+        user_with: session.user_with,
+        status: session.status,
+        start_timestamp: session.start_timestamp,
+        end_timestamp: session.end_timestamp
+    };
+}
+
+export async function fetchTimeline(cursor = null, granularity = 'day') {
+    const params = new URLSearchParams({ granularity, limit: String(TIMELINE_PAGE_SIZE) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`/api/timeline?${params}`);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Server error: ${response.status}`);
+    }
+    return {
+        buckets: data.buckets.map(bucket => ({
+            ...bucket,
+            // Newest session first, as the list used to show them
+            events: bucket.sessions.map(formatSession).sort((a, b) => b.timestamp - a.timestamp)
+        })),
+        nextCursor: data.next_cursor
+    };
+}
+
+export async function fetchBucketItems(bucket, offset = 0) {
+    const params = new URLSearchParams({ bucket, offset: String(offset), limit: '60' });
+    const response = await fetch(`/api/timeline/bucket?${params}`);
+    const data = await response.json();
+    if (!response.ok) {
+        throw new Error(data.error || `Server error: ${response.status}`);
+    }
+    return data;
+}
+
+export function withoutSession(buckets, startTimestamp) {
+    return buckets
+        .map(bucket => ({
+            ...bucket,
+            events: bucket.events.filter(e => e.start_timestamp !== startTimestamp)
+        }))
+        .filter(bucket => bucket.count > 0 || bucket.events.length > 0);
+}